@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from globals import ANALYSIS_EXECUTOR, ANALYSIS_WORKERS
+from profiler import loop_profiler
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EXECUTOR_MODES = ("inline", "thread", "process")
+
+def _init_process_worker():
+    """Заранее импортирует тяжелые модули (pandas, TA-Lib, модель) в процессе-воркере.
+    
+    Только синхронная часть анализа: без БД, Telegram и состояния анализатора.
+    """
+    import signal_candidates  # noqa: F401
+
+class AnalysisExecutor:
+    """Выполняет синхронную часть анализа вне event loop.
+
+    Режимы: "inline" — в самом event loop (как раньше), "thread" — пул потоков,
+    "process" — пул процессов для масштабирования по ядрам.
+    """
+
+    def __init__(self, mode: str = ANALYSIS_EXECUTOR, workers: int = ANALYSIS_WORKERS):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Неизвестный режим исполнителя: {mode}")
+        self.mode = mode
+        self.workers = workers
+        self._pool: Executor | None = None
+
+    def _get_pool(self) -> Executor | None:
+        if self.mode == "inline":
+            return None
+        if self._pool is None:
+            if self.mode == "thread":
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="analysis")
+            else:
+                # spawn безопаснее fork для процесса с event loop и потоками
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_process_worker
+                )
+            logger.info(f"Исполнитель анализа запущен: {self.mode}, воркеров: {self.workers}")
+        return self._pool
+
+    async def run(self, func, *args, **kwargs):
+        """Выполняет func(*args) в исполнителе и возвращает результат в event loop."""
+        pool = self._get_pool()
+        if pool is None:
+            return func(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        if self.mode == "thread":
+            # Во время сеанса cprofile задача профилируется в потоке-воркере
+            func = loop_profiler.wrap(func)
+        return await loop.run_in_executor(pool, partial(func, *args, **kwargs))
+
+    def shutdown(self):
+        """Останавливает пул; при следующем вызове run он будет создан заново."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            logger.info("Исполнитель анализа остановлен")
+
+# Глобальный исполнитель анализа
+analysis_executor = AnalysisExecutor()
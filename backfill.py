@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import time
+import aiohttp
+from globals import (
+    PAIRS, TIME_FRAMES, TIMEFRAME_MS, BINANCE_REST_BASE_URL, BACKFILL_CANDLES,
+    BACKFILL_CONCURRENCY, BACKFILL_WEIGHT_LIMIT, BACKFILL_WEIGHT_RESERVE, BACKFILL_PAGE_LIMIT
+)
+from database import save_historical_rows, load_latest_timestamps, db_writer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+KLINES_PATH = "/api/v3/klines"
+
+def kline_weight(limit: int) -> int:
+    """Вес запроса /api/v3/klines по правилам Binance."""
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+class WeightLimiter:
+    """Учитывает минутный вес запросов и паузы после 429/418.
+
+    Вес резервируется перед запросом и уточняется по заголовку
+    X-MBX-USED-WEIGHT-1M; при исчерпании бюджета запросы ждут следующей минуты.
+    """
+
+    def __init__(self, weight_limit: int = BACKFILL_WEIGHT_LIMIT, reserve: float = BACKFILL_WEIGHT_RESERVE):
+        self.budget = int(weight_limit * (1 - reserve))
+        self.used_weight = 0
+        self._minute = int(time.time() // 60)
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+        self.waits = 0
+
+    def _roll_minute(self):
+        minute = int(time.time() // 60)
+        if minute != self._minute:
+            self._minute = minute
+            self.used_weight = 0
+
+    async def acquire(self, weight: int):
+        """Ждет, пока запрос с весом weight уложится в бюджет, и резервирует его."""
+        async with self._lock:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    self.waits += 1
+                    await asyncio.sleep(pause)
+                    continue
+                self._roll_minute()
+                if self.used_weight + weight <= self.budget:
+                    self.used_weight += weight
+                    return
+                self.waits += 1
+                await asyncio.sleep(60 - time.time() % 60 + 0.05)
+
+    def update(self, headers):
+        """Уточняет использованный вес по заголовкам ответа."""
+        value = headers.get("X-MBX-USED-WEIGHT-1M")
+        if value is None:
+            return
+        self._roll_minute()
+        self.used_weight = max(self.used_weight, int(value))
+
+    def pause(self, seconds: float):
+        """Приостанавливает все запросы (Retry-After после 429/418) и считает бюджет минуты исчерпанным."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._roll_minute()
+        self.used_weight = max(self.used_weight, self.budget)
+
+class KlineBackfiller:
+    """Догрузка исторических свечей из REST API для многих ключей одновременно.
+
+    Все запросы идут через одну сессию с пулом соединений; число одновременных
+    запросов ограничено семафором, а минутный вес — WeightLimiter. Каждая
+    страница сразу пишется в БД одним пакетом.
+    """
+
+    def __init__(self, base_url: str = BINANCE_REST_BASE_URL, concurrency: int = BACKFILL_CONCURRENCY,
+                 weight_limit: int = BACKFILL_WEIGHT_LIMIT, page_limit: int = BACKFILL_PAGE_LIMIT,
+                 max_retries: int = 5):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.page_limit = page_limit
+        self.max_retries = max_retries
+        self.limiter = WeightLimiter(weight_limit)
+        self._semaphore = None
+        self.requests = 0
+        self.candles = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failed_keys = 0
+        self.last_duration = 0.0
+
+    async def fetch_page(self, session: aiohttp.ClientSession, pair: str, timeframe: str,
+                         start_ms: int, end_ms: int) -> list:
+        """Одна страница свечей [start_ms, end_ms] с повторами при 429/418/5xx."""
+        params = {"symbol": pair, "interval": timeframe, "startTime": start_ms,
+                  "endTime": end_ms, "limit": self.page_limit}
+        weight = kline_weight(self.page_limit)
+        attempt = 0
+        while True:
+            await self.limiter.acquire(weight)
+            try:
+                async with self._semaphore:
+                    self.requests += 1
+                    async with session.get(self.base_url + KLINES_PATH, params=params) as response:
+                        self.limiter.update(response.headers)
+                        if response.status in (429, 418):
+                            # Ограничение по весу — не ошибка: ждем Retry-After и повторяем
+                            self.rate_limited += 1
+                            retry_after = float(response.headers.get("Retry-After", 60))
+                            self.limiter.pause(retry_after)
+                            logger.warning(f"Лимит запросов ({response.status}), пауза {retry_after:.0f} с")
+                            continue
+                        if response.status < 500:
+                            response.raise_for_status()
+                            return await response.json()
+                        logger.warning(f"Ошибка сервера {response.status} для {pair}-{timeframe}")
+            except aiohttp.ClientResponseError:
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Ошибка запроса свечей {pair}-{timeframe}: {e}")
+            if attempt >= self.max_retries:
+                raise RuntimeError(f"Не удалось загрузить свечи {pair}-{timeframe} после {attempt} повторов")
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(min(2 ** attempt * 0.25, 30))
+
+    async def fetch_range(self, session: aiohttp.ClientSession, pair: str, timeframe: str,
+                          start_ms: int, end_ms: int) -> list:
+        """Свечи с временем открытия в [start_ms, end_ms], постранично; каждая страница сохраняется в БД.
+
+        Возвращает строки (pair, timeframe, timestamp_s, open, high, low, close, volume).
+        """
+        interval = TIMEFRAME_MS[timeframe]
+        rows = []
+        cursor = start_ms
+        while cursor <= end_ms:
+            klines = await self.fetch_page(session, pair, timeframe, cursor, end_ms)
+            if not klines:
+                break
+            page = [(pair, timeframe, int(k[0]) // 1000, float(k[1]), float(k[2]),
+                     float(k[3]), float(k[4]), float(k[5])) for k in klines if int(k[0]) <= end_ms]
+            save_historical_rows(page)
+            rows.extend(page)
+            self.candles += len(page)
+            cursor = int(klines[-1][0]) + interval
+            if len(klines) < self.page_limit:
+                break
+        return rows
+
+    async def backfill(self, ranges: list) -> dict:
+        """Догружает диапазоны [(pair, timeframe, start_ms, end_ms), ...] параллельно.
+
+        Возвращает {"PAIR_tf": строки}; ключи с ошибкой пропускаются.
+        """
+        if not ranges:
+            return {}
+        start = time.perf_counter()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=30)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            results = await asyncio.gather(
+                *(self.fetch_range(session, pair, tf, start_ms, end_ms) for pair, tf, start_ms, end_ms in ranges),
+                return_exceptions=True
+            )
+        loaded = {}
+        for (pair, tf, _, _), result in zip(ranges, results):
+            if isinstance(result, BaseException):
+                self.failed_keys += 1
+                logger.error(f"Догрузка {pair}-{tf} не удалась: {result}")
+            else:
+                loaded[f"{pair}_{tf}"] = result
+        self.last_duration = time.perf_counter() - start
+        return loaded
+
+    def get_stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "candles": self.candles,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "failed_keys": self.failed_keys,
+            "used_weight": self.limiter.used_weight,
+            "limiter_waits": self.limiter.waits,
+            "last_duration_sec": self.last_duration
+        }
+
+# Глобальный загрузчик истории
+kline_backfiller = KlineBackfiller()
+
+def plan_backfill(pairs: list, timeframes: list, candles: int = BACKFILL_CANDLES,
+                  now_ms: int | None = None) -> list:
+    """Диапазоны закрытых свечей, которых не хватает в БД до глубины candles на ключ."""
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    latest = load_latest_timestamps(pairs, timeframes)
+    ranges = []
+    for pair in pairs:
+        for tf in timeframes:
+            interval = TIMEFRAME_MS[tf]
+            current_open = now_ms - now_ms % interval  # Текущая незакрытая свеча
+            start_ms = current_open - candles * interval
+            last = latest.get(f"{pair}_{tf}")
+            if last is not None:
+                start_ms = max(start_ms, last + interval)
+            if start_ms < current_open:
+                ranges.append((pair, tf, start_ms, current_open - 1))
+    return ranges
+
+async def backfill_missing_history(pairs: list = PAIRS, timeframes: list = TIME_FRAMES,
+                                   candles: int = BACKFILL_CANDLES) -> dict:
+    """Догружает недостающую историю для всех ключей и дожидается записи в БД."""
+    ranges = plan_backfill(pairs, timeframes, candles)
+    if not ranges:
+        logger.info("Догрузка истории не требуется")
+        return {}
+    loaded = await kline_backfiller.backfill(ranges)
+    await asyncio.to_thread(db_writer.flush)
+    logger.info(f"Догружено {sum(len(rows) for rows in loaded.values())} свечей для "
+                f"{len(loaded)}/{len(ranges)} ключей за {kline_backfiller.last_duration:.2f} с")
+    return loaded
@@ -0,0 +1,270 @@
+"""Воспроизведение истории historical_data через логику анализатора сигналов.
+
+Свечи всех пар/таймфреймов подаются в потоковые движки индикаторов в порядке
+времени закрытия, как в живом режиме. Время — симулированное (время закрытия
+свечи): кулдаун и дневной лимит считаются по нему, Telegram и БД сигналов не
+используются. Уровни 1–3 — BinaryOptionsSignalAnalyzer.passes_filters,
+уровень 4 — один батч-вызов модели на момент времени. Итог каждого сигнала
+определяется по цене закрытия на момент экспирации.
+
+Запуск:
+    python backtest.py --days 30
+    python backtest.py --pairs BTCUSDT ETHUSDT --timeframes 1m 5m --start 2024-01-01 --end 2024-02-01
+"""
+import argparse
+import json
+import logging
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from globals import (
+    PAIRS, TIME_FRAMES, TIMEFRAME_MS, RISK_MANAGEMENT, BINARY_OPTION_PAYOUT,
+    INDICATOR_WARMUP_CANDLES
+)
+from database import load_historical_range
+from streaming_indicators import StreamingIndicatorEngine
+from signal_analyzer import signal_analyzer
+from signal_candidates import score_candidates
+from signal_resolver import expiry_target_ms, signal_outcome
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DAY_MS = 86_400_000
+
+class SimulatedClock:
+    """Время бэктеста: момент закрытия последней обработанной свечи (мс)."""
+
+    def __init__(self):
+        self.now_ms = 0
+
+    def advance(self, now_ms: int):
+        self.now_ms = now_ms
+
+    def now(self) -> float:
+        """Секунды, как datetime.now().timestamp() в живом режиме."""
+        return self.now_ms / 1000
+
+class Backtester:
+    """Прогон сохраненной истории через индикаторы и фильтры QuantumBinaryPrecisionV3.
+
+    data — {"PAIR_tf": (timestamps_ms, ohlcv)}, как у load_historical_data_bulk.
+    Сигналы формируются только по свечам, открытым не раньше start_ms;
+    более ранние свечи лишь прогревают движки.
+    """
+
+    def __init__(self, data: dict, start_ms: int | None = None, apply_limits: bool = True,
+                 payout: float = BINARY_OPTION_PAYOUT):
+        self.data = {key: value for key, value in data.items() if len(value[0])}
+        self.start_ms = start_ms
+        self.apply_limits = apply_limits
+        self.payout = payout
+        self.clock = SimulatedClock()
+        self.engines = {key: StreamingIndicatorEngine() for key in self.data}
+        self.signals = []
+        self.candles = 0
+        self.candidates = 0
+        self.elapsed = 0.0
+        self._last_signal_time = {}
+        self._daily_count = Counter()
+
+    def _events(self) -> tuple:
+        """Все свечи, упорядоченные по времени закрытия: (keys, close_ms, key_index, row_index)."""
+        keys = list(self.data)
+        close_ms, key_index, row_index = [], [], []
+        for i, key in enumerate(keys):
+            timestamps = self.data[key][0]
+            close_ms.append(timestamps + TIMEFRAME_MS[key.split("_", 1)[1]])
+            key_index.append(np.full(len(timestamps), i))
+            row_index.append(np.arange(len(timestamps)))
+        close_ms = np.concatenate(close_ms)
+        key_index = np.concatenate(key_index)
+        row_index = np.concatenate(row_index)
+        order = np.lexsort((key_index, close_ms))
+        return keys, close_ms[order], key_index[order], row_index[order]
+
+    def _can_signal(self, key: str, now_ms: int) -> bool:
+        """Кулдаун и дневной лимит по симулированному времени."""
+        if not self.apply_limits:
+            return True
+        if self._daily_count[now_ms // DAY_MS] >= RISK_MANAGEMENT['max_daily_signals']:
+            return False
+        last = self._last_signal_time.get(key)
+        return last is None or (now_ms - last) / 1000 >= RISK_MANAGEMENT['min_time_between_signals']
+
+    def run(self) -> list:
+        """Прогоняет всю историю; возвращает список сигналов с итогами."""
+        if not self.data:
+            return []
+        started = time.perf_counter()
+        keys, close_ms, key_index, row_index = self._events()
+        # Списки Python вместо поэлементного доступа к numpy в горячем цикле
+        timestamps = {i: self.data[key][0].tolist() for i, key in enumerate(keys)}
+        ohlcv = {i: self.data[key][1].tolist() for i, key in enumerate(keys)}
+        engines = [self.engines[key] for key in keys]
+        start_ms = self.start_ms if self.start_ms is not None else -1
+
+        pending = []  # Кандидаты текущего момента времени
+        current = None
+        for now_ms, k, r in zip(close_ms.tolist(), key_index.tolist(), row_index.tolist()):
+            if now_ms != current:
+                self._score(pending)
+                pending = []
+                current = now_ms
+                self.clock.advance(now_ms)
+            timestamp = timestamps[k][r]
+            engine = engines[k]
+            row = engine.update_values(timestamp, *ohlcv[k][r])
+            self.candles += 1
+            if row is None or timestamp < start_ms or len(engine.rows) < 5:
+                continue
+            if self._can_signal(keys[k], now_ms) and signal_analyzer.passes_filters(row):
+                pending.append((keys[k], timestamp, row))
+        self._score(pending)
+        self.elapsed = time.perf_counter() - started
+        self._resolve()
+        return self.signals
+
+    def _score(self, pending: list):
+        """Уровень 4 для кандидатов одного момента времени и регистрация сигналов."""
+        if not pending:
+            return
+        self.candidates += len(pending)
+        rows = [pd.Series(row, name=pd.Timestamp(timestamp, unit='ms')) for _, timestamp, row in pending]
+        features = np.vstack([signal_analyzer.extract_features(row) for row in rows])
+        probabilities = score_candidates(features)
+        now_ms = self.clock.now_ms
+        for (key, _, _), latest, probability_up in zip(pending, rows, probabilities):
+            if not self._can_signal(key, now_ms):
+                continue
+            signal = signal_analyzer.build_signal(latest, float(probability_up))
+            if not signal:
+                continue
+            pair, timeframe = key.split("_", 1)
+            self._last_signal_time[key] = now_ms
+            self._daily_count[now_ms // DAY_MS] += 1
+            self.signals.append({
+                "pair": pair,
+                "timeframe": timeframe,
+                "signal_type": signal['signal_type'],
+                "entry_time": int(signal['entry_time']),
+                "signal_time": now_ms,
+                "entry_price": float(signal['entry_price']),
+                "expiry_time": signal['expiry_time'],
+                "probability": float(signal['probability']),
+                "accuracy": float(signal['accuracy'])
+            })
+
+    def _price_series(self) -> dict:
+        """Для каждой пары — время закрытия и цены самого мелкого загруженного таймфрейма."""
+        series = {}
+        for key, (timestamps, ohlcv) in self.data.items():
+            pair, timeframe = key.split("_", 1)
+            if pair not in series or TIMEFRAME_MS[timeframe] < series[pair][0]:
+                series[pair] = (TIMEFRAME_MS[timeframe], timestamps + TIMEFRAME_MS[timeframe], ohlcv[:, 3])
+        return series
+
+    def _resolve(self):
+        """Итог сигнала: цена закрытия в момент signal_time + экспирация.
+
+        Если такой момент не совпадает с закрытием свечи загруженной истории
+        (нет мелкого таймфрейма или история закончилась), результат — None.
+        """
+        series = self._price_series()
+        for signal in self.signals:
+            signal["exit_price"] = signal["result"] = signal["profit_loss"] = None
+            _, close_times, closes = series[signal["pair"]]
+            target = expiry_target_ms(signal["timeframe"], signal["entry_time"], signal["expiry_time"])
+            index = int(np.searchsorted(close_times, target))
+            if index >= len(close_times) or close_times[index] != target:
+                continue
+            signal["exit_price"] = float(closes[index])
+            signal["result"], signal["profit_loss"] = signal_outcome(
+                signal["signal_type"], signal["entry_price"], signal["exit_price"], self.payout)
+
+    def get_report(self) -> dict:
+        """Сводка прогона: скорость, число сигналов и итоги по экспирациям и ключам."""
+        def summary(signals: list) -> dict:
+            wins = sum(1 for s in signals if s["result"] == "WIN")
+            losses = sum(1 for s in signals if s["result"] == "LOSS")
+            return {
+                "signals": len(signals),
+                "wins": wins,
+                "losses": losses,
+                "unresolved": len(signals) - wins - losses,
+                "win_rate": wins / (wins + losses) if wins + losses else 0.0,
+                "profit": sum(s["profit_loss"] or 0.0 for s in signals)
+            }
+
+        by_expiry = defaultdict(list)
+        by_key = defaultdict(list)
+        for signal in self.signals:
+            by_expiry[signal["expiry_time"]].append(signal)
+            by_key[f"{signal['pair']}_{signal['timeframe']}"].append(signal)
+        return {
+            "keys": len(self.data),
+            "candles": self.candles,
+            "seconds": self.elapsed,
+            "candles_per_second": self.candles / self.elapsed if self.elapsed else 0.0,
+            "candidates": self.candidates,
+            **summary(self.signals),
+            "by_expiry": {expiry: summary(signals) for expiry, signals in sorted(by_expiry.items())},
+            "by_key": {key: summary(signals) for key, signals in sorted(by_key.items())}
+        }
+
+def load_backtest_data(pairs: list, timeframes: list, start_ms: int | None, end_ms: int | None,
+                       warmup: int = INDICATOR_WARMUP_CANDLES) -> dict:
+    """История ключей за окно плюс warmup свечей до его начала для прогрева движков."""
+    data = {}
+    for pair in pairs:
+        for timeframe in timeframes:
+            load_from = None if start_ms is None else start_ms - warmup * TIMEFRAME_MS[timeframe]
+            data[f"{pair}_{timeframe}"] = load_historical_range(pair, timeframe, load_from, end_ms)
+    return data
+
+def _parse_date(value: str) -> int:
+    return int(datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+def print_report(report: dict):
+    print(f"Ключей: {report['keys']}, свечей: {report['candles']} за {report['seconds']:.2f} с "
+          f"({report['candles_per_second']:,.0f} свечей/с), кандидатов уровня 4: {report['candidates']}")
+    print(f"{'':>12} {'signals':>8} {'wins':>6} {'losses':>7} {'unres.':>7} {'win rate':>9} {'profit':>9}")
+    rows = [("всего", report)] + list(report["by_expiry"].items()) + list(report["by_key"].items())
+    for name, total in rows:
+        print(f"{name:>12} {total['signals']:>8} {total['wins']:>6} {total['losses']:>7} "
+              f"{total['unresolved']:>7} {total['win_rate']:>9.1%} {total['profit']:>9.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pairs', nargs='+', default=PAIRS)
+    parser.add_argument('--timeframes', nargs='+', default=TIME_FRAMES)
+    parser.add_argument('--start', help='начало окна сигналов, YYYY-MM-DD[THH:MM] UTC')
+    parser.add_argument('--end', help='конец окна, YYYY-MM-DD[THH:MM] UTC')
+    parser.add_argument('--days', type=float, help='окно за последние N дней (вместо --start)')
+    parser.add_argument('--warmup', type=int, default=INDICATOR_WARMUP_CANDLES,
+                        help='свечей до начала окна для прогрева индикаторов')
+    parser.add_argument('--no-limits', action='store_true', help='без кулдауна и дневного лимита')
+    parser.add_argument('--payout', type=float, default=BINARY_OPTION_PAYOUT)
+    parser.add_argument('--signals-out', help='сохранить сигналы с итогами в JSON')
+    args = parser.parse_args()
+
+    # Сообщения о каждом сигнале в бэктесте только мешают
+    logging.getLogger('signal_analyzer').setLevel(logging.WARNING)
+
+    end_ms = _parse_date(args.end) if args.end else None
+    start_ms = _parse_date(args.start) if args.start else None
+    if args.days is not None:
+        start_ms = (end_ms or int(time.time() * 1000)) - int(args.days * DAY_MS)
+
+    data = load_backtest_data(args.pairs, args.timeframes, start_ms, end_ms, args.warmup)
+    backtester = Backtester(data, start_ms, apply_limits=not args.no_limits, payout=args.payout)
+    signals = backtester.run()
+    print_report(backtester.get_report())
+    if args.signals_out:
+        with open(args.signals_out, "w") as f:
+            json.dump(signals, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Бенчмарк разбора сообщений kline: исходный json.loads против KlineDecoder.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_kline_decoder --messages 200000 --closed-ratio 0.02
+"""
+import argparse
+import json
+import random
+import time
+from kline_decoder import DECODER_BACKENDS, KlineDecoder
+
+def make_message(symbol: str, interval: str, open_time: int, closed: bool, rng: random.Random) -> str:
+    """Сообщение combined stream в формате Binance (без пробелов, как на бирже)."""
+    price = 100 + rng.random()
+    kline = {
+        "t": open_time, "T": open_time + 59_999, "s": symbol, "i": interval, "f": 100, "L": 200,
+        "o": f"{price:.8f}", "c": f"{price * 1.001:.8f}", "h": f"{price * 1.002:.8f}",
+        "l": f"{price * 0.999:.8f}", "v": f"{rng.random() * 1000:.8f}", "n": 100, "x": closed,
+        "q": f"{rng.random() * 1e5:.8f}", "V": "500.0", "Q": "0.500", "B": "0"
+    }
+    event = {"e": "kline", "E": open_time + 1000, "s": symbol, "k": kline}
+    return json.dumps({"stream": f"{symbol.lower()}@kline_{interval}", "data": event}, separators=(",", ":"))
+
+def make_messages(count: int, closed_ratio: float, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    symbols = ["BTCUSDT", "ETHUSDT", "BNBUSDT", "XRPUSDT", "SOLUSDT", "ADAUSDT", "DOGEUSDT"]
+    return [make_message(rng.choice(symbols), "1m", 1_700_000_000_000 + i * 60_000,
+                         rng.random() < closed_ratio, rng) for i in range(count)]
+
+def decode_legacy(message: str):
+    """Исходный путь: полный json.loads и словарь свечи для закрытых klines."""
+    data = json.loads(message)
+    if 'data' in data and 'k' in data['data']:
+        kline = data['data']['k']
+        if kline['x']:
+            return {
+                "timestamp": kline['t'],
+                "open": float(kline['o']),
+                "high": float(kline['h']),
+                "low": float(kline['l']),
+                "close": float(kline['c']),
+                "volume": float(kline['v'])
+            }
+    return None
+
+def measure(decode, messages: list, repeat: int) -> tuple:
+    """Лучшая скорость (сообщений в секунду) и число закрытых свечей."""
+    best = float('inf')
+    closed = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        closed = sum(1 for message in messages if decode(message) is not None)
+        best = min(best, time.perf_counter() - start)
+    return len(messages) / best, closed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=200_000)
+    parser.add_argument('--closed-ratio', type=float, default=1 / 60,
+                        help='доля закрытых свечей (у 1m около 1/60 обновлений)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages, args.closed_ratio)
+    baseline, expected = measure(decode_legacy, messages, args.repeat)
+    print(f"{'decoder':>16} {'msg/s':>12} {'speedup':>9} {'closed':>8}")
+    print(f"{'legacy json':>16} {baseline:>12,.0f} {1.0:>8.1f}x {expected:>8}")
+    for backend in DECODER_BACKENDS[1:]:
+        try:
+            decoder = KlineDecoder(backend)
+        except ValueError:
+            print(f"{backend:>16} {'не установлен':>12}")
+            continue
+        rate, closed = measure(decoder.decode, messages, args.repeat)
+        print(f"{backend:>16} {rate:>12,.0f} {rate / baseline:>8.1f}x {closed:>8}"
+              f"{'' if closed == expected else '  MISMATCH'}")
+        # Закрытые свечи без отбраковки — стоимость полного разбора
+        only_closed = [m for m in messages if '"x":true' in m] or messages[:1]
+        rate, _ = measure(decoder.decode, only_closed, args.repeat)
+        print(f"{backend + ' closed':>16} {rate:>12,.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""Воспроизводимый бенчмарк конвейера анализа на синтетических OHLCV.
+
+Для каждого размера вселенной (пар × TIME_FRAMES) и глубины истории
+замеряет get_latest_data, каждую indicators.calculate_*,
+calculate_all_indicators, quantum_binary_signal, predict_proba (одна строка
+и батч на всю вселенную), save_historical_data и load_historical_data.
+Данные детерминированы (--seed): случайное блуждание со всплесками объема,
+отдельный поток генератора на ключ. Поключевые функции замеряются на
+выборке из --max-keys ключей (одной и той же при равных параметрах);
+projected_total_s — оценка стоимости на всю вселенную (среднее × ключей).
+БД — временный файл, рабочая база не затрагивается.
+
+Результат пишется в JSON (--output) и сравнивается с прошлым прогоном
+(--baseline) или два файла сравниваются без прогона (--compare A B);
+код выхода 1, если медиана вызова выросла больше чем на --tolerance.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_pipeline --output base.json
+    python -m benchmarks.bench_pipeline --universes 7 100 --depths 30 200 --baseline base.json
+    python -m benchmarks.bench_pipeline --compare base.json new.json
+"""
+import argparse
+import gc
+import inspect
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import database
+import indicators
+import websocket as websocket_module
+from candle_buffer import CandleRingBuffer
+from globals import PAIRS, TIME_FRAMES, TIMEFRAME_MS, CANDLE_COUNT, INDICATOR_WARMUP_CANDLES
+from model import ai_model
+from signal_analyzer import signal_analyzer
+
+UNIVERSES = [7, 100, 1000]
+DEPTHS = [CANDLE_COUNT, INDICATOR_WARMUP_CANDLES, 1000]
+BASE_TIME_MS = 1_700_000_000_000 // 3_600_000 * 3_600_000  # Выровнено по всем таймфреймам
+
+# Индикаторы с общей сигнатурой calculate_*(df), кроме сводной calculate_all_indicators
+INDICATOR_FUNCTIONS = sorted(
+    (name, func) for name, func in inspect.getmembers(indicators, inspect.isfunction)
+    if name.startswith("calculate_") and name != "calculate_all_indicators"
+    and func.__module__ == indicators.__name__
+)
+
+def universe_pairs(count: int) -> list:
+    """Реальные пары конфигурации, дополненные синтетическими символами."""
+    return PAIRS[:count] + [f"SYN{i:04d}USDT" for i in range(max(0, count - len(PAIRS)))]
+
+def synthetic_ohlcv(depth: int, timeframe: str, seed: tuple) -> tuple:
+    """(timestamps_ms int64[n], ohlcv float64[n, 5]) — как у load_historical_data_bulk."""
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0, 0.002, depth)
+    spikes = rng.random(depth) < 0.03
+    returns[spikes] += rng.choice([-0.01, 0.01], spikes.sum())
+    close = rng.uniform(1, 1000) * np.exp(np.cumsum(returns))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    spread = np.abs(close - open_) + close * 0.0005
+    volume = rng.uniform(50, 150, depth) * np.where(spikes, 20, 1)
+    step = TIMEFRAME_MS[timeframe]
+    timestamps = BASE_TIME_MS - step * np.arange(depth, 0, -1, dtype=np.int64)
+    ohlcv = np.column_stack([open_, np.maximum(open_, close) + spread / 2,
+                             np.minimum(open_, close) - spread / 2, close, volume])
+    return timestamps, ohlcv
+
+def sample_keys(pairs: list, max_keys: int, seed: int) -> list:
+    """Детерминированная выборка ключей (pair, timeframe) для поключевых замеров."""
+    keys = [(pair, timeframe) for pair in pairs for timeframe in TIME_FRAMES]
+    if len(keys) <= max_keys:
+        return keys
+    chosen = np.random.default_rng(seed).choice(len(keys), max_keys, replace=False)
+    return [keys[i] for i in sorted(chosen)]
+
+def time_calls(func, args_list: list, repeat: int) -> np.ndarray:
+    """Длительность каждого вызова (секунды) по всем повторам, после прогревочного вызова."""
+    durations = []
+    func(*args_list[0])  # Компиляция numba, кэши pandas и SQLite
+    gc.collect()
+    for _ in range(repeat):
+        for args in args_list:
+            start = time.perf_counter()
+            func(*args)
+            durations.append(time.perf_counter() - start)
+    return np.array(durations)
+
+def summarize(name: str, pairs: int, depth: int, durations: np.ndarray, calls_per_pass: int,
+              keys: int, projected_calls: int) -> dict:
+    mean = float(durations.mean())
+    return {
+        "benchmark": name,
+        "pairs": pairs,
+        "timeframes": len(TIME_FRAMES),
+        "keys": keys,
+        "depth": depth,
+        "sampled_calls": calls_per_pass,
+        "median_us": float(np.median(durations)) * 1e6,
+        "p95_us": float(np.percentile(durations, 95)) * 1e6,
+        "mean_us": mean * 1e6,
+        "projected_total_s": mean * projected_calls
+    }
+
+def run_case(pairs_count: int, depth: int, max_keys: int, repeat: int, seed: int, db_dir: str) -> list:
+    """Все замеры для одного размера вселенной и глубины истории."""
+    pairs = universe_pairs(pairs_count)
+    keys = sample_keys(pairs, max_keys, seed)
+    total_keys = len(pairs) * len(TIME_FRAMES)
+    history = {}
+    for pair, timeframe in keys:
+        seed_key = (seed, pairs.index(pair), TIME_FRAMES.index(timeframe))
+        history[(pair, timeframe)] = synthetic_ohlcv(depth, timeframe, seed_key)
+
+    def per_key(name: str, func, args_list: list) -> dict:
+        durations = time_calls(func, args_list, repeat)
+        return summarize(name, pairs_count, depth, durations, len(args_list), total_keys, total_keys)
+
+    results = []
+
+    # Снимок буфера в DataFrame — вход анализа
+    buffers = websocket_module.live_data_buffers
+    saved_buffers = dict(buffers)
+    buffers.clear()
+    for (pair, timeframe), (timestamps, ohlcv) in history.items():
+        buffers[f"{pair}_{timeframe}"] = buffer = CandleRingBuffer(depth)
+        buffer.load(timestamps, ohlcv)
+    try:
+        results.append(per_key("get_latest_data", websocket_module.get_latest_data, list(history)))
+        frames = [websocket_module.get_latest_data(pair, timeframe) for pair, timeframe in history]
+    finally:
+        buffers.clear()
+        buffers.update(saved_buffers)
+
+    for name, func in INDICATOR_FUNCTIONS:
+        results.append(per_key(f"indicators.{name}", func, [(frame,) for frame in frames]))
+    results.append(per_key("calculate_all_indicators", indicators.calculate_all_indicators,
+                           [(frame,) for frame in frames]))
+
+    enriched = [indicators.calculate_all_indicators(frame) for frame in frames]
+    signal_analyzer.daily_signal_count = 0
+    results.append(per_key("quantum_binary_signal", signal_analyzer.quantum_binary_signal,
+                           [(frame,) for frame in enriched]))
+
+    # calculate_all_indicators отбрасывает строки с NaN: на короткой истории признаков нет,
+    # и predict_proba замеряется на строках более глубокой истории
+    rows = [frame.iloc[-1] for frame in enriched if len(frame)]
+    if not rows:
+        timestamps, ohlcv = synthetic_ohlcv(INDICATOR_WARMUP_CANDLES, TIME_FRAMES[0], (seed,))
+        frame = pd.DataFrame(ohlcv, columns=['open', 'high', 'low', 'close', 'volume'],
+                             index=pd.to_datetime(timestamps, unit='ms'))
+        rows = [indicators.calculate_all_indicators(frame).iloc[-1]]
+    features = np.vstack([signal_analyzer.extract_features(row) for row in rows])
+    single = [(features[i % len(features)].reshape(1, -1),) for i in range(len(history))]
+    results.append(per_key("predict_proba[1]", ai_model.predict_proba, single))
+    # Один батч-вызов на цикл: строки выборки повторяются до размера вселенной
+    batch = features[np.arange(total_keys) % len(features)]
+    durations = time_calls(ai_model.predict_proba, [(batch,)], max(repeat, 3))
+    results.append(summarize("predict_proba[batch]", pairs_count, depth, durations, 1, total_keys, 1))
+
+    candles = {key: [{"timestamp": int(t), "open": o, "high": h, "low": l, "close": c, "volume": v}
+                     for t, (o, h, l, c, v) in zip(timestamps.tolist(), ohlcv.tolist())]
+               for key, (timestamps, ohlcv) in history.items()}
+    db_path = os.path.join(db_dir, f"bench_{pairs_count}_{depth}.db")
+    saved_db_name = database.DATABASE_NAME
+    database.DATABASE_NAME = db_path
+    try:
+        save_durations = []
+        for _ in range(repeat):  # Каждый повтор — вставка в пустую базу
+            if os.path.exists(db_path):
+                os.remove(db_path)
+            database.init_db()
+            save_durations.append(time_calls(database.save_historical_data,
+                                             [(pair, tf, rows) for (pair, tf), rows in candles.items()], 1))
+        results.append(summarize("save_historical_data", pairs_count, depth, np.concatenate(save_durations),
+                                 len(candles), total_keys, total_keys))
+        results.append(per_key("load_historical_data", database.load_historical_data,
+                               [(pair, timeframe, depth) for pair, timeframe in history]))
+    finally:
+        database.DATABASE_NAME = saved_db_name
+        if os.path.exists(db_path):
+            os.remove(db_path)
+    return results
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count()
+    }
+
+def result_key(result: dict) -> tuple:
+    return result["benchmark"], result["pairs"], result["depth"]
+
+def compare(baseline: dict, current: dict, tolerance: float) -> int:
+    """Печатает изменение медианы вызова; возвращает число регрессий сверх tolerance."""
+    base = {result_key(r): r for r in baseline["results"]}
+    regressions = 0
+    print(f"\nСравнение с {baseline['environment'].get('git_commit')} "
+          f"({baseline['environment'].get('created_at')}), допуск {tolerance:.0%}")
+    print(f"{'benchmark':<36} {'pairs':>6} {'depth':>6} {'base, us':>11} {'now, us':>11} {'change':>8}")
+    for result in current["results"]:
+        previous = base.get(result_key(result))
+        if previous is None:
+            continue
+        change = result["median_us"] / previous["median_us"] - 1 if previous["median_us"] else 0.0
+        flag = ""
+        if change > tolerance:
+            regressions += 1
+            flag = "  РЕГРЕССИЯ"
+        print(f"{result['benchmark']:<36} {result['pairs']:>6} {result['depth']:>6} "
+              f"{previous['median_us']:>11.1f} {result['median_us']:>11.1f} {change:>+8.1%}{flag}")
+    missing = set(base) - {result_key(r) for r in current["results"]}
+    if missing:
+        print(f"Нет в текущем прогоне: {len(missing)} замеров")
+    return regressions
+
+def print_results(results: list):
+    print(f"{'benchmark':<36} {'pairs':>6} {'depth':>6} {'median, us':>11} {'p95, us':>11} {'universe, s':>12}")
+    for result in results:
+        print(f"{result['benchmark']:<36} {result['pairs']:>6} {result['depth']:>6} {result['median_us']:>11.1f} "
+              f"{result['p95_us']:>11.1f} {result['projected_total_s']:>12.4f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--universes', nargs='+', type=int, default=UNIVERSES, help='числа пар')
+    parser.add_argument('--depths', nargs='+', type=int, default=DEPTHS, help='свечей истории на ключ')
+    parser.add_argument('--max-keys', type=int, default=200, help='ключей в выборке поключевых замеров')
+    parser.add_argument('--repeat', type=int, default=3, help='проходов по выборке')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='записать результаты в JSON')
+    parser.add_argument('--baseline', help='сравнить с результатами прошлого прогона')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'), help='сравнить два файла без прогона')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='допустимый рост медианы')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        sys.exit(1 if compare(baseline, current, args.tolerance) else 0)
+
+    warnings.simplefilter("ignore", FutureWarning)
+    # Сообщения анализатора и БД о каждом вызове искажают замеры
+    for name in ('signal_analyzer', 'database', 'model'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    results = []
+    with tempfile.TemporaryDirectory() as db_dir:
+        for pairs_count in args.universes:
+            for depth in args.depths:
+                started = time.perf_counter()
+                results.extend(run_case(pairs_count, depth, args.max_keys, args.repeat, args.seed, db_dir))
+                print(f"# {pairs_count} пар × {len(TIME_FRAMES)} таймфреймов, глубина {depth}: "
+                      f"{time.perf_counter() - started:.1f} с", file=sys.stderr)
+
+    report = {
+        "environment": environment(),
+        "parameters": {"universes": args.universes, "depths": args.depths, "max_keys": args.max_keys,
+                       "repeat": args.repeat, "seed": args.seed, "timeframes": TIME_FRAMES},
+        "results": results
+    }
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(baseline, report, args.tolerance) else 0)
+
+if __name__ == "__main__":
+    main()
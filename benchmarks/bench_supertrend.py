@@ -0,0 +1,97 @@
+"""Микро-бенчмарк Supertrend: исходная iloc-реализация против NumPy-ядра.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_supertrend
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+import talib
+from globals import SUPERTREND_PERIOD, SUPERTREND_MULTIPLIER
+from indicators import calculate_supertrend
+
+SIZES = [30, 1_000, 100_000]
+
+def calculate_supertrend_legacy(df: pd.DataFrame) -> pd.Series:
+    """Исходная реализация с покомпонентными циклами по .iloc (эталон)."""
+    atr = talib.ATR(df['high'], df['low'], df['close'], timeperiod=SUPERTREND_PERIOD)
+    hl2 = (df['high'] + df['low']) / 2
+
+    basic_upper_band = hl2 + (SUPERTREND_MULTIPLIER * atr)
+    basic_lower_band = hl2 - (SUPERTREND_MULTIPLIER * atr)
+
+    final_upper_band = basic_upper_band.copy()
+    final_lower_band = basic_lower_band.copy()
+
+    for i in range(1, len(df)):
+        if df['close'].iloc[i-1] > final_upper_band.iloc[i-1]:
+            final_upper_band.iloc[i] = max(basic_upper_band.iloc[i], final_upper_band.iloc[i-1])
+        else:
+            final_upper_band.iloc[i] = basic_upper_band.iloc[i]
+
+        if df['close'].iloc[i-1] < final_lower_band.iloc[i-1]:
+            final_lower_band.iloc[i] = min(basic_lower_band.iloc[i], final_lower_band.iloc[i-1])
+        else:
+            final_lower_band.iloc[i] = basic_lower_band.iloc[i]
+
+    supertrend = pd.Series(np.nan, index=df.index)
+    for i in range(len(df)):
+        if i == 0:
+            supertrend.iloc[i] = final_upper_band.iloc[i] if df['close'].iloc[i] <= final_upper_band.iloc[i] else final_lower_band.iloc[i]
+        else:
+            if supertrend.iloc[i-1] == final_upper_band.iloc[i-1] and df['close'].iloc[i] <= final_upper_band.iloc[i]:
+                supertrend.iloc[i] = final_upper_band.iloc[i]
+            elif supertrend.iloc[i-1] == final_upper_band.iloc[i-1] and df['close'].iloc[i] > final_upper_band.iloc[i]:
+                supertrend.iloc[i] = final_lower_band.iloc[i]
+            elif supertrend.iloc[i-1] == final_lower_band.iloc[i-1] and df['close'].iloc[i] >= final_lower_band.iloc[i]:
+                supertrend.iloc[i] = final_lower_band.iloc[i]
+            else:
+                supertrend.iloc[i] = final_upper_band.iloc[i]
+
+    return supertrend
+
+def make_candles(n: int, seed: int = 42) -> pd.DataFrame:
+    """Генерирует синтетические OHLC-свечи."""
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, n))
+    spread = rng.random(n)
+    return pd.DataFrame({
+        'high': close + spread,
+        'low': close - spread,
+        'close': close,
+    }, index=pd.date_range('2024-01-01', periods=n, freq='min'))
+
+def time_call(func, df: pd.DataFrame, repeat: int) -> float:
+    """Возвращает лучшее время вызова в секундах."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(df)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5, help='повторов на размер')
+    parser.add_argument('--legacy-max', type=int, default=100_000,
+                        help='не запускать эталон на историях длиннее')
+    args = parser.parse_args()
+
+    calculate_supertrend(make_candles(64))  # компиляция numba, если установлена
+
+    print(f"{'candles':>10} {'legacy, ms':>12} {'numpy, ms':>12} {'speedup':>9}  parity")
+    for n in SIZES:
+        df = make_candles(n)
+        new_time = time_call(calculate_supertrend, df, args.repeat)
+        if n > args.legacy_max:
+            print(f"{n:>10} {'-':>12} {new_time * 1e3:>12.3f} {'-':>9}  -")
+            continue
+        legacy_time = time_call(calculate_supertrend_legacy, df, 1 if n > 10_000 else args.repeat)
+        parity = np.allclose(calculate_supertrend(df), calculate_supertrend_legacy(df),
+                             rtol=0, atol=1e-9, equal_nan=True)
+        print(f"{n:>10} {legacy_time * 1e3:>12.3f} {new_time * 1e3:>12.3f} "
+              f"{legacy_time / new_time:>8.1f}x  {'ok' if parity else 'MISMATCH'}")
+
+if __name__ == "__main__":
+    main()
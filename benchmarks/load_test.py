@@ -0,0 +1,410 @@
+"""Нагрузочный прогон: имитация combined stream → connect_binance_websocket → анализ → Telegram-заглушка.
+
+Имитация биржи (fake_exchange) запускается отдельным процессом и рассылает
+синтетические или записанные kline-сообщения с темпом --rate на поток;
+синтетическое время идет в --speed раз быстрее реального, поэтому свечи
+закрываются часто. В этом процессе работают настоящие шарды WebSocket,
+событийный цикл анализа core.event_loop, писатель БД (временный файл)
+и диспетчер рассылки; вместо Bot API — заглушка отправки.
+
+Отчет: устойчивый поток сообщений в секунду, потерянные и опоздавшие
+(задержка доставки больше --late-ms) закрытые свечи, перцентили задержки
+от отправки закрывающего сообщения до конца анализа ключа и до публикации
+сигнала, рост RSS процесса. Синтетические свечи редко проходят уровни 1–3
+стратегии; задержку до сигнала дают записанные реальные сообщения (--replay).
+При воспроизведении прогрев строится из закрытых свечей самой записи, круги
+сдвигаются на ее непрерывный отрезок (fake_exchange.replay_span), а догрузка
+пропусков из REST отключена: синтетические свечи имитации не смешиваются с
+записью. Чтобы круги шли без пропусков, запись должна покрывать хотя бы одну
+свечу старшего таймфрейма.
+
+Запуск из корня репозитория:
+    python -m benchmarks.load_test --pairs 100 --rate 2 --speed 120 --duration 60
+    python -m benchmarks.load_test --record klines.jsonl --record-seconds 120
+    python -m benchmarks.load_test --replay klines.jsonl --rate 5 --output load.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+import aiohttp
+import numpy as np
+import websockets
+import core
+import database
+import signal_analyzer as analyzer_module
+import websocket as websocket_module
+from backfill import kline_backfiller
+from candle_buffer import CandleRingBuffer
+from fake_exchange import synthetic_kline, load_replay, replay_span, HOUR_MS
+from globals import (
+    TIME_FRAMES, TIMEFRAME_MS, CANDLE_COUNT, INDICATOR_WARMUP_CANDLES, RISK_MANAGEMENT, BINANCE_WS_BASE_URL
+)
+from kline_decoder import kline_decoder
+from scheduler import analysis_scheduler
+from signal_analyzer import signal_analyzer
+from streaming_indicators import warm_up_indicator_engine_arrays
+from telegram_dispatcher import telegram_dispatcher
+from benchmarks.bench_pipeline import universe_pairs
+
+LOAD_TEST_CHAT_ID = "load-test"
+
+def rss_mb() -> float:
+    """Текущий RSS процесса (Linux), иначе пиковый из getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    array = np.asarray(values)
+    return {
+        "count": len(values),
+        "p50_ms": float(np.percentile(array, 50)),
+        "p90_ms": float(np.percentile(array, 90)),
+        "p99_ms": float(np.percentile(array, 99)),
+        "max_ms": float(array.max())
+    }
+
+class LatencyProbe:
+    """Замеры поверх настоящего пути обработки.
+
+    Закрывающее сообщение дополнительно разбирается ради поля E (время
+    отправки имитацией), затем уходит в исходный обработчик шарда. Конец
+    анализа ключа отмечается после run_analysis_batch, публикация сигнала —
+    в _publish_signal. Для ключа берется самая ранняя еще не проанализированная
+    свеча, поэтому объединение нескольких свечей в один анализ видно в задержке.
+    """
+
+    def __init__(self, late_ms: float):
+        self.late_ms = late_ms
+        self.closed_received = 0
+        self.late = 0
+        self.delivery_ms = []
+        self.analysis_ms = []
+        self.signal_ms = []
+        self.signals = 0
+        self._pending = {}    # key -> E самой ранней непроанализированной свечи
+        self._last_close = {}  # key -> E последней закрытой свечи
+        self._originals = None
+
+    def on_closed_message(self, message: str):
+        data = json.loads(message)["data"]
+        kline = data["k"]
+        if not kline["x"]:
+            return
+        key = f"{kline['s']}_{kline['i']}"
+        lag = time.time() * 1000 - data["E"]
+        self.closed_received += 1
+        self.delivery_ms.append(lag)
+        if lag > self.late_ms:
+            self.late += 1
+        self._pending.setdefault(key, data["E"])
+        self._last_close[key] = data["E"]
+
+    @property
+    def unanalyzed(self) -> int:
+        return len(self._pending)
+
+    def install(self):
+        shard_on_message = websocket_module.WebSocketShard._on_message
+        run_analysis_batch = core.run_analysis_batch
+        publish_signal = analyzer_module._publish_signal
+        probe = self
+
+        def on_message(shard, message):
+            if isinstance(message, str) and not kline_decoder.is_unclosed(message):
+                probe.on_closed_message(message)
+            shard_on_message(shard, message)
+
+        async def timed_analysis_batch(keys: list):
+            await run_analysis_batch(keys)
+            now_ms = time.time() * 1000
+            for key in keys:
+                sent_ms = probe._pending.pop(key, None)
+                if sent_ms is not None:
+                    probe.analysis_ms.append(now_ms - sent_ms)
+
+        async def timed_publish_signal(pair: str, timeframe: str, signal_result: dict, current_time: float):
+            sent_ms = probe._last_close.get(f"{pair}_{timeframe}")
+            if sent_ms is not None:
+                probe.signal_ms.append(time.time() * 1000 - sent_ms)
+            probe.signals += 1
+            await publish_signal(pair, timeframe, signal_result, current_time)
+
+        self._originals = (shard_on_message, run_analysis_batch, publish_signal)
+        websocket_module.WebSocketShard._on_message = on_message
+        core.run_analysis_batch = timed_analysis_batch
+        analyzer_module._publish_signal = timed_publish_signal
+
+    def uninstall(self):
+        if self._originals is None:
+            return
+        (websocket_module.WebSocketShard._on_message, core.run_analysis_batch,
+         analyzer_module._publish_signal) = self._originals
+        self._originals = None
+
+class StubTelegram:
+    """Заглушка Bot API: только считает доставленные сообщения."""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send(self, chat_id: str, text: str):
+        self.sent += 1
+
+def _load_key(key: str, klines: list):
+    """Буфер и движок индикаторов ключа из свечей [open_time, open, high, low, close, volume, ...]."""
+    websocket_module.live_data_buffers[key] = buffer = CandleRingBuffer(CANDLE_COUNT)
+    if not klines:
+        return
+    timestamps = np.array([k[0] for k in klines], dtype=np.int64)
+    ohlcv = np.array([[float(v) for v in k[1:6]] for k in klines])
+    buffer.load(timestamps, ohlcv)
+    warm_up_indicator_engine_arrays(key, timestamps, ohlcv)
+
+def warm_up(pairs: list, timeframes: list, sim_start_ms: int, candles: int):
+    """Буферы и движки индикаторов из свечей имитации, закрытых до начала потока."""
+    for pair in pairs:
+        for timeframe in timeframes:
+            step = TIMEFRAME_MS[timeframe]
+            _load_key(f"{pair}_{timeframe}",
+                      [synthetic_kline(pair, timeframe, sim_start_ms - step * i) for i in range(candles, 0, -1)])
+
+def warm_up_replay(messages: list, pairs: list, timeframes: list, candles: int):
+    """Прогрев из закрытых свечей записи: круги −1, −2, … до первого круга имитации.
+
+    Круги сдвинуты на тот же replay_span, что и в имитации, поэтому первая
+    воспроизведенная свеча сразу продолжает буфер.
+    """
+    span = replay_span(messages)
+    closed = {}  # key -> {open_time: [open_time, o, h, l, c, v]}
+    for message in messages:
+        kline = message["data"]["k"]
+        if kline["x"]:
+            closed.setdefault(f"{kline['s']}_{kline['i']}", {})[kline["t"]] = [
+                kline["t"], kline["o"], kline["h"], kline["l"], kline["c"], kline["v"]]
+    for pair in pairs:
+        for timeframe in timeframes:
+            key = f"{pair}_{timeframe}"
+            recorded = [closed[key][t] for t in sorted(closed.get(key, {}))]
+            klines = []
+            shift = span
+            while recorded and len(klines) < candles:
+                klines = [[k[0] - shift, *k[1:]] for k in recorded] + klines
+                shift += span
+            _load_key(key, klines[-candles:])
+
+async def start_exchange(port: int, rate: float, speed: float, sim_start_ms: int, replay: str | None):
+    """Имитация биржи отдельным процессом, чтобы ее рассылка не отнимала цикл у бота."""
+    command = [sys.executable, "-m", "fake_exchange", "--port", str(port), "--ws-rate", str(rate),
+               "--ws-speed", str(speed), "--ws-start", str(sim_start_ms), "--weight-limit", str(10 ** 9)]
+    if replay:
+        command += ["--ws-replay", replay]
+    process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.DEVNULL,
+                                                   stderr=asyncio.subprocess.DEVNULL)
+    async with aiohttp.ClientSession() as session:
+        for _ in range(100):
+            try:
+                async with session.get(f"http://127.0.0.1:{port}/stream/stats") as response:
+                    if response.status == 200:
+                        return process
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"Имитация биржи не запустилась на порту {port}")
+
+async def stop_exchange(port: int) -> dict:
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f"http://127.0.0.1:{port}/stream/stop") as response:
+            return await response.json()
+
+async def run_load_test(args) -> dict:
+    pairs = universe_pairs(args.pairs)
+    timeframes = args.timeframes
+    now_ms = int(time.time() * 1000)
+    # Поток начинается с ближайшего часа: свечи прогрева не считаются пропуском после подключения
+    sim_start_ms = now_ms - now_ms % HOUR_MS + HOUR_MS
+
+    started = time.perf_counter()
+    if args.replay:
+        warm_up_replay(load_replay(args.replay), pairs, timeframes, args.warmup)
+    else:
+        warm_up(pairs, timeframes, sim_start_ms, args.warmup)
+    warmup_seconds = time.perf_counter() - started
+
+    # Дневной лимит и кулдаун остановили бы анализ в середине прогона
+    RISK_MANAGEMENT['max_daily_signals'] = 10 ** 9
+    RISK_MANAGEMENT['min_time_between_signals'] = 0
+    signal_analyzer.daily_signal_count = 0
+
+    stub = StubTelegram()
+    telegram_dispatcher.sender = stub.send
+    await telegram_dispatcher.start()
+    await telegram_dispatcher.subscribe(LOAD_TEST_CHAT_ID)
+    database.start_db_writer()
+    kline_backfiller.base_url = f"http://127.0.0.1:{args.port}"
+    # REST имитации отдает синтетику, а не историю записи: пропуски при воспроизведении только считаем
+    websocket_module.gap_resync.enabled = not args.replay
+
+    probe = LatencyProbe(args.late_ms)
+    probe.install()
+    process = await start_exchange(args.port, args.rate, args.speed, sim_start_ms, args.replay)
+    core.BOT_ACTIVE = True
+    analysis_task = asyncio.create_task(core.event_loop())
+    ws_task = asyncio.create_task(websocket_module.connect_binance_websocket(
+        pairs, timeframes, f"ws://127.0.0.1:{args.port}"))
+
+    rss_start = rss_mb()
+    samples = []  # (секунда, сообщений за секунду, RSS)
+    previous = 0
+    try:
+        for second in range(1, int(args.duration) + 1):
+            await asyncio.sleep(1)
+            messages = sum(shard.messages for shard in websocket_module.websocket_shards)
+            samples.append((second, messages - previous, rss_mb()))
+            previous = messages
+        exchange_stats = await stop_exchange(args.port)
+        await asyncio.sleep(args.drain)  # Дочитываем отправленное до остановки
+    finally:
+        core.BOT_ACTIVE = False
+        for task in (ws_task, analysis_task):
+            task.cancel()
+        await asyncio.gather(ws_task, analysis_task, return_exceptions=True)
+        probe.uninstall()
+        await telegram_dispatcher.stop()
+        process.terminate()
+        await process.wait()
+
+    # Первые секунды — подключение и разгон, в устойчивый поток не входят
+    steady = [rate for second, rate, _ in samples if second > min(5, len(samples) // 5)] or [0]
+    rss = [value for _, _, value in samples] or [rss_start]
+    # Тики всех потоков плюс закрытые свечи ускоренного времени
+    offered = len(pairs) * sum(args.rate + args.speed * 1000 / TIMEFRAME_MS[tf] for tf in timeframes)
+    shards = websocket_module.get_websocket_stats()
+    return {
+        "parameters": {
+            "pairs": len(pairs), "timeframes": timeframes, "streams": len(pairs) * len(timeframes),
+            "rate_per_stream": args.rate, "speed": args.speed, "duration_s": args.duration,
+            "replay": args.replay, "late_ms": args.late_ms
+        },
+        "warmup_seconds": warmup_seconds,
+        "throughput": {
+            "offered_msg_per_s": None if args.replay else offered,
+            "sustained_msg_per_s": float(np.mean(steady)),
+            "min_msg_per_s": int(min(steady)),
+            "messages": shards["messages"],
+            "shards": shards["shards"],
+            "exchange_max_backlog": exchange_stats["max_backlog"]
+        },
+        "candles": {
+            "closed_sent": exchange_stats["closed_sent"],
+            "closed_received": probe.closed_received,
+            "dropped": exchange_stats["closed_sent"] - probe.closed_received,
+            "late": probe.late,
+            "gaps_detected": websocket_module.gap_resync.gaps_detected,
+            "unanalyzed_keys": probe.unanalyzed
+        },
+        "latency": {
+            "delivery": percentiles(probe.delivery_ms),
+            "tick_to_analysis": percentiles(probe.analysis_ms),
+            "tick_to_signal": percentiles(probe.signal_ms)
+        },
+        "analysis": analysis_scheduler.get_stats(),
+        "signals": {"published": probe.signals, "telegram_sent": stub.sent,
+                    "telegram_queue_depth": telegram_dispatcher.get_stats()["chat_queue_depth"]},
+        "memory": {
+            "rss_start_mb": rss_start,
+            "rss_end_mb": rss[-1],
+            "rss_peak_mb": max(rss),
+            "growth_mb_per_min": (rss[-1] - rss_start) / max(len(rss), 1) * 60
+        }
+    }
+
+async def record(path: str, pairs: list, timeframes: list, seconds: float, base_url: str):
+    """Записывает сообщения combined stream в JSON lines для --replay."""
+    streams = "/".join(f"{pair.lower()}@kline_{tf}" for pair in pairs for tf in timeframes)
+    count = 0
+    deadline = time.monotonic() + seconds
+    with open(path, "w") as f:
+        async with websockets.connect(f"{base_url}/stream?streams={streams}") as ws:
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    message = await asyncio.wait_for(ws.recv(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                f.write(message.strip() + "\n")
+                count += 1
+    print(f"Записано сообщений: {count} в {path}")
+
+def print_report(report: dict):
+    params, throughput, candles = report["parameters"], report["throughput"], report["candles"]
+    print(f"Потоков: {params['streams']} ({params['pairs']} пар × {len(params['timeframes'])}), "
+          f"шардов: {throughput['shards']}, прогрев {report['warmup_seconds']:.1f} с")
+    offered = throughput["offered_msg_per_s"]
+    print(f"Сообщений/с: устойчиво {throughput['sustained_msg_per_s']:,.0f}, минимум {throughput['min_msg_per_s']:,}"
+          + (f", предложено {offered:,.0f}" if offered else "")
+          + f"; отставание имитации до {throughput['exchange_max_backlog']} сообщений")
+    print(f"Закрытые свечи: отправлено {candles['closed_sent']}, получено {candles['closed_received']}, "
+          f"потеряно {candles['dropped']}, опоздало {candles['late']}, пропусков {candles['gaps_detected']}, "
+          f"без анализа {candles['unanalyzed_keys']}")
+    for name, stats in report["latency"].items():
+        if stats["count"]:
+            print(f"{name:>17}: n={stats['count']}, p50 {stats['p50_ms']:.1f} мс, p90 {stats['p90_ms']:.1f} мс, "
+                  f"p99 {stats['p99_ms']:.1f} мс, max {stats['max_ms']:.1f} мс")
+        else:
+            print(f"{name:>17}: нет замеров")
+    analysis = report["analysis"]
+    print(f"Анализ: циклов {analysis['cycles']}, сэкономлено анализов {analysis['analyses_avoided']}; "
+          f"сигналов {report['signals']['published']}, доставлено заглушке {report['signals']['telegram_sent']}")
+    memory = report["memory"]
+    print(f"RSS: {memory['rss_start_mb']:.0f} → {memory['rss_end_mb']:.0f} МБ (пик {memory['rss_peak_mb']:.0f}), "
+          f"{memory['growth_mb_per_min']:+.1f} МБ/мин")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pairs', type=int, default=7, help='число пар (сверх конфигурации — синтетические)')
+    parser.add_argument('--timeframes', nargs='+', default=TIME_FRAMES)
+    parser.add_argument('--rate', type=float, default=1.0, help='сообщений в секунду на поток')
+    parser.add_argument('--speed', type=float, default=60.0, help='ускорение времени свечей')
+    parser.add_argument('--duration', type=float, default=60, help='длительность, секунд')
+    parser.add_argument('--warmup', type=int, default=INDICATOR_WARMUP_CANDLES, help='свечей прогрева на ключ')
+    parser.add_argument('--late-ms', type=float, default=1000, help='порог опоздания закрытой свечи')
+    parser.add_argument('--drain', type=float, default=2.0, help='ожидание после остановки рассылки, секунд')
+    parser.add_argument('--port', type=int, default=8092)
+    parser.add_argument('--replay', help='записанные сообщения (JSON lines) вместо синтетики')
+    parser.add_argument('--record', help='записать поток биржи в файл и выйти')
+    parser.add_argument('--record-seconds', type=float, default=60)
+    parser.add_argument('--output', help='записать отчет в JSON')
+    args = parser.parse_args()
+
+    if args.record:
+        asyncio.run(record(args.record, universe_pairs(args.pairs), args.timeframes,
+                           args.record_seconds, BINANCE_WS_BASE_URL))
+        return
+
+    # Сообщения о каждой свече и сигнале сами становятся нагрузкой
+    logging.getLogger().setLevel(logging.WARNING)
+    for name in ('websocket', 'signal_analyzer', 'core', 'database', 'telegram_dispatcher'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        database.DATABASE_NAME = database.db_writer.db_name = os.path.join(db_dir, "load_test.db")
+        database.init_db()
+        report = asyncio.run(run_load_test(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Сверка локально собранных свечей 5m/15m/30m/1h с биржевыми.
+
+Загружает минутные и биржевые свечи старших таймфреймов за одно окно,
+собирает старшие таймфреймы из минутных через CandleAggregator и сравнивает
+OHLCV. Без --base-url проверка идет против локальной имитации fake_exchange.
+
+Запуск из корня репозитория:
+    python -m benchmarks.verify_aggregation --hours 24
+    python -m benchmarks.verify_aggregation --base-url https://api.binance.com --pairs BTCUSDT ETHUSDT
+"""
+import argparse
+import asyncio
+import math
+import time
+import aiohttp
+from globals import PAIRS, TIME_FRAMES, TIMEFRAME_MS
+from kline_decoder import KlineRecord
+from candle_aggregator import BASE_TIMEFRAME, aggregate_records
+
+PAGE_LIMIT = 1000
+
+async def fetch_klines(session: aiohttp.ClientSession, base_url: str, symbol: str, interval: str,
+                       start_ms: int, end_ms: int) -> list:
+    """Свечи с временем открытия в [start_ms, end_ms] как KlineRecord."""
+    records = []
+    cursor = start_ms
+    while cursor <= end_ms:
+        params = {"symbol": symbol, "interval": interval, "startTime": cursor,
+                  "endTime": end_ms, "limit": PAGE_LIMIT}
+        async with session.get(f"{base_url}/api/v3/klines", params=params) as response:
+            response.raise_for_status()
+            klines = await response.json()
+        records.extend(KlineRecord(symbol, interval, int(k[0]), float(k[1]), float(k[2]),
+                                   float(k[3]), float(k[4]), float(k[5])) for k in klines)
+        if len(klines) < PAGE_LIMIT:
+            break
+        cursor = int(klines[-1][0]) + TIMEFRAME_MS[interval]
+    return records
+
+def compare(native: list, aggregated: list, rel_tol: float) -> dict:
+    """Совпадения, расхождения и отсутствующие свечи по времени открытия."""
+    built = {record.timestamp: record for record in aggregated}
+    result = {"native": len(native), "matched": 0, "mismatched": 0, "missing": 0}
+    for record in native:
+        candidate = built.get(record.timestamp)
+        if candidate is None:
+            result["missing"] += 1
+        elif all(math.isclose(a, b, rel_tol=rel_tol) for a, b in zip(record[3:], candidate[3:])):
+            result["matched"] += 1
+        else:
+            result["mismatched"] += 1
+            if result["mismatched"] <= 3:
+                print(f"  расхождение {record.symbol}-{record.interval} {record.timestamp}: "
+                      f"биржа {record[3:]} / локально {candidate[3:]}")
+    return result
+
+async def verify(base_url: str, pairs: list, timeframes: list, hours: float, rel_tol: float):
+    now_ms = int(time.time() * 1000)
+    largest = max(TIMEFRAME_MS[tf] for tf in timeframes)
+    # Окно из целых корзин старшего таймфрейма, только закрытые свечи
+    end_ms = now_ms - now_ms % largest - 1
+    start_ms = end_ms + 1 - max(1, int(hours * 3_600_000 // largest)) * largest
+    totals = {tf: {"native": 0, "matched": 0, "mismatched": 0, "missing": 0} for tf in timeframes}
+    async with aiohttp.ClientSession() as session:
+        for pair in pairs:
+            minutes = await fetch_klines(session, base_url, pair, BASE_TIMEFRAME, start_ms, end_ms)
+            for tf in timeframes:
+                native = await fetch_klines(session, base_url, pair, tf, start_ms, end_ms)
+                for name, value in compare(native, aggregate_records(minutes, tf), rel_tol).items():
+                    totals[tf][name] += value
+
+    print(f"{'timeframe':>10} {'native':>8} {'matched':>8} {'mismatch':>9} {'missing':>8}")
+    for tf, total in totals.items():
+        print(f"{tf:>10} {total['native']:>8} {total['matched']:>8} {total['mismatched']:>9} {total['missing']:>8}")
+    return all(total["matched"] == total["native"] for total in totals.values())
+
+async def run(args) -> bool:
+    runner = None
+    base_url = args.base_url
+    if base_url is None:
+        from fake_exchange import FakeExchange, start_fake_exchange
+        runner = await start_fake_exchange(port=args.port, exchange=FakeExchange(weight_limit=10 ** 9))
+        base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        return await verify(base_url.rstrip("/"), args.pairs, args.timeframes, args.hours, args.rel_tol)
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--base-url', help='REST API (по умолчанию — локальная имитация)')
+    parser.add_argument('--port', type=int, default=8091, help='порт локальной имитации')
+    parser.add_argument('--pairs', nargs='+', default=PAIRS)
+    parser.add_argument('--timeframes', nargs='+', default=[tf for tf in TIME_FRAMES if tf != BASE_TIMEFRAME])
+    parser.add_argument('--hours', type=float, default=24)
+    parser.add_argument('--rel-tol', type=float, default=1e-9, help='допуск (объем — сумма float)')
+    args = parser.parse_args()
+    ok = asyncio.run(run(args))
+    print("OK" if ok else "РАСХОЖДЕНИЯ")
+    raise SystemExit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Сверка и скорость: evaluate_frame против построчного quantum_binary_signal.
+
+Строит синтетическую историю (случайное блуждание с всплесками объема),
+считает индикаторы calculate_all_indicators и сравнивает для каждой строки
+маски уровней 1–3, вероятность, направление, точность и экспирацию.
+Порог модели можно понизить (--threshold), чтобы сверить и сформированные сигналы.
+Заглушка модели добавляет случайный шум, поэтому по умолчанию вероятность
+считается детерминированной функцией признаков (--real-model — текущая модель).
+
+Запуск из корня репозитория:
+    python -m benchmarks.verify_vectorized_signal --candles 20000
+"""
+import argparse
+import logging
+import math
+import time
+import numpy as np
+import pandas as pd
+import signal_analyzer as analyzer_module
+from indicators import calculate_all_indicators
+from model import ai_model
+from signal_analyzer import signal_analyzer
+
+def make_history(candles: int, seed: int = 7) -> pd.DataFrame:
+    """Минутные OHLCV со всплесками объема, чтобы импульсный фильтр срабатывал."""
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0, 0.002, candles)
+    spikes = rng.random(candles) < 0.03
+    returns[spikes] += rng.choice([-0.01, 0.01], spikes.sum())
+    close = 100 * np.exp(np.cumsum(returns))
+    open_ = np.concatenate([[100.0], close[:-1]])
+    spread = np.abs(close - open_) + close * 0.0005
+    volume = rng.uniform(50, 150, candles) * np.where(spikes, 20, 1)
+    index = pd.date_range("2024-01-01", periods=candles, freq="1min", name="timestamp")
+    return pd.DataFrame({
+        "open": open_, "high": np.maximum(open_, close) + spread / 2,
+        "low": np.minimum(open_, close) - spread / 2, "close": close, "volume": volume
+    }, index=index)
+
+def deterministic_proba(features: np.ndarray) -> np.ndarray:
+    """Детерминированная функция признаков вместо модели: проверяет и сборку признаков."""
+    features = np.atleast_2d(features)
+    weights = np.random.default_rng(0).normal(0, 1.0, features.shape[1])
+    score = 0.5 + 0.45 * np.sin(features @ weights)
+    return np.column_stack([1 - score, score])
+
+def evaluate_scalar(data: pd.DataFrame) -> list:
+    """Скалярный путь по строкам: (passed, probability, signal_type, accuracy, expiry, signal)."""
+    results = []
+    for i in range(len(data)):
+        latest = data.iloc[i]
+        if i < 4 or not signal_analyzer.passes_filters(latest):
+            results.append((False, None, None, None, None, False))
+            continue
+        probability = float(ai_model.predict_proba(signal_analyzer.extract_features(latest).reshape(1, -1))[0][1])
+        signal = signal_analyzer.build_signal(latest, probability)
+        results.append((True, probability, signal_analyzer.determine_signal_direction(latest, probability),
+                        signal_analyzer.calculate_accuracy(latest, probability),
+                        signal_analyzer.determine_expiry_time(latest), signal is not None))
+    return results
+
+def compare(scalar: list, vectorized: pd.DataFrame) -> int:
+    """Число строк с расхождениями (первые выводятся)."""
+    mismatches = 0
+    for (passed, probability, signal_type, accuracy, expiry, signal), (index, row) in zip(scalar, vectorized.iterrows()):
+        ok = passed == row['passed'] and signal == row['signal']
+        if ok and passed:
+            ok = math.isclose(probability, row['probability'], rel_tol=1e-12)
+        if ok and signal:
+            ok = (signal_type == row['signal_type'] and expiry == row['expiry_time']
+                  and math.isclose(accuracy, row['accuracy'], rel_tol=1e-12))
+        if not ok:
+            mismatches += 1
+            if mismatches <= 3:
+                print(f"  расхождение {index}: скалярно {passed, probability, signal_type, accuracy, expiry, signal}, "
+                      f"векторно {tuple(row[['passed', 'probability', 'signal_type', 'accuracy', 'expiry_time', 'signal']])}")
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--candles', type=int, default=20_000)
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help='порог вероятности на время проверки (заглушка модели редко дает 0.85)')
+    parser.add_argument('--real-model', action='store_true', help='сверять с текущей моделью')
+    args = parser.parse_args()
+    logging.getLogger('signal_analyzer').setLevel(logging.WARNING)
+    analyzer_module.MIN_ACCURACY_THRESHOLD = args.threshold
+    if not args.real_model:
+        ai_model.predict_proba = deterministic_proba
+
+    data = calculate_all_indicators(make_history(args.candles))
+
+    start = time.perf_counter()
+    scalar = evaluate_scalar(data)
+    scalar_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = signal_analyzer.evaluate_frame(data)
+    vectorized_seconds = time.perf_counter() - start
+
+    mismatches = compare(scalar, vectorized)
+    print(f"Строк: {len(data)}, прошли уровни 1–3: {int(vectorized['passed'].sum())}, "
+          f"сигналов: {int(vectorized['signal'].sum())}")
+    print(f"{'path':>12} {'seconds':>9} {'rows/s':>12}")
+    print(f"{'scalar':>12} {scalar_seconds:>9.3f} {len(data) / scalar_seconds:>12,.0f}")
+    print(f"{'vectorized':>12} {vectorized_seconds:>9.3f} {len(data) / vectorized_seconds:>12,.0f}"
+          f"  ({scalar_seconds / vectorized_seconds:.0f}x)")
+    print("OK" if mismatches == 0 else f"РАСХОЖДЕНИЙ: {mismatches}")
+    raise SystemExit(0 if mismatches == 0 else 1)
+
+if __name__ == "__main__":
+    main()
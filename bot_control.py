@@ -3,7 +3,7 @@ import logging
 from typing import Dict, Any
 from globals import BOT_ACTIVE
 from core import start_analysis, stop_analysis, get_system_status
-from database import get_daily_statistics
+from database import get_daily_statistics_async
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -73,7 +73,7 @@ class BinaryOptionsBotController:
     async def get_statistics(self) -> Dict[str, Any]:
         """Возвращает статистику работы бота."""
         try:
-            total_signals, wins = get_daily_statistics()
+            total_signals, wins = await get_daily_statistics_async()
             win_rate = (wins / total_signals * 100) if total_signals > 0 else 0
             
             return {
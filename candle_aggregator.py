@@ -0,0 +1,112 @@
+import logging
+from globals import TIMEFRAME_MS, TIME_FRAMES
+from kline_decoder import KlineRecord
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BASE_TIMEFRAME = "1m"
+
+class _Bucket:
+    """Незакрытая свеча старшего таймфрейма, собираемая из минутных."""
+
+    __slots__ = ('start', 'open', 'high', 'low', 'close', 'volume', 'next_timestamp', 'complete')
+
+    def __init__(self, start: int, record: KlineRecord, complete: bool):
+        self.start = start
+        self.open = record.open
+        self.high = record.high
+        self.low = record.low
+        self.close = record.close
+        self.volume = record.volume
+        self.next_timestamp = record.timestamp + TIMEFRAME_MS[BASE_TIMEFRAME]
+        # Свеча без первых минут (или с пропуском внутри) не публикуется
+        self.complete = complete
+
+    def add(self, record: KlineRecord):
+        if record.timestamp != self.next_timestamp:
+            self.complete = False
+        self.high = max(self.high, record.high)
+        self.low = min(self.low, record.low)
+        self.close = record.close
+        self.volume += record.volume
+        self.next_timestamp = record.timestamp + TIMEFRAME_MS[BASE_TIMEFRAME]
+
+class CandleAggregator:
+    """Собирает свечи старших таймфреймов из закрытых минутных свечей.
+
+    Границы корзин совпадают с биржевыми: время открытия кратно длительности
+    таймфрейма от эпохи UTC. Свеча публикуется вместе с последней минутой
+    корзины; неполные корзины (старт посреди корзины, пропуск минут)
+    отбрасываются — такой пропуск затем догружается ресинхронизацией.
+    """
+
+    def __init__(self, timeframes: list):
+        self.timeframes = [tf for tf in timeframes if tf != BASE_TIMEFRAME]
+        for tf in self.timeframes:
+            if TIMEFRAME_MS[tf] % TIMEFRAME_MS[BASE_TIMEFRAME]:
+                raise ValueError(f"Таймфрейм {tf} не кратен {BASE_TIMEFRAME}")
+        self._buckets = {}  # (symbol, timeframe) -> _Bucket
+        self._last_timestamp = {}  # symbol -> время последней учтенной минуты
+        self.candles_built = 0
+        self.incomplete_buckets = 0
+
+    def is_tracking(self, symbol: str) -> bool:
+        return symbol in self._last_timestamp
+
+    def seed(self, records: list) -> list:
+        """Восстанавливает корзины по уже полученным минутным свечам (например, из буфера).
+
+        Возвращает только свечи, закрытые последней из переданных минут.
+        """
+        closed = []
+        for record in records:
+            closed = self.add(record)
+        return closed
+
+    def add(self, record: KlineRecord) -> list:
+        """Учитывает закрытую минутную свечу; возвращает закрывшиеся свечи старших таймфреймов."""
+        if record.interval != BASE_TIMEFRAME:
+            return []
+        last = self._last_timestamp.get(record.symbol)
+        if last is not None and record.timestamp <= last:
+            return []  # Повтор или устаревшая свеча
+        self._last_timestamp[record.symbol] = record.timestamp
+        closed = []
+        for tf in self.timeframes:
+            interval = TIMEFRAME_MS[tf]
+            start = record.timestamp - record.timestamp % interval
+            key = (record.symbol, tf)
+            bucket = self._buckets.get(key)
+            if bucket is None or bucket.start != start:
+                if bucket is not None:
+                    self.incomplete_buckets += 1
+                    logger.debug(f"Неполная свеча {record.symbol}-{tf} {bucket.start} отброшена")
+                bucket = self._buckets[key] = _Bucket(start, record, record.timestamp == start)
+            else:
+                bucket.add(record)
+            if bucket.next_timestamp == start + interval:
+                del self._buckets[key]
+                if bucket.complete:
+                    self.candles_built += 1
+                    closed.append(KlineRecord(record.symbol, tf, start, bucket.open, bucket.high,
+                                              bucket.low, bucket.close, bucket.volume))
+                else:
+                    self.incomplete_buckets += 1
+        return closed
+
+    def get_stats(self) -> dict:
+        return {
+            "timeframes": self.timeframes,
+            "candles_built": self.candles_built,
+            "incomplete_buckets": self.incomplete_buckets,
+            "open_buckets": len(self._buckets)
+        }
+
+# Глобальный агрегатор (используется при CANDLE_AGGREGATION)
+candle_aggregator = CandleAggregator(TIME_FRAMES)
+
+def aggregate_records(records: list, timeframe: str) -> list:
+    """Собирает свечи timeframe из списка минутных KlineRecord (для проверок и бэктеста)."""
+    aggregator = CandleAggregator([timeframe])
+    return [candle for record in records for candle in aggregator.add(record)]
@@ -0,0 +1,111 @@
+import logging
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+from globals import CANDLE_COUNT
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+OHLCV_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+class CandleView(NamedTuple):
+    """Упорядоченные по времени представления колонок буфера (без копирования)."""
+    timestamp: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+class CandleRingBuffer:
+    """Кольцевой буфер свечей на преаллоцированных NumPy-массивах.
+
+    Каждое значение пишется дважды — в позицию i и i + capacity, поэтому
+    последние size свечей всегда лежат в непрерывном срезе и читаются
+    без копирования и сортировки.
+    """
+
+    __slots__ = ('capacity', 'size', '_position', '_timestamps', '_ohlcv')
+
+    def __init__(self, capacity: int = CANDLE_COUNT):
+        self.capacity = capacity
+        self.size = 0
+        self._position = -1
+        self._timestamps = np.zeros(2 * capacity, dtype=np.int64)
+        self._ohlcv = np.zeros((len(OHLCV_COLUMNS), 2 * capacity), dtype=np.float64)
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def last_timestamp(self) -> int | None:
+        """Время открытия последней свечи в мс."""
+        if self.size == 0:
+            return None
+        return int(self._timestamps[self._position])
+
+    def append(self, timestamp: int, open: float, high: float, low: float,
+               close: float, volume: float) -> bool:
+        """Добавляет свечу. Повтор последней свечи перезаписывает ее, устаревшие игнорируются."""
+        last = self.last_timestamp
+        if last is not None and timestamp < last:
+            logger.debug(f"Пропуск устаревшей свечи {timestamp} < {last}")
+            return False
+        if last is None or timestamp > last:
+            self._position = (self._position + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+        position = self._position
+        mirror = position + self.capacity
+        self._timestamps[position] = self._timestamps[mirror] = timestamp
+        values = (open, high, low, close, volume)
+        self._ohlcv[:, position] = values
+        self._ohlcv[:, mirror] = values
+        return True
+
+    def append_candle(self, candle: dict) -> bool:
+        """Добавляет свечу в формате словаря (timestamp в мс)."""
+        return self.append(int(candle['timestamp']), candle['open'], candle['high'],
+                           candle['low'], candle['close'], candle['volume'])
+
+    def extend(self, candles: list):
+        """Добавляет список свечей в формате словарей."""
+        for candle in candles:
+            self.append_candle(candle)
+
+    def load(self, timestamps: np.ndarray, ohlcv: np.ndarray):
+        """Заменяет содержимое буфера массивами (время в мс, матрица (n, 5) OHLCV по возрастанию)."""
+        count = min(len(timestamps), self.capacity)
+        if count == 0:
+            self.size = 0
+            self._position = -1
+            return
+        timestamps = timestamps[-count:]
+        columns = np.asarray(ohlcv[-count:], dtype=np.float64).T
+        self._timestamps[:count] = self._timestamps[self.capacity:self.capacity + count] = timestamps
+        self._ohlcv[:, :count] = columns
+        self._ohlcv[:, self.capacity:self.capacity + count] = columns
+        self.size = count
+        self._position = count - 1
+
+    def view(self) -> CandleView:
+        """Возвращает упорядоченные представления колонок без копирования."""
+        end = self._position + self.capacity + 1
+        start = end - self.size
+        ohlcv = self._ohlcv[:, start:end]
+        return CandleView(self._timestamps[start:end], *ohlcv)
+
+    def to_frame(self, copy: bool = True) -> pd.DataFrame:
+        """Возвращает DataFrame в формате get_latest_data.
+
+        При copy=False колонки ссылаются на память буфера и изменятся
+        при следующем append — используйте только для немедленного расчета.
+        """
+        if self.size == 0:
+            return pd.DataFrame()
+        view = self.view()
+        index = pd.to_datetime(view.timestamp, unit='ms')
+        index.name = 'timestamp'
+        columns = {name: (column.copy() if copy else column)
+                   for name, column in zip(OHLCV_COLUMNS, view[1:])}
+        return pd.DataFrame(columns, index=index, copy=False)
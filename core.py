@@ -1,10 +1,20 @@
 import asyncio
 import logging
 import time
-from globals import PAIRS, TIME_FRAMES, UPDATE_INTERVAL, BOT_ACTIVE
-from websocket import connect_binance_websocket, initialize_websocket_data_queues
-from signal_analyzer import analyze_pair_and_timeframe
-from database import init_db
+from globals import PAIRS, TIME_FRAMES, UPDATE_INTERVAL, BOT_ACTIVE, ANALYSIS_MODE, BACKFILL_ON_START
+from websocket import connect_binance_websocket, initialize_websocket_data_queues, gap_resync, get_websocket_stats
+from signal_analyzer import analyze_keys, analyze_provisional
+from database import init_db, start_db_writer, stop_db_writer, db_writer
+from scheduler import analysis_scheduler
+from analysis_executor import analysis_executor
+from backfill import backfill_missing_history, kline_backfiller
+from kline_decoder import kline_decoder
+from candle_aggregator import candle_aggregator
+from intra_candle import intra_candle_tracker
+from signal_resolver import signal_resolver
+from telegram_dispatcher import telegram_dispatcher
+from metrics import cycle_seconds, cycle_overruns_total
+from profiler import loop_profiler
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -14,6 +24,7 @@ class BinaryOptionsCoreEngine:
     
     def __init__(self):
         self.ws_task = None
+        self.resolver_task = None
         self.analysis_tasks = []
         self.is_initialized = False
     
@@ -26,6 +37,14 @@ class BinaryOptionsCoreEngine:
         
         # Инициализация БД
         init_db()
+        start_db_writer()
+        
+        # Догрузка недостающей истории из REST API
+        if BACKFILL_ON_START:
+            try:
+                await backfill_missing_history()
+            except Exception as e:
+                logger.error(f"Ошибка догрузки истории: {e}")
         
         # Инициализация очередей данных
         await initialize_websocket_data_queues()
@@ -35,6 +54,10 @@ class BinaryOptionsCoreEngine:
             self.ws_task = asyncio.create_task(connect_binance_websocket())
             logger.info("WebSocket задача запущена")
         
+        # Итоги сигналов по свечам экспирации
+        if not self.resolver_task:
+            self.resolver_task = asyncio.create_task(signal_resolver.run())
+        
         # Даем время на подключение и получение первых данных
         await asyncio.sleep(10)
         
@@ -50,15 +73,46 @@ class BinaryOptionsCoreEngine:
             except asyncio.CancelledError:
                 pass
         
+        if self.resolver_task and not self.resolver_task.done():
+            self.resolver_task.cancel()
+            try:
+                await self.resolver_task
+            except asyncio.CancelledError:
+                pass
+        
         for task in self.analysis_tasks:
             if not task.done():
                 task.cancel()
         
+        analysis_executor.shutdown()
+        
+        # Дописываем очередь записи на диск
+        stop_db_writer()
+        
+        # Следующий запуск заново поднимет WebSocket и писателя БД
+        self.ws_task = None
+        self.resolver_task = None
+        self.is_initialized = False
+        
         logger.info("Core Engine очищен")
 
 # Глобальный экземпляр движка
 core_engine = BinaryOptionsCoreEngine()
 
+async def run_analysis_batch(keys: list):
+    """Анализирует набор ключей pair_timeframe с батч-инференсом модели."""
+    try:
+        await analyze_keys(keys)
+    except Exception as e:
+        logger.error(f"Критическая ошибка в цикле анализа: {e}")
+
+def record_cycle(cycle_time: float):
+    """Длительность цикла в метрики; цикл дольше UPDATE_INTERVAL считается перерасходом."""
+    cycle_seconds.observe(cycle_time)
+    if cycle_time > UPDATE_INTERVAL:
+        cycle_overruns_total.inc()
+    loop_profiler.on_cycle()
+
 async def main_loop():
     """Основной цикл анализа для бинарных опционов."""
     global BOT_ACTIVE
@@ -68,8 +122,13 @@ async def main_loop():
     # Инициализация системы
     await core_engine.initialize()
     
+    if ANALYSIS_MODE == "event":
+        await event_loop()
+        return
+    
     cycle_count = 0
     total_signals_sent = 0
+    all_keys = [f"{pair}_{timeframe}" for pair in PAIRS for timeframe in TIME_FRAMES]
     
     try:
         while BOT_ACTIVE:
@@ -78,32 +137,11 @@ async def main_loop():
             
             logger.info(f"Цикл анализа #{cycle_count} - Анализ {len(PAIRS)} пар на {len(TIME_FRAMES)} таймфреймах")
             
-            # Создаем задачи для параллельного анализа
-            analysis_tasks = []
-            for pair in PAIRS:
-                for timeframe in TIME_FRAMES:
-                    task = asyncio.create_task(
-                        analyze_pair_and_timeframe(pair, timeframe)
-                    )
-                    analysis_tasks.append(task)
-            
-            # Выполняем все задачи параллельно
-            if analysis_tasks:
-                try:
-                    results = await asyncio.gather(*analysis_tasks, return_exceptions=True)
-                    
-                    # Подсчитываем результаты
-                    successful_analyses = sum(1 for r in results if not isinstance(r, Exception))
-                    errors = sum(1 for r in results if isinstance(r, Exception))
-                    
-                    if errors > 0:
-                        logger.warning(f"Ошибок в анализе: {errors}/{len(analysis_tasks)}")
-                    
-                except Exception as e:
-                    logger.error(f"Критическая ошибка в цикле анализа: {e}")
+            await run_analysis_batch(all_keys)
             
             # Рассчитываем время выполнения цикла
             cycle_time = time.time() - cycle_start_time
+            record_cycle(cycle_time)
             sleep_time = max(0, UPDATE_INTERVAL - cycle_time)
             
             # Логируем статистику цикла
@@ -122,6 +160,47 @@ async def main_loop():
         await core_engine.cleanup()
         logger.info("Основной цикл анализа завершен")
 
+async def event_loop():
+    """Событийный цикл: анализирует только ключи с новыми закрытыми свечами."""
+    logger.info("Событийный режим анализа: ожидание закрытых свечей")
+    analysis_scheduler.reset_stats()
+    
+    try:
+        while BOT_ACTIVE:
+            # Таймаут нужен, чтобы периодически проверять BOT_ACTIVE
+            keys = await analysis_scheduler.wait_for_keys(timeout=UPDATE_INTERVAL)
+            
+            # Предварительная оценка ключей с обновленной незакрытой свечой
+            provisional_keys = analysis_scheduler.take_provisional()
+            if provisional_keys:
+                try:
+                    await analyze_provisional(provisional_keys)
+                except Exception as e:
+                    logger.error(f"Ошибка предварительной оценки: {e}")
+            
+            if not keys:
+                continue
+            
+            cycle_start_time = time.time()
+            await run_analysis_batch(keys)
+            cycle_time = time.time() - cycle_start_time
+            record_cycle(cycle_time)
+            
+            stats = analysis_scheduler.get_stats()
+            if stats["cycles"] % 10 == 0:
+                logger.info(
+                    f"Статистика: Цикл #{stats['cycles']}, Ключей: {len(keys)}, Время: {cycle_time:.2f}с, "
+                    f"Сэкономлено анализов: {stats['analyses_avoided']} ({stats['avoided_ratio']:.1%})"
+                )
+    
+    except asyncio.CancelledError:
+        logger.info("Событийный цикл анализа отменен")
+    except Exception as e:
+        logger.error(f"Критическая ошибка в event_loop: {e}")
+    finally:
+        await core_engine.cleanup()
+        logger.info("Событийный цикл анализа завершен")
+
 async def emergency_stop():
     """Экстренная остановка всех процессов."""
     global BOT_ACTIVE
@@ -153,6 +232,18 @@ def get_system_status():
     return {
         "bot_active": BOT_ACTIVE,
         "initialized": core_engine.is_initialized,
-        "websocket_running": core_engine.ws_task is not None and not core_engine.ws_task.done()
+        "websocket_running": core_engine.ws_task is not None and not core_engine.ws_task.done(),
+        "analysis_mode": ANALYSIS_MODE,
+        "db_writer": db_writer.get_stats(),
+        "scheduler": analysis_scheduler.get_stats(),
+        "backfill": kline_backfiller.get_stats(),
+        "gap_resync": gap_resync.get_stats(),
+        "kline_decoder": kline_decoder.get_stats(),
+        "websocket": get_websocket_stats(),
+        "candle_aggregator": candle_aggregator.get_stats(),
+        "intra_candle": intra_candle_tracker.get_stats(),
+        "signal_resolver": signal_resolver.get_stats(),
+        "telegram_dispatcher": telegram_dispatcher.get_stats(),
+        "profiler": loop_profiler.get_stats()
     }
   
@@ -1,12 +1,303 @@
 import sqlite3
+import asyncio
 import logging
-from datetime import datetime
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from metrics import db_flush_seconds, db_rows_written_total
+from globals import (
+    DB_WRITE_BEHIND, DB_WRITE_QUEUE_SIZE, DB_FLUSH_INTERVAL, DB_FLUSH_MAX_OPS,
+    DB_READ_WORKERS, DB_READ_CACHE_TTL
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 DATABASE_NAME = "binary_options_bot.db"
 
+# PRAGMA для долгоживущего соединения писателя
+WRITER_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA busy_timeout=5000",
+)
+
+INSERT_HISTORICAL_SQL = """
+    INSERT OR REPLACE INTO historical_data 
+    (pair, timeframe, timestamp, open, high, low, close, volume)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+INSERT_SIGNAL_SQL = """
+    INSERT INTO binary_signals 
+    (pair, timeframe, signal_type, entry_time, expiry_time, 
+     probability, accuracy, entry_price, status, provisional)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Закрытая свеча подтвердила предварительный сигнал: строка начинает учитываться в статистике,
+# цена входа заменяется ценой закрытия (итог считается от закрытия свечи входа, как у обычных сигналов)
+CONFIRM_PROVISIONAL_SQL = """
+    UPDATE binary_signals SET provisional = 0, entry_price = ?,
+        status = CASE WHEN result IS NULL THEN 'SENT' ELSE status END
+    WHERE pair = ? AND timeframe = ? AND entry_time = ? AND provisional = 1
+"""
+
+# Закрытая свеча не подтвердила предварительный сигнал: итог CANCELLED, резолвер его не разрешает
+CANCEL_PROVISIONAL_SQL = """
+    UPDATE binary_signals SET status = 'CANCELLED', result = 'CANCELLED', profit_loss = 0
+    WHERE pair = ? AND timeframe = ? AND entry_time = ? AND provisional = 1 AND result IS NULL
+"""
+
+# Учет сигнала в статистике (при вставке и при подтверждении предварительного сигнала)
+_COUNT_SIGNAL_SQL = """
+        INSERT INTO statistics (date, total_signals, successful_signals, win_rate, total_profit)
+        VALUES (date(NEW.created_at, 'unixepoch'), 1, NEW.result IS 'WIN',
+                (NEW.result IS 'WIN') * 100.0, COALESCE(NEW.profit_loss, 0))
+        ON CONFLICT(date) DO UPDATE SET
+            total_signals = total_signals + 1,
+            successful_signals = successful_signals + excluded.successful_signals,
+            win_rate = (successful_signals + excluded.successful_signals) * 100.0 / (total_signals + 1),
+            total_profit = total_profit + excluded.total_profit;
+        INSERT INTO pair_statistics (pair, timeframe, total_signals, successful_signals, failed_signals, total_profit)
+        VALUES (NEW.pair, NEW.timeframe, 1, NEW.result IS 'WIN', NEW.result IS 'LOSS', COALESCE(NEW.profit_loss, 0))
+        ON CONFLICT(pair, timeframe) DO UPDATE SET
+            total_signals = total_signals + 1,
+            successful_signals = successful_signals + excluded.successful_signals,
+            failed_signals = failed_signals + excluded.failed_signals,
+            total_profit = total_profit + excluded.total_profit;
+"""
+
+# Предварительные сигналы (provisional = 1) в статистику не входят, пока их не подтвердит закрытая свеча
+STATISTICS_TRIGGERS_SQL = f"""
+    CREATE TRIGGER IF NOT EXISTS trg_binary_signals_insert_stats
+    AFTER INSERT ON binary_signals
+    WHEN NEW.provisional = 0
+    BEGIN{_COUNT_SIGNAL_SQL}    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_binary_signals_confirm_stats
+    AFTER UPDATE OF provisional ON binary_signals
+    WHEN OLD.provisional = 1 AND NEW.provisional = 0
+    BEGIN{_COUNT_SIGNAL_SQL}    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_binary_signals_resolve_stats
+    AFTER UPDATE OF result, profit_loss ON binary_signals
+    WHEN OLD.result IS NULL AND NEW.result IS NOT NULL AND NEW.provisional = 0
+    BEGIN
+        UPDATE statistics SET
+            successful_signals = successful_signals + (NEW.result IS 'WIN'),
+            win_rate = (successful_signals + (NEW.result IS 'WIN')) * 100.0 / total_signals,
+            total_profit = total_profit + COALESCE(NEW.profit_loss, 0)
+        WHERE date = date(NEW.created_at, 'unixepoch');
+        UPDATE pair_statistics SET
+            successful_signals = successful_signals + (NEW.result IS 'WIN'),
+            failed_signals = failed_signals + (NEW.result IS 'LOSS'),
+            total_profit = total_profit + COALESCE(NEW.profit_loss, 0)
+        WHERE pair = NEW.pair AND timeframe = NEW.timeframe;
+    END;
+"""
+
+class WriteBehindWriter:
+    """Единственный писатель SQLite с отложенной пакетной записью.
+    
+    Запросы складываются в ограниченную очередь, отдельный поток с постоянным
+    WAL-соединением забирает их и записывает одной транзакцией на окно сброса.
+    """
+    
+    _STOP = object()
+    
+    def __init__(self, db_name: str = DATABASE_NAME, max_queue: int = DB_WRITE_QUEUE_SIZE,
+                 flush_interval: float = DB_FLUSH_INTERVAL, max_ops: int = DB_FLUSH_MAX_OPS):
+        self.db_name = db_name
+        self.flush_interval = flush_interval
+        self.max_ops = max_ops
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+    
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self):
+        """Запускает поток писателя."""
+        if self.is_running:
+            return
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+        logger.info("Писатель БД запущен (WAL, отложенная запись)")
+    
+    def submit(self, sql: str, rows: list, timeout: float = 1.0) -> bool:
+        """Ставит executemany(sql, rows) в очередь.
+        
+        В потоке event loop не блокирует: при переполнении строки сразу отбрасываются.
+        В рабочих потоках (asyncio.to_thread, пул анализа) ждет timeout, затем отбрасывает.
+        """
+        try:
+            asyncio.get_running_loop()
+            on_loop = True
+        except RuntimeError:
+            on_loop = False
+        try:
+            if on_loop:
+                self._queue.put_nowait((sql, rows))
+            else:
+                self._queue.put((sql, rows), timeout=timeout)
+            return True
+        except queue.Full:
+            self.dropped += len(rows)
+            logger.error(f"Очередь записи переполнена, отброшено строк: {len(rows)}")
+            return False
+    
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Блокирует до записи всего, что было поставлено в очередь до вызова."""
+        if not self.is_running:
+            return True
+        done = threading.Event()
+        self._queue.put((None, done))
+        return done.wait(timeout)
+    
+    def stop(self, timeout: float = 10.0):
+        """Записывает остаток очереди и останавливает поток."""
+        if not self.is_running:
+            return
+        self._queue.put((self._STOP, None))
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            # Поток еще дописывает очередь — не теряем ссылку, чтобы не запустить второго писателя
+            logger.warning(f"Писатель БД не завершился за {timeout} с, запись продолжается")
+            return
+        self._thread = None
+        logger.info("Писатель БД остановлен")
+    
+    def get_stats(self) -> dict:
+        """Глубина очереди и задержка сброса."""
+        return {
+            "running": self.is_running,
+            "queue_depth": self._queue.qsize(),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "dropped_rows": self.dropped,
+            "errors": self.errors,
+            "last_flush_ms": self.last_flush_ms,
+            "avg_flush_ms": self._total_flush_ms / self.flushes if self.flushes else 0.0,
+            "max_flush_ms": self.max_flush_ms
+        }
+    
+    def _run(self):
+        conn = sqlite3.connect(self.db_name, isolation_level=None)
+        for pragma in WRITER_PRAGMAS:
+            conn.execute(pragma)
+        stopping = False
+        try:
+            while not stopping:
+                try:
+                    batch = [self._queue.get(timeout=self.flush_interval)]
+                except queue.Empty:
+                    continue
+                # Собираем все, что пришло в течение окна сброса
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.max_ops:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        batch.append(self._queue.get(timeout=max(0.0, remaining)) if remaining > 0
+                                     else self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                    if batch[-1][0] is self._STOP or batch[-1][0] is None:
+                        break
+                stopping = self._write_batch(conn, batch)
+            # Дописываем то, что успели добавить после сигнала остановки
+            remaining = []
+            while True:
+                try:
+                    remaining.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if remaining:
+                self._write_batch(conn, remaining)
+        finally:
+            conn.close()
+    
+    def _write_batch(self, conn: sqlite3.Connection, batch: list) -> bool:
+        """Пишет пакет одной транзакцией. Возвращает True, если получен сигнал остановки.
+        
+        Каждая группа пишется в своей точке сохранения: ошибка одного запроса
+        откатывает только его группу, остальные строки пакета фиксируются.
+        """
+        stopping = False
+        waiters = []
+        # Подряд идущие одинаковые запросы объединяем в один executemany
+        groups = []
+        for sql, rows in batch:
+            if sql is self._STOP:
+                stopping = True
+            elif sql is None:
+                waiters.append(rows)
+            elif groups and groups[-1][0] == sql:
+                groups[-1][1].extend(rows)
+            else:
+                groups.append((sql, list(rows)))
+        
+        if groups:
+            start = time.perf_counter()
+            try:
+                conn.execute("BEGIN")
+                written = 0
+                for sql, rows in groups:
+                    conn.execute("SAVEPOINT write_group")
+                    try:
+                        conn.executemany(sql, rows)
+                    except sqlite3.Error as e:
+                        self.errors += 1
+                        self.dropped += len(rows)
+                        logger.error(f"Ошибка записи группы в БД ({len(rows)} строк): {e}")
+                        conn.execute("ROLLBACK TO write_group")
+                    else:
+                        written += len(rows)
+                    conn.execute("RELEASE write_group")
+                conn.execute("COMMIT")
+                self.rows_written += written
+                db_rows_written_total.inc(written)
+            except sqlite3.Error as e:
+                self.errors += 1
+                logger.error(f"Ошибка пакетной записи в БД: {e}")
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.flushes += 1
+            self.last_flush_ms = elapsed_ms
+            self._total_flush_ms += elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            db_flush_seconds.observe(elapsed_ms / 1000)
+        
+        for done in waiters:
+            done.set()
+        return stopping
+
+# Глобальный писатель с отложенной записью
+db_writer = WriteBehindWriter()
+
+def start_db_writer():
+    """Запускает отложенную запись, если она включена в настройках."""
+    if DB_WRITE_BEHIND:
+        db_writer.start()
+
+def stop_db_writer():
+    """Сбрасывает очередь записи на диск и останавливает писателя."""
+    db_writer.stop()
+
 def init_db():
     """Инициализирует базу данных для бинарных опционов."""
     try:
@@ -43,9 +334,13 @@ def init_db():
                 status TEXT DEFAULT 'SENT',
                 result TEXT,
                 profit_loss REAL,
-                created_at INTEGER DEFAULT (strftime('%s', 'now'))
+                created_at INTEGER DEFAULT (strftime('%s', 'now')),
+                provisional INTEGER DEFAULT 0
             )
         """)
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(binary_signals)")}
+        if "provisional" not in columns:
+            cursor.execute("ALTER TABLE binary_signals ADD COLUMN provisional INTEGER DEFAULT 0")
 
         # Таблица статистики
         cursor.execute("""
@@ -60,6 +355,53 @@ def init_db():
             )
         """)
 
+        # Накопительная статистика по парам/таймфреймам
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS pair_statistics (
+                pair TEXT NOT NULL,
+                timeframe TEXT NOT NULL,
+                total_signals INTEGER DEFAULT 0,
+                successful_signals INTEGER DEFAULT 0,
+                failed_signals INTEGER DEFAULT 0,
+                total_profit REAL DEFAULT 0,
+                PRIMARY KEY (pair, timeframe)
+            )
+        """)
+
+        # Подписчики Telegram-рассылки
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS telegram_subscribers (
+                chat_id TEXT PRIMARY KEY,
+                username TEXT,
+                active INTEGER DEFAULT 1,
+                subscribed_at INTEGER DEFAULT (strftime('%s', 'now'))
+            )
+        """)
+
+        # Индексы: дневная статистика — поиск по ключу, сигналы — по диапазонам
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_statistics_date ON statistics(date)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_binary_signals_created_at ON binary_signals(created_at)")
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_binary_signals_pair_tf_entry
+            ON binary_signals(pair, timeframe, entry_time)
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_binary_signals_pending
+            ON binary_signals(entry_time) WHERE result IS NULL
+        """)
+
+        # Триггеры поддерживают статистику в той же транзакции, что и запись сигнала;
+        # пересоздаются, чтобы базы со старыми версиями получили условия по provisional
+        for trigger in ("trg_binary_signals_insert_stats", "trg_binary_signals_resolve_stats"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cursor.executescript(STATISTICS_TRIGGERS_SQL)
+
+        # Однократное заполнение статистики для уже существующих сигналов
+        has_signals = cursor.execute("SELECT 1 FROM binary_signals LIMIT 1").fetchone()
+        has_statistics = cursor.execute("SELECT 1 FROM statistics LIMIT 1").fetchone()
+        if has_signals and not has_statistics:
+            rebuild_statistics(conn)
+
         conn.commit()
         logger.info("База данных для бинарных опционов успешно инициализирована.")
     except sqlite3.Error as e:
@@ -68,26 +410,87 @@ def init_db():
         if conn:
             conn.close()
 
+def rebuild_statistics(conn: sqlite3.Connection):
+    """Пересчитывает таблицы статистики из binary_signals (полный проход, только для миграции)."""
+    conn.execute("DELETE FROM statistics")
+    conn.execute("DELETE FROM pair_statistics")
+    conn.execute("""
+        INSERT INTO statistics (date, total_signals, successful_signals, win_rate, total_profit)
+        SELECT date(created_at, 'unixepoch'), COUNT(*),
+               SUM(result IS 'WIN'),
+               SUM(result IS 'WIN') * 100.0 / COUNT(*),
+               COALESCE(SUM(profit_loss), 0)
+        FROM binary_signals
+        WHERE provisional = 0
+        GROUP BY date(created_at, 'unixepoch')
+    """)
+    conn.execute("""
+        INSERT INTO pair_statistics (pair, timeframe, total_signals, successful_signals, failed_signals, total_profit)
+        SELECT pair, timeframe, COUNT(*), SUM(result IS 'WIN'), SUM(result IS 'LOSS'),
+               COALESCE(SUM(profit_loss), 0)
+        FROM binary_signals
+        WHERE provisional = 0
+        GROUP BY pair, timeframe
+    """)
+    logger.info("Статистика пересчитана из binary_signals")
+
 def save_historical_data(pair: str, timeframe: str, data: list):
     """Сохраняет исторические данные."""
+    rows = [(pair, timeframe, int(d['timestamp']/1000), d['open'], 
+             d['high'], d['low'], d['close'], d['volume']) for d in data]
+    save_historical_rows(rows)
+
+def save_historical_rows(rows: list):
+    """Сохраняет готовые строки (pair, timeframe, timestamp_s, open, high, low, close, volume) одним пакетом."""
+    if not rows:
+        return
+    if db_writer.is_running:
+        db_writer.submit(INSERT_HISTORICAL_SQL, rows)
+        return
+    
     conn = None
     try:
         conn = sqlite3.connect(DATABASE_NAME)
         cursor = conn.cursor()
-        cursor.executemany("""
-            INSERT OR REPLACE INTO historical_data 
-            (pair, timeframe, timestamp, open, high, low, close, volume)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, [(pair, timeframe, int(d['timestamp']/1000), d['open'], 
-               d['high'], d['low'], d['close'], d['volume']) for d in data])
+        cursor.executemany(INSERT_HISTORICAL_SQL, rows)
         conn.commit()
-        logger.debug(f"Сохранено {len(data)} свечей для {pair}-{timeframe}")
+        logger.debug(f"Сохранено {len(rows)} свечей")
     except sqlite3.Error as e:
         logger.error(f"Ошибка сохранения данных: {e}")
     finally:
         if conn:
             conn.close()
 
+LATEST_TIMESTAMP_BRANCH_SQL = """
+    SELECT * FROM (
+        SELECT pair, timeframe, timestamp FROM historical_data
+        WHERE pair = ? AND timeframe = ?
+        ORDER BY timestamp DESC
+        LIMIT 1
+    )
+"""
+
+def load_latest_timestamps(pairs: list, timeframes: list, chunk_size: int = 100) -> dict:
+    """Время последней сохраненной свечи (мс) для каждого ключа, у которого есть история."""
+    keys = [(pair, timeframe) for pair in pairs for timeframe in timeframes]
+    result = {}
+    conn = None
+    try:
+        conn = sqlite3.connect(DATABASE_NAME)
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            sql = " UNION ALL ".join([LATEST_TIMESTAMP_BRANCH_SQL] * len(chunk))
+            params = [value for key in chunk for value in key]
+            for pair, timeframe, timestamp in conn.execute(sql, params):
+                result[f"{pair}_{timeframe}"] = timestamp * 1000
+        return result
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка чтения последних свечей: {e}")
+        return result
+    finally:
+        if conn:
+            conn.close()
+
 def load_historical_data(pair: str, timeframe: str, limit: int):
     """Загружает исторические данные."""
     conn = None
@@ -111,21 +514,96 @@ def load_historical_data(pair: str, timeframe: str, limit: int):
         if conn:
             conn.close()
 
+# Одна ветка UNION ALL на ключ: каждая — поиск по первичному ключу с LIMIT,
+# поэтому стоимость не зависит от длины истории (в отличие от ROW_NUMBER по всей таблице)
+BULK_HISTORY_BRANCH_SQL = """
+    SELECT * FROM (
+        SELECT pair, timeframe, timestamp, open, high, low, close, volume
+        FROM historical_data
+        WHERE pair = ? AND timeframe = ?
+        ORDER BY timestamp DESC
+        LIMIT ?
+    )
+"""
+
+BULK_HISTORY_SQL = "SELECT * FROM ({branches}) ORDER BY pair, timeframe, timestamp"
+
+def load_historical_data_bulk(pairs: list, timeframes: list, limit: int, chunk_size: int = 100) -> dict:
+    """Загружает последние limit свечей для всех пар/таймфреймов пакетными запросами.
+    
+    Возвращает {"PAIR_tf": (timestamps_ms int64[n], ohlcv float64[n, 5])}
+    в порядке возрастания времени. Ключи объединяются в запросы по chunk_size
+    (лимит составных SELECT в SQLite — 500).
+    """
+    keys = [(pair, timeframe) for pair in pairs for timeframe in timeframes]
+    result = {}
+    conn = None
+    try:
+        conn = sqlite3.connect(DATABASE_NAME)
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            # Порядок веток UNION ALL SQLite не гарантирует — сортируем явно
+            sql = BULK_HISTORY_SQL.format(branches=" UNION ALL ".join([BULK_HISTORY_BRANCH_SQL] * len(chunk)))
+            params = [value for pair, timeframe in chunk for value in (pair, timeframe, limit)]
+            rows = conn.execute(sql, params).fetchall()
+            if not rows:
+                continue
+            names = [f"{r[0]}_{r[1]}" for r in rows]
+            values = np.array([r[2:] for r in rows], dtype=np.float64)
+            # Режем массив на непрерывные группы ключей (внутри — по возрастанию времени)
+            bounds = [0] + [i for i in range(1, len(names)) if names[i] != names[i - 1]] + [len(names)]
+            for begin, end in zip(bounds, bounds[1:]):
+                group = values[begin:end]
+                result[names[begin]] = (group[:, 0].astype(np.int64) * 1000, np.ascontiguousarray(group[:, 1:]))
+        return result
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка пакетной загрузки данных: {e}")
+        return result
+    finally:
+        if conn:
+            conn.close()
+
+def load_historical_range(pair: str, timeframe: str, start_ms: int | None = None,
+                          end_ms: int | None = None) -> tuple:
+    """Свечи ключа с временем открытия в [start_ms, end_ms] по возрастанию времени.
+    
+    Возвращает (timestamps_ms int64[n], ohlcv float64[n, 5]), как load_historical_data_bulk.
+    """
+    conn = None
+    try:
+        conn = sqlite3.connect(DATABASE_NAME)
+        rows = conn.execute("""
+            SELECT timestamp, open, high, low, close, volume
+            FROM historical_data
+            WHERE pair = ? AND timeframe = ? AND timestamp BETWEEN ? AND ?
+            ORDER BY timestamp
+        """, (pair, timeframe, 0 if start_ms is None else start_ms // 1000,
+              2 ** 62 if end_ms is None else end_ms // 1000)).fetchall()
+        values = np.array(rows, dtype=np.float64).reshape(-1, 6)
+        return values[:, 0].astype(np.int64) * 1000, np.ascontiguousarray(values[:, 1:])
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка загрузки данных: {e}")
+        return np.empty(0, dtype=np.int64), np.empty((0, 5))
+    finally:
+        if conn:
+            conn.close()
+
 def save_binary_signal(pair: str, timeframe: str, signal_type: str, 
                       entry_time: int, expiry_time: str, probability: float, 
-                      accuracy: float, entry_price: float):
-    """Сохраняет сигнал бинарного опциона."""
+                      accuracy: float, entry_price: float, provisional: bool = False):
+    """Сохраняет сигнал бинарного опциона (provisional — по незакрытой свече)."""
+    row = (pair, timeframe, signal_type, entry_time, expiry_time, 
+           probability, accuracy, entry_price, "PROVISIONAL" if provisional else "SENT", int(provisional))
+    if db_writer.is_running:
+        if db_writer.submit(INSERT_SIGNAL_SQL, [row]):
+            logger.info(f"Сигнал поставлен в очередь записи: {pair}-{timeframe} {signal_type}")
+        return
+    
     conn = None
     try:
         conn = sqlite3.connect(DATABASE_NAME)
         cursor = conn.cursor()
-        cursor.execute("""
-            INSERT INTO binary_signals 
-            (pair, timeframe, signal_type, entry_time, expiry_time, 
-             probability, accuracy, entry_price, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (pair, timeframe, signal_type, entry_time, expiry_time, 
-              probability, accuracy, entry_price, "SENT"))
+        cursor.execute(INSERT_SIGNAL_SQL, row)
         conn.commit()
         logger.info(f"Сигнал сохранен: {pair}-{timeframe} {signal_type}")
     except sqlite3.Error as e:
@@ -134,27 +612,344 @@ def save_binary_signal(pair: str, timeframe: str, signal_type: str,
         if conn:
             conn.close()
 
-def get_daily_statistics():
-    """Получает статистику за день."""
+def confirm_provisional_signal(pair: str, timeframe: str, entry_time: int, entry_price: float):
+    """Переводит предварительный сигнал свечи в обычный (учитывается в статистике).
+    
+    entry_price — цена закрытия свечи входа вместо цены тика, по которому сигнал был отправлен.
+    """
+    params = (entry_price, pair, timeframe, entry_time)
+    if db_writer.is_running:
+        db_writer.submit(CONFIRM_PROVISIONAL_SQL, [params])
+        return
+    _execute_write(CONFIRM_PROVISIONAL_SQL, params, "Ошибка подтверждения сигнала")
+
+def cancel_provisional_signal(pair: str, timeframe: str, entry_time: int):
+    """Отменяет неподтвержденный предварительный сигнал свечи (в статистику не входит)."""
+    params = (pair, timeframe, entry_time)
+    if db_writer.is_running:
+        db_writer.submit(CANCEL_PROVISIONAL_SQL, [params])
+        return
+    _execute_write(CANCEL_PROVISIONAL_SQL, params, "Ошибка отмены сигнала")
+
+# Неразрешенные сигналы: первый запрос идет по частичному индексу idx_binary_signals_pending,
+# последующие — только новые строки по диапазону первичного ключа
+PENDING_SIGNALS_SQL = """
+    SELECT id, pair, timeframe, signal_type, entry_time, expiry_time, entry_price
+    FROM binary_signals
+    WHERE result IS NULL
+"""
+
+NEW_PENDING_SIGNALS_SQL = """
+    SELECT id, pair, timeframe, signal_type, entry_time, expiry_time, entry_price
+    FROM binary_signals
+    WHERE id > ? AND result IS NULL
+    ORDER BY id
+"""
+
+# Условие result IS NULL не дает повторно применить итог (и дважды учесть его триггером)
+RESOLVE_SIGNAL_SQL = """
+    UPDATE binary_signals SET result = ?, profit_loss = ?, status = ?
+    WHERE id = ? AND result IS NULL
+"""
+
+EXIT_PRICE_ROW_SQL = "(?, ?, ?)"
+
+EXIT_PRICES_SQL = """
+    WITH due(id, pair, timestamp) AS (VALUES {rows})
+    SELECT due.id, h.close, s.entry_price, s.result
+    FROM due
+    JOIN binary_signals s ON s.id = due.id
+    JOIN historical_data h
+      ON h.pair = due.pair AND h.timeframe = ? AND h.timestamp = due.timestamp
+"""
+
+def load_pending_signals(after_id: int | None = None) -> list:
+    """Неразрешенные сигналы (все или только с id > after_id).
+    
+    Строки: (id, pair, timeframe, signal_type, entry_time_ms, expiry_time, entry_price).
+    """
     conn = None
     try:
         conn = sqlite3.connect(DATABASE_NAME)
-        cursor = conn.cursor()
-        today = datetime.now().strftime('%Y-%m-%d')
-        cursor.execute("""
-            SELECT COUNT(*) as total, 
-                   SUM(CASE WHEN result = 'WIN' THEN 1 ELSE 0 END) as wins
-            FROM binary_signals 
-            WHERE date(created_at, 'unixepoch') = ?
-        """, (today,))
-        result = cursor.fetchone()
-        return result if result else (0, 0)
+        if after_id is None:
+            return conn.execute(PENDING_SIGNALS_SQL).fetchall()
+        return conn.execute(NEW_PENDING_SIGNALS_SQL, (after_id,)).fetchall()
     except sqlite3.Error as e:
-        logger.error(f"Ошибка получения статистики: {e}")
-        return (0, 0)
+        logger.error(f"Ошибка чтения неразрешенных сигналов: {e}")
+        return []
+    finally:
+        if conn:
+            conn.close()
+
+def load_exit_prices(requests: list, timeframe: str, chunk_size: int = 300) -> dict:
+    """Цены закрытия для пакета сигналов одним соединением.
+    
+    requests — список (signal_id, pair, open_timestamp_ms) свечи timeframe,
+    закрывающейся в момент экспирации. Возвращает {signal_id: (close, entry_price, result)}
+    с текущими ценой входа и итогом строки (подтверждение предварительного сигнала
+    меняет цену входа, отмена — итог); сигналы, свеча которых еще не сохранена,
+    в результат не попадают.
+    """
+    result = {}
+    conn = None
+    try:
+        conn = sqlite3.connect(DATABASE_NAME)
+        for start in range(0, len(requests), chunk_size):
+            chunk = requests[start:start + chunk_size]
+            sql = EXIT_PRICES_SQL.format(rows=", ".join([EXIT_PRICE_ROW_SQL] * len(chunk)))
+            params = [value for signal_id, pair, timestamp in chunk for value in (signal_id, pair, timestamp // 1000)]
+            result.update((row[0], row[1:]) for row in conn.execute(sql, params + [timeframe]))
+        return result
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка чтения цен экспирации: {e}")
+        return result
+    finally:
+        if conn:
+            conn.close()
+
+def save_signal_results(rows: list):
+    """Записывает итоги сигналов одной транзакцией. rows — (result, profit_loss, status, id)."""
+    if not rows:
+        return
+    if db_writer.is_running:
+        db_writer.submit(RESOLVE_SIGNAL_SQL, rows)
+        return
+    
+    conn = None
+    try:
+        conn = sqlite3.connect(DATABASE_NAME)
+        with conn:
+            conn.executemany(RESOLVE_SIGNAL_SQL, rows)
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка записи итогов сигналов: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+SAVE_SUBSCRIBER_SQL = """
+    INSERT INTO telegram_subscribers (chat_id, username, active) VALUES (?, ?, 1)
+    ON CONFLICT(chat_id) DO UPDATE SET username = COALESCE(excluded.username, username), active = 1
+"""
+
+def _execute_write(sql: str, params: tuple, error_message: str):
+    """Одиночная запись отдельным соединением (для редких операций вне горячего пути)."""
+    conn = None
+    try:
+        conn = sqlite3.connect(DATABASE_NAME)
+        with conn:
+            conn.execute(sql, params)
+    except sqlite3.Error as e:
+        logger.error(f"{error_message}: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+def save_subscriber(chat_id: str, username: str | None = None):
+    """Добавляет или повторно активирует подписчика рассылки."""
+    _execute_write(SAVE_SUBSCRIBER_SQL, (str(chat_id), username), "Ошибка сохранения подписчика")
+
+def deactivate_subscriber(chat_id: str):
+    """Отключает рассылку для чата (строка сохраняется)."""
+    _execute_write("UPDATE telegram_subscribers SET active = 0 WHERE chat_id = ?", (str(chat_id),),
+                   "Ошибка отключения подписчика")
+
+def load_subscribers() -> list:
+    """chat_id активных подписчиков."""
+    conn = None
+    try:
+        conn = sqlite3.connect(DATABASE_NAME)
+        return [row[0] for row in conn.execute("SELECT chat_id FROM telegram_subscribers WHERE active = 1")]
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка чтения подписчиков: {e}")
+        return []
     finally:
         if conn:
             conn.close()
 
+# Статистика читается из накопительных таблиц (поддерживаются триггерами),
+# даты — UTC, как date(created_at, 'unixepoch') в триггерах
+DAILY_STATISTICS_SQL = """
+    SELECT total_signals, successful_signals
+    FROM statistics
+    WHERE date = ?
+"""
+
+WEEKLY_STATISTICS_SQL = """
+    SELECT COALESCE(SUM(total_signals), 0), COALESCE(SUM(successful_signals), 0),
+           COALESCE(SUM(total_profit), 0)
+    FROM statistics
+    WHERE date > ?
+"""
+
+PAIR_STATISTICS_SQL = """
+    SELECT pair, timeframe, total_signals, successful_signals, failed_signals, total_profit
+    FROM pair_statistics
+    ORDER BY pair, timeframe
+"""
+
+def _utc_date(days_ago: int = 0) -> str:
+    """Дата UTC в формате YYYY-MM-DD (ключ таблицы statistics)."""
+    return (datetime.now(timezone.utc) - timedelta(days=days_ago)).strftime('%Y-%m-%d')
+
+def _pair_statistics_rows(rows: list) -> list:
+    """Строки pair_statistics в виде словарей с процентом выигрышей по решенным сигналам."""
+    result = []
+    for pair, timeframe, total, wins, losses, profit in rows:
+        resolved = wins + losses
+        result.append({
+            "pair": pair,
+            "timeframe": timeframe,
+            "total_signals": total,
+            "successful_signals": wins,
+            "failed_signals": losses,
+            "win_rate": wins / resolved * 100 if resolved else 0.0,
+            "total_profit": profit
+        })
+    return result
+
+class ReadPool:
+    """Пул read-only соединений SQLite на рабочих потоках для запросов из event loop.
+    
+    У каждого потока свое WAL-соединение (кэш подготовленных запросов живет
+    в соединении). Результаты кэшируются на короткий TTL, а одинаковые
+    одновременные запросы выполняются один раз.
+    """
+    
+    def __init__(self, db_name: str = DATABASE_NAME, workers: int = DB_READ_WORKERS,
+                 cache_ttl: float = DB_READ_CACHE_TTL):
+        self.db_name = db_name
+        self.workers = workers
+        self.cache_ttl = cache_ttl
+        self._executor = None
+        self._local = threading.local()
+        self._cache = {}
+        self._in_flight = {}
+        self.queries = 0
+        self.cache_hits = 0
+    
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.db_name}?mode=ro", uri=True, cached_statements=64)
+            conn.execute("PRAGMA query_only=ON")
+            self._local.conn = conn
+        return conn
+    
+    def _execute(self, sql: str, params: tuple) -> list:
+        return self._connection().execute(sql, params).fetchall()
+    
+    async def fetch(self, sql: str, params: tuple = (), use_cache: bool = True) -> list:
+        """Выполняет SELECT на рабочем потоке и возвращает все строки."""
+        key = (sql, params)
+        now = time.monotonic()
+        if use_cache:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] > now:
+                self.cache_hits += 1
+                return cached[1]
+            # Всплеск одинаковых запросов ждет один общий результат
+            pending = self._in_flight.get(key)
+            if pending is not None:
+                self.cache_hits += 1
+                return await asyncio.shield(pending)
+        
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="db-read")
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, self._execute, sql, params)
+        if use_cache:
+            self._in_flight[key] = future
+        try:
+            self.queries += 1
+            rows = await asyncio.shield(future)
+        finally:
+            if use_cache:
+                self._in_flight.pop(key, None)
+        if use_cache:
+            now = time.monotonic()
+            if len(self._cache) > 256:
+                self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+            self._cache[key] = (now + self.cache_ttl, rows)
+        return rows
+    
+    def invalidate(self):
+        """Сбрасывает кэш результатов."""
+        self._cache.clear()
+    
+    def get_stats(self) -> dict:
+        return {"queries": self.queries, "cache_hits": self.cache_hits, "cached_results": len(self._cache)}
+
+# Глобальный пул чтения
+read_pool = ReadPool()
+
+async def get_daily_statistics_async():
+    """Получает статистику за день, не блокируя event loop."""
+    try:
+        rows = await read_pool.fetch(DAILY_STATISTICS_SQL, (_utc_date(),))
+        return rows[0] if rows else (0, 0)
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка получения статистики: {e}")
+        return (0, 0)
+
+async def get_weekly_statistics_async():
+    """Статистика за последние 7 дней: (всего, выигрышей, прибыль)."""
+    try:
+        rows = await read_pool.fetch(WEEKLY_STATISTICS_SQL, (_utc_date(7),))
+        return rows[0] if rows else (0, 0, 0.0)
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка получения недельной статистики: {e}")
+        return (0, 0, 0.0)
+
+async def get_pair_statistics_async() -> list:
+    """Статистика по парам и таймфреймам."""
+    try:
+        return _pair_statistics_rows(await read_pool.fetch(PAIR_STATISTICS_SQL))
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка получения статистики по парам: {e}")
+        return []
+
+async def check_database_async() -> bool:
+    """Проверяет доступность БД через пул чтения."""
+    try:
+        await read_pool.fetch("SELECT 1", use_cache=False)
+        return True
+    except sqlite3.Error as e:
+        logger.error(f"БД недоступна: {e}")
+        return False
+
+def _fetch_statistics(sql: str, params: tuple = ()) -> list:
+    """Синхронное чтение статистики отдельным соединением."""
+    conn = sqlite3.connect(DATABASE_NAME)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+def get_daily_statistics():
+    """Получает статистику за день."""
+    try:
+        rows = _fetch_statistics(DAILY_STATISTICS_SQL, (_utc_date(),))
+        return rows[0] if rows else (0, 0)
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка получения статистики: {e}")
+        return (0, 0)
+
+def get_weekly_statistics():
+    """Статистика за последние 7 дней: (всего, выигрышей, прибыль)."""
+    try:
+        rows = _fetch_statistics(WEEKLY_STATISTICS_SQL, (_utc_date(7),))
+        return rows[0] if rows else (0, 0, 0.0)
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка получения недельной статистики: {e}")
+        return (0, 0, 0.0)
+
+def get_pair_statistics() -> list:
+    """Статистика по парам и таймфреймам."""
+    try:
+        return _pair_statistics_rows(_fetch_statistics(PAIR_STATISTICS_SQL))
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка получения статистики по парам: {e}")
+        return []
+
 if __name__ == "__main__":
     init_db()
@@ -0,0 +1,299 @@
+"""Локальная имитация REST API и combined stream Binance.
+
+Отдает /api/v3/klines с детерминированными синтетическими свечами,
+считает минутный вес запросов (X-MBX-USED-WEIGHT-1M) и отвечает 429
+с Retry-After при превышении лимита. WebSocket /stream?streams=...
+рассылает kline-сообщения (синтетические или записанные) с заданным темпом.
+
+Запуск:
+    python fake_exchange.py --port 8081 --weight-limit 1200
+    BINANCE_REST_BASE_URL=http://127.0.0.1:8081 BINANCE_WS_BASE_URL=ws://127.0.0.1:8081 python main.py
+"""
+import argparse
+import asyncio
+import json
+import math
+import time
+import zlib
+from aiohttp import web, WSCloseCode
+from globals import TIMEFRAME_MS
+from backfill import kline_weight
+
+MAX_LIMIT = 1000
+HOUR_MS = 3_600_000
+STREAM_STEP = 0.005  # Шаг рассылки WebSocket, секунд
+
+KLINE_MESSAGE = (
+    '{"stream":"%s","data":{"e":"kline","E":%d,"s":"%s","k":{"t":%d,"T":%d,"s":"%s","i":"%s",'
+    '"f":0,"L":0,"o":"%s","c":"%s","h":"%s","l":"%s","v":"%s","n":%d,"x":%s,'
+    '"q":"%s","V":"0","Q":"0","B":"0"}}}'
+)
+
+def synthetic_price(symbol: str, open_time: int) -> float:
+    """Детерминированная цена закрытия для символа и времени открытия свечи."""
+    base = 10 + zlib.crc32(symbol.encode()) % 1000
+    noise = (zlib.crc32(f"{symbol}:{open_time}".encode()) / 0xFFFFFFFF - 0.5) * 0.002
+    minutes = open_time / 60_000
+    return base * (1 + 0.02 * math.sin(minutes / 90) + 0.005 * math.sin(minutes / 7) + noise)
+
+def _minute_ohlcv(symbol: str, open_time: int) -> tuple:
+    """Минутная свеча — основа всех таймфреймов имитации."""
+    open_price = synthetic_price(symbol, open_time - 60_000)
+    close_price = synthetic_price(symbol, open_time)
+    spread = abs(close_price - open_price) + close_price * 0.0005
+    volume = 1 + zlib.crc32(f"v:{symbol}:{open_time}".encode()) % 1000
+    return (open_price, max(open_price, close_price) + spread / 2,
+            min(open_price, close_price) - spread / 2, close_price, float(volume))
+
+def synthetic_kline(symbol: str, interval: str, open_time: int) -> list:
+    """Свеча в формате /api/v3/klines; старшие таймфреймы согласованы с минутными, как на бирже."""
+    interval_ms = TIMEFRAME_MS[interval]
+    minutes = [_minute_ohlcv(symbol, t) for t in range(open_time, open_time + interval_ms, 60_000)]
+    open_price, close_price = minutes[0][0], minutes[-1][3]
+    high = max(m[1] for m in minutes)
+    low = min(m[2] for m in minutes)
+    volume = sum(m[4] for m in minutes)
+    return [
+        open_time, f"{open_price:.8f}", f"{high:.8f}", f"{low:.8f}", f"{close_price:.8f}", f"{volume:.8f}",
+        open_time + interval_ms - 1, f"{volume * close_price:.8f}", 100, "0", "0", "0"
+    ]
+
+def kline_message(stream: str, symbol: str, interval: str, kline: list, closed: bool,
+                  event_ms: int | None = None) -> str:
+    """Сообщение combined stream (компактный JSON, как на бирже) из свечи формата /api/v3/klines."""
+    event_ms = int(time.time() * 1000) if event_ms is None else event_ms
+    return KLINE_MESSAGE % (stream, event_ms, symbol, kline[0], kline[6], symbol, interval,
+                            kline[1], kline[4], kline[2], kline[3], kline[5], kline[8],
+                            "true" if closed else "false", kline[7])
+
+class FakeKlineStream:
+    """Имитация combined stream /stream?streams=a@kline_1m/b@kline_5m.
+
+    Время имитации идет в speed раз быстрее реального, начиная с sim_start_ms:
+    когда оно пересекает границу таймфрейма потока, отправляется закрытая
+    свеча (synthetic_kline, согласована с REST). Между ними — незакрытые тики,
+    rate сообщений в секунду на поток. С replay вместо синтетики по кругу
+    рассылаются записанные сообщения (JSON lines) подписанных потоков с тем же
+    темпом; время свечей сдвигается на каждом круге на replay_span. Поле E —
+    реальное время отправки (мс), по нему клиент считает задержку доставки.
+    """
+
+    def __init__(self, rate: float = 1.0, speed: float = 60.0, sim_start_ms: int | None = None,
+                 replay: list | None = None):
+        self.rate = rate
+        self.speed = speed
+        now_ms = int(time.time() * 1000)
+        self.sim_start_ms = sim_start_ms if sim_start_ms is not None else now_ms - now_ms % HOUR_MS + HOUR_MS
+        self.replay = replay
+        self.replay_span = replay_span(replay) if replay else None
+        self.stopped = False
+        self.connections = 0
+        self.ticks_sent = 0
+        self.closed_sent = 0
+        self.max_backlog = 0  # Наибольшее отставание от расписания, сообщений
+
+    async def handle(self, request: web.Request) -> web.WebSocketResponse:
+        streams = [stream for stream in request.query.get("streams", "").split("/") if "@kline_" in stream]
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        if self.stopped or not streams:
+            await ws.close(code=WSCloseCode.GOING_AWAY)
+            return ws
+        self.connections += 1
+        try:
+            if self.replay is not None:
+                await self._send_replay(ws, streams)
+            else:
+                await self._send_synthetic(ws, streams)
+        except ConnectionResetError:
+            pass
+        finally:
+            self.connections -= 1
+            if not ws.closed:
+                await ws.close()
+        return ws
+
+    def _record_backlog(self, backlog: int):
+        self.max_backlog = max(self.max_backlog, backlog)
+
+    async def _send_synthetic(self, ws: web.WebSocketResponse, streams: list):
+        parsed = []
+        for stream in streams:
+            symbol, _, interval = stream.partition("@kline_")
+            if interval in TIMEFRAME_MS:
+                parsed.append((stream, symbol.upper(), interval, TIMEFRAME_MS[interval]))
+        next_close = [self.sim_start_ms + step for _, _, _, step in parsed]
+        started = time.monotonic()
+        ticks = cursor = 0
+        while not ws.closed and not self.stopped:
+            elapsed = time.monotonic() - started
+            sim_ms = self.sim_start_ms + int(elapsed * self.speed * 1000)
+            for i, (stream, symbol, interval, step) in enumerate(parsed):
+                while next_close[i] <= sim_ms:
+                    kline = synthetic_kline(symbol, interval, next_close[i] - step)
+                    await ws.send_str(kline_message(stream, symbol, interval, kline, closed=True))
+                    self.closed_sent += 1
+                    next_close[i] += step
+            due = int(elapsed * self.rate * len(parsed))
+            self._record_backlog(due - ticks)
+            while ticks < due and not ws.closed:
+                i = cursor % len(parsed)
+                cursor += 1
+                stream, symbol, interval, step = parsed[i]
+                open_time = next_close[i] - step
+                price = f"{synthetic_price(symbol, sim_ms - sim_ms % 60_000):.8f}"
+                kline = [open_time, price, price, price, price, "0", open_time + step - 1, "0", 0]
+                await ws.send_str(kline_message(stream, symbol, interval, kline, closed=False))
+                ticks += 1
+                self.ticks_sent += 1
+            await asyncio.sleep(STREAM_STEP)
+
+    async def _send_replay(self, ws: web.WebSocketResponse, streams: list):
+        subscribed = set(streams)
+        messages = [message for message in self.replay if message.get("stream") in subscribed]
+        if not messages:
+            return
+        span = self.replay_span
+        started = time.monotonic()
+        sent = 0
+        while not ws.closed and not self.stopped:
+            due = int((time.monotonic() - started) * self.rate * len(subscribed))
+            self._record_backlog(due - sent)
+            while sent < due and not ws.closed:
+                message = messages[sent % len(messages)]
+                shift = sent // len(messages) * span
+                kline = dict(message["data"]["k"], t=message["data"]["k"]["t"] + shift,
+                             T=message["data"]["k"]["T"] + shift)
+                data = dict(message["data"], E=int(time.time() * 1000), k=kline)
+                await ws.send_str(json.dumps({"stream": message["stream"], "data": data}, separators=(",", ":")))
+                sent += 1
+                if kline["x"]:
+                    self.closed_sent += 1
+                else:
+                    self.ticks_sent += 1
+            await asyncio.sleep(STREAM_STEP)
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "connections": self.connections,
+            "ticks_sent": self.ticks_sent,
+            "closed_sent": self.closed_sent,
+            "max_backlog": self.max_backlog,
+            "sim_start_ms": self.sim_start_ms,
+            "stopped": self.stopped
+        })
+
+    async def stop(self, request: web.Request) -> web.Response:
+        """Прекращает рассылку: итоговые счетчики больше не меняются."""
+        self.stopped = True
+        return await self.stats(request)
+
+def replay_span(messages: list) -> int:
+    """Сдвиг времени между кругами replay, мс.
+
+    Непрерывный отрезок записи (от открытия первой свечи до закрытия последней),
+    округленный вверх до старшего таймфрейма записи: следующий круг продолжает
+    предыдущий без пропуска, свечи всех таймфреймов остаются выровненными.
+    """
+    klines = [message["data"]["k"] for message in messages]
+    start = min(kline["t"] for kline in klines)
+    end = max(kline["T"] for kline in klines) + 1
+    largest = max(TIMEFRAME_MS.get(kline["i"], 60_000) for kline in klines)
+    return -(-(end - start) // largest) * largest
+
+def load_replay(path: str) -> list:
+    """Записанные сообщения combined stream, по одному JSON в строке."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+class FakeExchange:
+    """Состояние имитации: учет веса по минутам и счетчики запросов."""
+
+    def __init__(self, weight_limit: int = 1200, latency: float = 0.0, retry_after: int | None = None):
+        self.weight_limit = weight_limit
+        self.latency = latency
+        self.retry_after = retry_after
+        self.used_weight = 0
+        self.minute = int(time.time() // 60)
+        self.requests = 0
+        self.rejected = 0
+
+    def _charge(self, weight: int) -> bool:
+        minute = int(time.time() // 60)
+        if minute != self.minute:
+            self.minute = minute
+            self.used_weight = 0
+        if self.used_weight + weight > self.weight_limit:
+            return False
+        self.used_weight += weight
+        return True
+
+    async def klines(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        query = request.query
+        symbol = query.get("symbol", "")
+        interval = query.get("interval", "")
+        if not symbol or interval not in TIMEFRAME_MS:
+            return web.json_response({"code": -1121, "msg": "Invalid symbol or interval."}, status=400)
+        limit = min(int(query.get("limit", 500)), MAX_LIMIT)
+        if not self._charge(kline_weight(limit)):
+            self.rejected += 1
+            retry_after = self.retry_after or math.ceil(60 - time.time() % 60)
+            return web.json_response({"code": -1003, "msg": "Too many requests."}, status=429,
+                                     headers={"Retry-After": str(retry_after),
+                                              "X-MBX-USED-WEIGHT-1M": str(self.used_weight)})
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        interval_ms = TIMEFRAME_MS[interval]
+        now_ms = int(time.time() * 1000)
+        end_time = int(query.get("endTime", now_ms))
+        if "startTime" in query:
+            start_time = int(query["startTime"])
+            first = -(-start_time // interval_ms) * interval_ms
+        else:
+            first = (end_time // interval_ms - limit + 1) * interval_ms
+        last = min(end_time, now_ms) // interval_ms * interval_ms
+        klines = [synthetic_kline(symbol, interval, open_time)
+                  for open_time in range(first, last + 1, interval_ms)[:limit]]
+        return web.json_response(klines, headers={"X-MBX-USED-WEIGHT-1M": str(self.used_weight)})
+
+def create_app(exchange: FakeExchange | None = None, stream: FakeKlineStream | None = None) -> web.Application:
+    """Приложение aiohttp с маршрутами /api/v3/klines и /stream."""
+    exchange = exchange or FakeExchange()
+    stream = stream or FakeKlineStream()
+    app = web.Application()
+    app["exchange"] = exchange
+    app["stream"] = stream
+    app.router.add_get("/api/v3/klines", exchange.klines)
+    app.router.add_get("/stream", stream.handle)
+    app.router.add_get("/stream/stats", stream.stats)
+    app.router.add_post("/stream/stop", stream.stop)
+    return app
+
+async def start_fake_exchange(host: str = "127.0.0.1", port: int = 8081, exchange: FakeExchange | None = None,
+                              stream: FakeKlineStream | None = None) -> web.AppRunner:
+    """Запускает имитацию в текущем event loop. Остановка: await runner.cleanup()."""
+    runner = web.AppRunner(create_app(exchange, stream))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--weight-limit", type=int, default=1200, help="лимит веса в минуту")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, секунд")
+    parser.add_argument("--ws-rate", type=float, default=1.0, help="сообщений WebSocket в секунду на поток")
+    parser.add_argument("--ws-speed", type=float, default=60.0, help="ускорение времени синтетических свечей")
+    parser.add_argument("--ws-start", type=int, help="время открытия первой свечи потока, мс")
+    parser.add_argument("--ws-replay", help="записанные сообщения combined stream (JSON lines)")
+    args = parser.parse_args()
+    exchange = FakeExchange(args.weight_limit, args.latency)
+    stream = FakeKlineStream(args.ws_rate, args.ws_speed, args.ws_start,
+                             load_replay(args.ws_replay) if args.ws_replay else None)
+    web.run_app(create_app(exchange, stream), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -7,13 +7,44 @@ load_dotenv()
 # **Конфигурация Telegram Bot API**
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "YOUR_TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID", "")
+TELEGRAM_QUEUE_SIZE = 1000         # Очередь исходящих сообщений; при переполнении новые отбрасываются
+TELEGRAM_SEND_CONCURRENCY = 8      # Одновременных запросов к Bot API
+TELEGRAM_GLOBAL_RATE = 25          # Сообщений в секунду на бота (лимит Telegram — около 30)
+TELEGRAM_CHAT_INTERVAL = 1.0       # Минимальный интервал между сообщениями в один чат, секунд
+TELEGRAM_MAX_RETRIES = 3           # Повторов отправки при ошибке
+TELEGRAM_RETRY_DELAY = 1.0         # Базовая задержка повтора (растет экспоненциально), секунд
+TELEGRAM_COALESCE_SIGNALS = True   # Объединять сигналы одного цикла в одно сообщение
+TELEGRAM_COALESCE_WINDOW = 0.5     # Окно объединения, секунд
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096 # Лимит длины сообщения Bot API
 
 # **Конфигурация WebSocket Binance**
-BINANCE_WS_BASE_URL = "wss://stream.binance.com:9443/ws"
+BINANCE_WS_BASE_URL = os.getenv("BINANCE_WS_BASE_URL", "wss://stream.binance.com:9443")
+WS_SHARD_COUNT = 1                   # Соединений WebSocket (минимум; растет по лимиту потоков)
+WS_MAX_STREAMS_PER_CONNECTION = 200  # Потоков на соединение (Binance допускает до 1024)
+WS_RECONNECT_DELAY = 1               # Начальная задержка переподключения, секунд
+WS_MAX_RECONNECT_DELAY = 30          # Максимальная задержка переподключения, секунд
+CANDLE_AGGREGATION = False           # True — подписка только на 1m, старшие таймфреймы собираются локально
+KLINE_DECODER_BACKEND = "auto"  # "auto", "msgspec", "orjson" или "json"
+
+# **Конфигурация REST API Binance (догрузка истории)**
+BINANCE_REST_BASE_URL = os.getenv("BINANCE_REST_BASE_URL", "https://api.binance.com")
+BACKFILL_ON_START = True        # Догружать недостающую историю при старте
+BACKFILL_CANDLES = 200          # Глубина догрузки на ключ, свечей
+BACKFILL_CONCURRENCY = 8        # Одновременных запросов к REST API
+BACKFILL_WEIGHT_LIMIT = 6000    # Лимит веса запросов в минуту (X-MBX-USED-WEIGHT-1M)
+BACKFILL_WEIGHT_RESERVE = 0.2   # Доля лимита, которую оставляем свободной
+BACKFILL_PAGE_LIMIT = 1000      # Максимум свечей в одном запросе /api/v3/klines
+GAP_RESYNC_BATCH_WINDOW = 0.5   # Окно сбора пропусков в один пакет догрузки, секунд
 
 # **Конфигурация для бинарных опционов**
 PAIRS = ["BTCUSDT", "ETHUSDT", "BNBUSDT", "XRPUSDT", "SOLUSDT", "ADAUSDT", "DOGEUSDT"]
 TIME_FRAMES = ["1m", "5m", "15m", "30m", "1h"]  # Оптимизировано для бинарных опционов
+# Длительность таймфрейма в миллисекундах (шаг между свечами)
+TIMEFRAME_MS = {
+    "1m": 60_000, "3m": 180_000, "5m": 300_000, "15m": 900_000, "30m": 1_800_000,
+    "1h": 3_600_000, "2h": 7_200_000, "4h": 14_400_000, "6h": 21_600_000,
+    "8h": 28_800_000, "12h": 43_200_000, "1d": 86_400_000
+}
 EXPIRY_TIMES = {
     "1m": "1m",
     "5m": "5m", 
@@ -24,10 +55,21 @@ EXPIRY_TIMES = {
 
 # **Параметры анализа для бинарных опционов**
 UPDATE_INTERVAL = 5  # Ускорено для бинарных опционов
+ANALYSIS_MODE = "event"  # "event" — по закрытию свечи, "poll" — опрос каждые UPDATE_INTERVAL
+ANALYSIS_EXECUTOR = "thread"  # "inline", "thread" или "process"
+ANALYSIS_WORKERS = 4          # Потоков/процессов для анализа
 CANDLE_COUNT = 30    # Уменьшено для быстрого анализа
 MIN_ACCURACY_THRESHOLD = 0.85
 
+# **Режим расчета индикаторов**
+INDICATOR_MODE = "streaming"  # "streaming" — инкрементально, "batch" — полный пересчет
+INDICATOR_WARMUP_CANDLES = 200  # Свечей для прогрева потокового движка
+STREAMING_FEATURE_ROWS = 5      # Строк признаков, хранимых движком
+INTRA_CANDLE_EVALUATION = False  # Предварительная оценка по тикам незакрытой свечи (только streaming)
+INTRA_CANDLE_MIN_INTERVAL = 5.0  # Не чаще одной предварительной оценки ключа за столько секунд
+
 # **Параметры индикаторов**
+VWAP_PERIOD = 20  # Скользящее окно VWAP, свечей (одинаково в batch и streaming)
 RSI_PERIOD = 14
 MACD_FAST_PERIOD = 12
 MACD_SLOW_PERIOD = 26
@@ -43,6 +85,15 @@ STOCH_SMOOTH_K_PERIOD = 3
 
 # **Параметры ИИ-модели**
 AI_MODEL_PATH = "model.pkl"
+MODEL_SERVING_MODE = "native"  # "native" — LightGBM, "compiled" — плоские массивы узлов
+
+# **Параметры базы данных**
+DB_WRITE_BEHIND = True      # Отложенная пакетная запись через отдельный поток
+DB_WRITE_QUEUE_SIZE = 10000 # Максимум операций в очереди записи
+DB_FLUSH_INTERVAL = 0.5     # Окно сброса, секунд
+DB_FLUSH_MAX_OPS = 2000     # Максимум операций в одной транзакции
+DB_READ_WORKERS = 2         # Потоков с read-only соединениями для API/Telegram
+DB_READ_CACHE_TTL = 2.0     # TTL кэша результатов чтения, секунд
 
 # **Системные флаги**
 BOT_ACTIVE = False
@@ -55,6 +106,16 @@ RISK_MANAGEMENT = {
     "min_time_between_signals": 30,  # секунд
     "volatility_filter": True
 }
+BINARY_OPTION_PAYOUT = 0.85  # Выплата за выигрыш в долях ставки, проигрыш — минус ставка
+SIGNAL_RESOLVER_INTERVAL = 5   # Максимальный интервал проверки новых и истекших сигналов, секунд
+SIGNAL_RESOLVE_DELAY = 5       # Ожидание после экспирации, пока свеча закроется и запишется, секунд
+SIGNAL_RESOLVE_TIMEOUT = 600   # Без свечи экспирации дольше этого сигнал помечается VOID, секунд
+
+# **Профилирование по запросу (/admin/profile)**
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN", "")  # Если задан, требуется заголовок X-Admin-Token
+PROFILER_SAMPLE_INTERVAL = 0.005  # Интервал выборки стека, секунд
+PROFILER_DEFAULT_SECONDS = 10     # Длительность по умолчанию, секунд
+PROFILER_MAX_SECONDS = 300        # Верхняя граница сеанса, секунд
 
 # **Логирование**
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
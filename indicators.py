@@ -4,20 +4,29 @@ import numpy as np
 import logging
 from globals import *
 
+try:
+    from numba import njit
+except ImportError:  # numba — необязательное ускорение
+    njit = None
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def calculate_vwap(df: pd.DataFrame) -> pd.Series:
-    """Рассчитывает VWAP для бинарных опционов."""
+    """Рассчитывает VWAP для бинарных опционов по скользящему окну VWAP_PERIOD свечей.
+    
+    Окно не зависит от длины поданной истории, поэтому потоковый движок
+    после многих часов работы дает те же значения, что и пересчет окна.
+    """
     if 'close' not in df.columns or 'volume' not in df.columns:
         return pd.Series(np.nan, index=df.index)
     
     # Типичная цена
     typical_price = (df['high'] + df['low'] + df['close']) / 3
     price_volume = typical_price * df['volume']
-    cumulative_price_volume = price_volume.cumsum()
-    cumulative_volume = df['volume'].cumsum()
-    vwap = cumulative_price_volume / cumulative_volume
+    window_price_volume = price_volume.rolling(VWAP_PERIOD, min_periods=1).sum()
+    window_volume = df['volume'].rolling(VWAP_PERIOD, min_periods=1).sum()
+    vwap = window_price_volume / window_volume
     
     return vwap.fillna(method='ffill')
 
@@ -40,46 +49,63 @@ def calculate_rsi(df: pd.DataFrame) -> pd.Series:
         return pd.Series(np.nan, index=df.index)
     return talib.RSI(df['close'], timeperiod=RSI_PERIOD)
 
+def _supertrend_kernel(close, basic_upper, basic_lower, out):
+    """Рекуррентное ядро Supertrend над массивами (или списками) значений."""
+    n = len(close)
+    if n == 0:
+        return out
+    final_upper = basic_upper[0]
+    final_lower = basic_lower[0]
+    supertrend = final_upper if close[0] <= final_upper else final_lower
+    out[0] = supertrend
+    for i in range(1, n):
+        prev_upper = final_upper
+        prev_lower = final_lower
+        prev_close = close[i - 1]
+        upper = basic_upper[i]
+        lower = basic_lower[i]
+        final_upper = (prev_upper if prev_upper > upper else upper) if prev_close > prev_upper else upper
+        final_lower = (prev_lower if prev_lower < lower else lower) if prev_close < prev_lower else lower
+        if supertrend == prev_upper and close[i] <= final_upper:
+            supertrend = final_upper
+        elif supertrend == prev_upper and close[i] > final_upper:
+            supertrend = final_lower
+        elif supertrend == prev_lower and close[i] >= final_lower:
+            supertrend = final_lower
+        else:
+            supertrend = final_upper
+        out[i] = supertrend
+    return out
+
+if njit is not None:
+    _supertrend_kernel_jit = njit(cache=True, nogil=True)(_supertrend_kernel)
+else:
+    _supertrend_kernel_jit = None
+
+def supertrend_array(high: np.ndarray, low: np.ndarray, close: np.ndarray, atr: np.ndarray,
+                     multiplier: float = SUPERTREND_MULTIPLIER) -> np.ndarray:
+    """Рассчитывает Supertrend над NumPy-массивами."""
+    hl2 = (high + low) / 2
+    basic_upper = hl2 + (multiplier * atr)
+    basic_lower = hl2 - (multiplier * atr)
+    if _supertrend_kernel_jit is not None:
+        return _supertrend_kernel_jit(close, basic_upper, basic_lower, np.empty(len(close)))
+    # Без numba цикл по спискам Python быстрее скалярной индексации NumPy
+    out = [np.nan] * len(close)
+    _supertrend_kernel(close.tolist(), basic_upper.tolist(), basic_lower.tolist(), out)
+    return np.array(out, dtype=np.float64)
+
 def calculate_supertrend(df: pd.DataFrame) -> pd.Series:
     """Рассчитывает Supertrend для бинарных опционов."""
     if not all(col in df.columns for col in ['high', 'low', 'close']):
         return pd.Series(np.nan, index=df.index)
 
-    atr = talib.ATR(df['high'], df['low'], df['close'], timeperiod=SUPERTREND_PERIOD)
-    hl2 = (df['high'] + df['low']) / 2
-    
-    basic_upper_band = hl2 + (SUPERTREND_MULTIPLIER * atr)
-    basic_lower_band = hl2 - (SUPERTREND_MULTIPLIER * atr)
-    
-    final_upper_band = basic_upper_band.copy()
-    final_lower_band = basic_lower_band.copy()
-    
-    for i in range(1, len(df)):
-        if df['close'].iloc[i-1] > final_upper_band.iloc[i-1]:
-            final_upper_band.iloc[i] = max(basic_upper_band.iloc[i], final_upper_band.iloc[i-1])
-        else:
-            final_upper_band.iloc[i] = basic_upper_band.iloc[i]
-            
-        if df['close'].iloc[i-1] < final_lower_band.iloc[i-1]:
-            final_lower_band.iloc[i] = min(basic_lower_band.iloc[i], final_lower_band.iloc[i-1])
-        else:
-            final_lower_band.iloc[i] = basic_lower_band.iloc[i]
-    
-    supertrend = pd.Series(np.nan, index=df.index)
-    for i in range(len(df)):
-        if i == 0:
-            supertrend.iloc[i] = final_upper_band.iloc[i] if df['close'].iloc[i] <= final_upper_band.iloc[i] else final_lower_band.iloc[i]
-        else:
-            if supertrend.iloc[i-1] == final_upper_band.iloc[i-1] and df['close'].iloc[i] <= final_upper_band.iloc[i]:
-                supertrend.iloc[i] = final_upper_band.iloc[i]
-            elif supertrend.iloc[i-1] == final_upper_band.iloc[i-1] and df['close'].iloc[i] > final_upper_band.iloc[i]:
-                supertrend.iloc[i] = final_lower_band.iloc[i]
-            elif supertrend.iloc[i-1] == final_lower_band.iloc[i-1] and df['close'].iloc[i] >= final_lower_band.iloc[i]:
-                supertrend.iloc[i] = final_lower_band.iloc[i]
-            else:
-                supertrend.iloc[i] = final_upper_band.iloc[i]
-    
-    return supertrend
+    high = df['high'].to_numpy(dtype=np.float64)
+    low = df['low'].to_numpy(dtype=np.float64)
+    close = df['close'].to_numpy(dtype=np.float64)
+    atr = talib.ATR(high, low, close, timeperiod=SUPERTREND_PERIOD)
+
+    return pd.Series(supertrend_array(high, low, close, atr), index=df.index)
 
 def calculate_bollinger_bands(df: pd.DataFrame) -> tuple:
     """Рассчитывает Bollinger Bands."""
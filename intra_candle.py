@@ -0,0 +1,64 @@
+import logging
+import time
+from globals import INTRA_CANDLE_MIN_INTERVAL
+from kline_decoder import KlineRecord, kline_decoder, stream_key
+from scheduler import analysis_scheduler
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class IntraCandleTracker:
+    """Предварительные (незакрытые) свечи для промежуточной оценки сигналов.
+
+    Тики незакрытых свечей разбираются не чаще INTRA_CANDLE_MIN_INTERVAL на ключ:
+    ключ определяется по имени потока без разбора JSON, лишние тики
+    отбрасываются сразу. Последняя принятая свеча ключа хранится до закрытия.
+    """
+
+    def __init__(self, min_interval: float = INTRA_CANDLE_MIN_INTERVAL):
+        self.min_interval = min_interval
+        self.provisional = {}   # key -> KlineRecord
+        self._last_update = {}  # key -> time.monotonic() последнего принятого тика
+        self.ticks = 0
+        self.throttled = 0
+        self.updates = 0
+
+    def on_tick(self, raw: str | bytes) -> str | None:
+        """Обрабатывает тик незакрытой свечи; возвращает ключ, если он поставлен на оценку."""
+        self.ticks += 1
+        now = time.monotonic()
+        stream = kline_decoder.stream_name(raw) if isinstance(raw, str) else None
+        if stream is not None:
+            last = self._last_update.get(stream_key(stream))
+            if last is not None and now - last < self.min_interval:
+                self.throttled += 1
+                return None
+        record = kline_decoder.decode_unclosed(raw)
+        if record is None:
+            return None
+        key = f"{record.symbol}_{record.interval}"
+        self._last_update[key] = now
+        self.provisional[key] = record
+        self.updates += 1
+        analysis_scheduler.mark_provisional(key)
+        return key
+
+    def on_closed(self, key: str, timestamp: int):
+        """Закрытая свеча заменяет предварительную."""
+        record = self.provisional.get(key)
+        if record is not None and record.timestamp <= timestamp:
+            del self.provisional[key]
+
+    def get(self, key: str) -> KlineRecord | None:
+        return self.provisional.get(key)
+
+    def get_stats(self) -> dict:
+        return {
+            "ticks": self.ticks,
+            "throttled": self.throttled,
+            "updates": self.updates,
+            "provisional_keys": len(self.provisional)
+        }
+
+# Глобальный трекер незакрытых свечей
+intra_candle_tracker = IntraCandleTracker()
@@ -0,0 +1,165 @@
+import json
+import logging
+from typing import NamedTuple
+from globals import KLINE_DECODER_BACKEND
+
+try:
+    import orjson
+except ImportError:  # orjson — необязательное ускорение
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # msgspec — необязательное ускорение
+    msgspec = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DECODER_BACKENDS = ("auto", "msgspec", "orjson", "json")
+
+# Незакрытые свечи (большинство сообщений) отбрасываются поиском подстроки без разбора JSON
+UNCLOSED_MARKER = '"x":false'
+UNCLOSED_MARKER_BYTES = UNCLOSED_MARKER.encode()
+STREAM_PREFIX = '{"stream":"'
+
+class KlineRecord(NamedTuple):
+    """Компактная закрытая свеча из сообщения kline (timestamp — время открытия в мс)."""
+    symbol: str
+    interval: str
+    timestamp: int
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+
+    def as_candle(self) -> dict:
+        """Свеча в формате словаря, как в database и candle_buffer."""
+        return {"timestamp": self.timestamp, "open": self.open, "high": self.high,
+                "low": self.low, "close": self.close, "volume": self.volume}
+
+if msgspec is not None:
+    class _Kline(msgspec.Struct):
+        t: int
+        s: str
+        i: str
+        o: str
+        h: str
+        l: str
+        c: str
+        v: str
+        x: bool
+
+    class _KlineEvent(msgspec.Struct):
+        k: _Kline | None = None
+
+    class _CombinedMessage(msgspec.Struct):
+        data: _KlineEvent | None = None
+        # Одиночный поток (/ws/<stream>) присылает событие без обертки
+        k: _Kline | None = None
+
+def stream_key(stream: str) -> str:
+    """btcusdt@kline_1m -> BTCUSDT_1m"""
+    symbol, _, interval = stream.partition("@kline_")
+    return f"{symbol.upper()}_{interval}"
+
+def _record_from_dict(kline: dict) -> KlineRecord:
+    return KlineRecord(kline['s'], kline['i'], int(kline['t']), float(kline['o']), float(kline['h']),
+                       float(kline['l']), float(kline['c']), float(kline['v']))
+
+class KlineDecoder:
+    """Разбор сообщений kline для горячего пути WebSocket.
+
+    Незакрытые свечи отбрасываются без разбора JSON, закрытые разбираются
+    msgspec (только нужные поля в типизированные структуры), orjson или
+    стандартным json — в зависимости от того, что установлено.
+    """
+
+    def __init__(self, backend: str = KLINE_DECODER_BACKEND):
+        if backend not in DECODER_BACKENDS:
+            raise ValueError(f"Неизвестный декодер: {backend}")
+        if backend == "auto":
+            backend = "msgspec" if msgspec is not None else "orjson" if orjson is not None else "json"
+        if backend == "msgspec" and msgspec is None or backend == "orjson" and orjson is None:
+            raise ValueError(f"Декодер {backend} не установлен")
+        self.backend = backend
+        self._errors = (ValueError, KeyError, TypeError)
+        if backend == "msgspec":
+            self._errors += (msgspec.DecodeError,)
+            self._decoder = msgspec.json.Decoder(_CombinedMessage)
+            self._parse = self._parse_msgspec
+        else:
+            self._loads = orjson.loads if backend == "orjson" else json.loads
+            self._parse = self._parse_dict
+        self.messages = 0
+        self.rejected = 0
+        self.decoded = 0
+        self.errors = 0
+
+    @staticmethod
+    def is_unclosed(raw: str | bytes) -> bool:
+        """Быстрая проверка без разбора: сообщение о незакрытой свече."""
+        return (UNCLOSED_MARKER if isinstance(raw, str) else UNCLOSED_MARKER_BYTES) in raw
+
+    @staticmethod
+    def stream_name(raw: str) -> str | None:
+        """Имя потока combined stream (btcusdt@kline_1m) без разбора JSON."""
+        if not raw.startswith(STREAM_PREFIX):
+            return None
+        end = raw.find('"', len(STREAM_PREFIX))
+        return raw[len(STREAM_PREFIX):end] if end > 0 else None
+
+    def decode(self, raw: str | bytes) -> KlineRecord | None:
+        """Возвращает KlineRecord для закрытой свечи, иначе None."""
+        self.messages += 1
+        if self.is_unclosed(raw):
+            self.rejected += 1
+            return None
+        return self._decode(raw, closed_only=True)
+
+    def decode_unclosed(self, raw: str | bytes) -> KlineRecord | None:
+        """Разбирает сообщение о свече независимо от ее закрытия (для предварительной оценки)."""
+        self.messages += 1
+        return self._decode(raw, closed_only=False)
+
+    def _decode(self, raw, closed_only: bool) -> KlineRecord | None:
+        try:
+            record = self._parse(raw, closed_only)
+        except self._errors as e:
+            self.errors += 1
+            logger.warning(f"Ошибка разбора сообщения WebSocket: {e}")
+            return None
+        if record is None:
+            self.rejected += 1
+        else:
+            self.decoded += 1
+        return record
+
+    def _parse_dict(self, raw, closed_only: bool) -> KlineRecord | None:
+        message = self._loads(raw)
+        event = message.get('data', message) if isinstance(message, dict) else None
+        kline = event.get('k') if isinstance(event, dict) else None
+        if not kline or closed_only and not kline['x']:
+            return None
+        return _record_from_dict(kline)
+
+    def _parse_msgspec(self, raw, closed_only: bool) -> KlineRecord | None:
+        message = self._decoder.decode(raw)
+        kline = message.data.k if message.data is not None else message.k
+        if kline is None or closed_only and not kline.x:
+            return None
+        return KlineRecord(kline.s, kline.i, kline.t, float(kline.o), float(kline.h),
+                           float(kline.l), float(kline.c), float(kline.v))
+
+    def get_stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "messages": self.messages,
+            "rejected": self.rejected,
+            "decoded": self.decoded,
+            "errors": self.errors
+        }
+
+# Глобальный декодер сообщений kline
+kline_decoder = KlineDecoder()
@@ -1,14 +1,20 @@
 import uvicorn
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import JSONResponse, Response, PlainTextResponse
 import asyncio
 import logging
 from datetime import datetime
 import os
-from globals import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, PAIRS, TIME_FRAMES
+from globals import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, PAIRS, TIME_FRAMES, PROFILER_TOKEN
 from core import main_loop, get_system_status
 from telegram import start_telegram_bot, stop_telegram_bot, send_telegram_message
-from database import init_db, get_daily_statistics
+from telegram_dispatcher import telegram_dispatcher
+from metrics import metrics_registry
+from profiler import loop_profiler
+from database import (
+    init_db, get_daily_statistics_async, get_weekly_statistics_async,
+    get_pair_statistics_async, check_database_async
+)
 from bot_control import (
     start_bot_analysis, stop_bot_analysis, restart_bot_analysis,
     get_bot_status, get_bot_statistics
@@ -51,6 +57,9 @@ async def startup_event():
         init_db()
         logger.info("✅ База данных инициализирована")
         
+        # Рассылка запускается до бота: ей нужен только Bot API
+        await telegram_dispatcher.start()
+        
         # Запуск Telegram бота
         telegram_bot_task = asyncio.create_task(start_telegram_bot())
         logger.info("✅ Telegram бот запущен")
@@ -110,6 +119,9 @@ async def shutdown_event():
             shutdown_message = "🛑 Binary Options Bot остановлен"
             await send_telegram_message(shutdown_message)
         
+        # Дожидаемся доставки очереди рассылки
+        await telegram_dispatcher.stop()
+        
         logger.info("✅ Binary Options Bot остановлен")
         
     except Exception as e:
@@ -133,7 +145,8 @@ async def root():
             "statistics": "/statistics",
             "start": "/start",
             "stop": "/stop",
-            "restart": "/restart"
+            "restart": "/restart",
+            "metrics": "/metrics"
         }
     }
 
@@ -163,11 +176,16 @@ async def get_statistics():
     """Возвращает статистику работы бота."""
     try:
         bot_stats = await get_bot_statistics()
-        total_signals, wins = get_daily_statistics()
+        total_signals, wins = await get_daily_statistics_async()
+        weekly_signals, weekly_wins, weekly_profit = await get_weekly_statistics_async()
         
         return {
             "daily_signals": total_signals,
             "successful_signals": wins,
+            "weekly_signals": weekly_signals,
+            "weekly_successful_signals": weekly_wins,
+            "weekly_profit": weekly_profit,
+            "pair_statistics": await get_pair_statistics_async(),
             "win_rate": bot_stats["win_rate"],
             "target_win_rate": 85.0,
             "performance_rating": bot_stats["performance"],
@@ -210,16 +228,34 @@ async def restart_analysis():
         logger.error(f"Ошибка перезапуска анализа: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics")
+async def metrics():
+    """Метрики в текстовом формате Prometheus."""
+    return Response(content=metrics_registry.render(), media_type=metrics_registry.CONTENT_TYPE)
+
+@app.post("/admin/profile")
+async def profile(mode: str = "sampling", seconds: float | None = None, cycles: int | None = None,
+                  format: str = "report", top: int = 40, x_admin_token: str | None = Header(default=None)):
+    """Профилирует работающий процесс: seconds секунд или cycles циклов анализа.
+    
+    mode — sampling или cprofile; format — report (по функциям) или collapsed (для flame graph).
+    """
+    if PROFILER_TOKEN and x_admin_token != PROFILER_TOKEN:
+        raise HTTPException(status_code=403, detail="Неверный токен администратора")
+    try:
+        report = await loop_profiler.profile(mode, seconds, cycles, format, top)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(report)
+
 @app.get("/health")
 async def health_check():
     """Проверка здоровья системы."""
     try:
         # Проверяем основные компоненты
-        db_ok = True
-        try:
-            get_daily_statistics()
-        except:
-            db_ok = False
+        db_ok = await check_database_async()
         
         telegram_ok = TELEGRAM_BOT_TOKEN != "YOUR_TELEGRAM_BOT_TOKEN"
         
@@ -0,0 +1,202 @@
+import logging
+import time
+from bisect import bisect_left
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Границы гистограмм задержек, секунд: от 10 мкс до 10 с
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Последняя ячейка — выше всех границ
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def time(self):
+        """Контекстный менеджер: наблюдает длительность блока."""
+        return _Timer(self)
+
+class _Timer:
+    __slots__ = ('child', 'start')
+
+    def __init__(self, child: _HistogramChild):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+        return False
+
+class _Metric:
+    """Метрика с метками: дочерние значения создаются один раз на набор меток.
+
+    На горячем пути вызывающий код держит ссылку на дочерний объект
+    (labels(...)) и выполняет только inc/observe — без блокировок: каждое
+    значение обновляет один поток (event loop или поток писателя БД).
+    Воркеры исполнителя анализа (потоки и процессы) метрики не обновляют:
+    в режиме "process" у них своя копия реестра. Они возвращают замеры
+    вместе с результатом, а наблюдает их event loop.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: ожидались метки {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _render_child(self, values: tuple, child: _CounterChild) -> list:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def _render_child(self, values: tuple, child: _HistogramChild) -> list:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), list(child.counts)):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """Набор метрик и вывод в текстовом формате Prometheus (exposition format 0.0.4)."""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (),
+                  buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# Глобальный реестр метрик
+metrics_registry = MetricsRegistry()
+
+KEY_LABELS = ("pair", "timeframe")
+
+# WebSocket и разбор сообщений
+ws_messages_total = metrics_registry.counter(
+    "binary_bot_ws_messages_total", "Сообщения WebSocket kline", KEY_LABELS)
+ws_closed_candles_total = metrics_registry.counter(
+    "binary_bot_ws_closed_candles_total", "Закрытые свечи из WebSocket", KEY_LABELS)
+stage_seconds = metrics_registry.histogram(
+    "binary_bot_stage_seconds",
+    "Длительность стадий обработки ключа: decode, get_latest_data, indicators, indicator_update",
+    ("stage",) + KEY_LABELS)
+
+# Анализ
+model_inference_seconds = metrics_registry.histogram(
+    "binary_bot_model_inference_seconds", "Батч-вызов модели за цикл")
+model_rows_total = metrics_registry.counter(
+    "binary_bot_model_rows_total", "Строки признаков, оцененные моделью", KEY_LABELS)
+signals_total = metrics_registry.counter(
+    "binary_bot_signals_total", "Опубликованные сигналы", KEY_LABELS)
+cycle_seconds = metrics_registry.histogram(
+    "binary_bot_cycle_seconds", "Длительность цикла анализа")
+cycle_overruns_total = metrics_registry.counter(
+    "binary_bot_cycle_overruns_total", "Циклы анализа дольше UPDATE_INTERVAL")
+
+# Доставка и запись
+telegram_send_seconds = metrics_registry.histogram(
+    "binary_bot_telegram_send_seconds", "Отправка одного сообщения Bot API")
+telegram_messages_total = metrics_registry.counter(
+    "binary_bot_telegram_messages_total", "Итоги доставки сообщений Telegram", ("status",))
+db_flush_seconds = metrics_registry.histogram(
+    "binary_bot_db_flush_seconds", "Транзакция пакетной записи писателя БД")
+db_rows_written_total = metrics_registry.counter(
+    "binary_bot_db_rows_written_total", "Строки, записанные писателем БД")
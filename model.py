@@ -2,17 +2,48 @@ import lightgbm as lgb
 import joblib
 import numpy as np
 import logging
-from globals import AI_MODEL_PATH
+import time
+from globals import AI_MODEL_PATH, MODEL_SERVING_MODE
+from tree_evaluator import compile_booster, make_validation_rows
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class LatencyStats:
+    """Статистика задержек вызовов предсказания."""
+    
+    __slots__ = ('calls', 'total', 'max', 'last')
+    
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+    
+    def record(self, seconds: float):
+        self.calls += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+    
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "avg_us": self.total / self.calls * 1e6 if self.calls else 0.0,
+            "max_us": self.max * 1e6,
+            "last_us": self.last * 1e6
+        }
+
 class BinaryOptionsAIModel:
     """ИИ-модель для предсказания направления движения цены в бинарных опционах."""
     
-    def __init__(self, model_path: str = AI_MODEL_PATH):
+    def __init__(self, model_path: str = AI_MODEL_PATH, seed: int | None = None):
         self.model = None
         self.model_path = model_path
+        self.seed = seed  # Seed шума заглушки для воспроизводимости
+        self.compiled = None  # Скомпилированный бустер (MODEL_SERVING_MODE = "compiled")
+        self.latency = {"native": LatencyStats(), "compiled": LatencyStats()}
         self.feature_names = [
             'vwap_distance', 'macd_hist', 'rsi', 'supertrend_signal',
             'volume_ratio', 'bb_position', 'bb_width', 'stoch_k', 'stoch_d',
@@ -26,6 +57,8 @@ class BinaryOptionsAIModel:
         try:
             self.model = joblib.load(self.model_path)
             logger.info(f"Модель загружена из {self.model_path}")
+            if MODEL_SERVING_MODE == "compiled":
+                self._compile_model()
         except FileNotFoundError:
             logger.warning(f"Модель не найдена: {self.model_path}. Используется заглушка.")
             self.model = self._create_enhanced_dummy_model()
@@ -33,72 +66,117 @@ class BinaryOptionsAIModel:
             logger.error(f"Ошибка загрузки модели: {e}")
             self.model = self._create_enhanced_dummy_model()
 
+    def _compile_model(self):
+        """Разворачивает бустер в массивы узлов; при ошибке остается нативный путь."""
+        try:
+            self.compiled = compile_booster(self.model)
+            self.compare_latency()
+        except Exception as e:
+            logger.warning(f"Скомпилированный режим недоступен, используется LightGBM: {e}")
+            self.compiled = None
+
+    def compare_latency(self, rows: int = 1, repeats: int = 200) -> dict:
+        """Сравнивает задержку одного вызова нативного и скомпилированного пути."""
+        if self.compiled is None:
+            return {}
+        X = make_validation_rows(self.compiled, rows)
+        results = {}
+        for name, predict in (("native", self.model.predict_proba), ("compiled", self.compiled.predict_proba)):
+            predict(X)  # прогрев (JIT-компиляция numba)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                predict(X)
+            results[f"{name}_us"] = (time.perf_counter() - start) / repeats * 1e6
+        logger.info(f"Задержка предсказания ({rows} стр.): LightGBM {results['native_us']:.1f} мкс, "
+                    f"скомпилированный {results['compiled_us']:.1f} мкс")
+        return results
+
+    def get_latency_stats(self) -> dict:
+        """Статистика задержек по путям предсказания."""
+        return {
+            "serving_mode": "compiled" if self.compiled is not None else "native",
+            **{name: stats.as_dict() for name, stats in self.latency.items()}
+        }
+
     def _create_enhanced_dummy_model(self):
         """Создает улучшенную заглушку с логикой для бинарных опционов."""
         logger.warning("Используется заглушка модели с базовой логикой!")
         
         class EnhancedDummyModel:
+            def __init__(self, seed: int | None = None):
+                self.rng = np.random.default_rng(seed)
+            
             def predict_proba(self, X):
-                """Предсказание с базовой логикой для бинарных опционов."""
-                probabilities = []
+                """Предсказание с базовой логикой для бинарных опционов (векторизовано по строкам)."""
+                X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+                n_features = X.shape[1]
+                
+                # Базовая вероятность
+                score = np.full(len(X), 0.5)
                 
-                for row in X:
-                    # Базовая логика на основе индикаторов
-                    score = 0.5  # Базовая вероятность
-                    
-                    # MACD Histogram
-                    if len(row) > 1 and not np.isnan(row[1]):
-                        score += 0.1 if row[1] > 0 else -0.1
-                    
-                    # RSI
-                    if len(row) > 2 and not np.isnan(row[2]):
-                        if row[2] < 30:
-                            score += 0.15  # Перепроданность
-                        elif row[2] > 70:
-                            score -= 0.15  # Перекупленность
-                    
-                    # Supertrend Signal
-                    if len(row) > 3 and not np.isnan(row[3]):
-                        score += 0.1 * row[3]
-                    
-                    # Volume Ratio
-                    if len(row) > 4 and not np.isnan(row[4]):
-                        if row[4] > 1.5:
-                            score += 0.1
-                    
-                    # BB Position
-                    if len(row) > 5 and not np.isnan(row[5]):
-                        if row[5] < 0.2:
-                            score += 0.1
-                        elif row[5] > 0.8:
-                            score -= 0.1
-                    
-                    # Stochastic Crossover
-                    if len(row) > 15 and not np.isnan(row[15]):
-                        score += 0.1 * row[15]
-                    
-                    # Ограничиваем диапазон
-                    score = max(0.1, min(0.9, score))
-                    
-                    # Добавляем небольшую случайность для реализма
-                    noise = np.random.normal(0, 0.05)
-                    score = max(0.1, min(0.9, score + noise))
-                    
-                    probabilities.append([1 - score, score])
+                # MACD Histogram
+                if n_features > 1:
+                    macd_hist = X[:, 1]
+                    score += np.where(np.isnan(macd_hist), 0.0, np.where(macd_hist > 0, 0.1, -0.1))
                 
-                return np.array(probabilities)
+                # RSI: перепроданность / перекупленность
+                if n_features > 2:
+                    rsi = X[:, 2]
+                    score += np.where(rsi < 30, 0.15, np.where(rsi > 70, -0.15, 0.0))
+                
+                # Supertrend Signal
+                if n_features > 3:
+                    score += np.nan_to_num(0.1 * X[:, 3], nan=0.0)
+                
+                # Volume Ratio
+                if n_features > 4:
+                    score += np.where(X[:, 4] > 1.5, 0.1, 0.0)
+                
+                # BB Position
+                if n_features > 5:
+                    bb_position = X[:, 5]
+                    score += np.where(bb_position < 0.2, 0.1, np.where(bb_position > 0.8, -0.1, 0.0))
+                
+                # Stochastic Crossover
+                if n_features > 15:
+                    score += np.nan_to_num(0.1 * X[:, 15], nan=0.0)
+                
+                # Ограничиваем диапазон
+                score = np.clip(score, 0.1, 0.9)
+                
+                # Добавляем небольшую случайность для реализма
+                noise = self.rng.normal(0, 0.05, len(X))
+                score = np.clip(score + noise, 0.1, 0.9)
+                
+                return np.column_stack([1 - score, score])
             
             def predict(self, X):
                 proba = self.predict_proba(X)
                 return (proba[:, 1] >= 0.5).astype(int)
         
-        return EnhancedDummyModel()
+        return EnhancedDummyModel(self.seed)
 
     def predict_proba(self, features: np.ndarray) -> np.ndarray:
         """Предсказание вероятности для бинарных опционов."""
+        probabilities, path, seconds = self.predict_proba_timed(features)
+        if path is not None:
+            self.record_latency(path, seconds)
+        return probabilities
+
+    def record_latency(self, path: str, seconds: float):
+        """Учитывает задержку вызова пути предсказания (native или compiled)."""
+        self.latency[path].record(seconds)
+
+    def predict_proba_timed(self, features: np.ndarray) -> tuple:
+        """Предсказание без записи статистики: (вероятности, путь, секунды).
+        
+        Для воркеров исполнителя анализа: в режиме "process" статистика воркера
+        недоступна основному процессу, поэтому задержку записывает event loop
+        через record_latency. Путь None — предсказание не выполнялось (ошибка).
+        """
         if self.model is None:
             logger.error("Модель не загружена")
-            return np.array([[0.5, 0.5]])
+            return np.array([[0.5, 0.5]]), None, 0.0
         
         try:
             if features.ndim == 1:
@@ -114,12 +192,22 @@ class BinaryOptionsAIModel:
                 else:
                     features = features[:, :len(self.feature_names)]
             
+            if self.compiled is not None:
+                start = time.perf_counter()
+                try:
+                    probabilities = self.compiled.predict_proba(features)
+                    return probabilities, "compiled", time.perf_counter() - start
+                except Exception as e:
+                    logger.error(f"Ошибка скомпилированного предсказания, откат на LightGBM: {e}")
+                    self.compiled = None
+            
+            start = time.perf_counter()
             probabilities = self.model.predict_proba(features)
-            return probabilities
+            return probabilities, "native", time.perf_counter() - start
             
         except Exception as e:
             logger.error(f"Ошибка предсказания: {e}")
-            return np.array([[0.5, 0.5]])
+            return np.full((len(np.atleast_2d(features)), 2), 0.5), None, 0.0
 
     def get_signal_strength(self, probability: float) -> str:
         """Определяет силу сигнала."""
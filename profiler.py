@@ -0,0 +1,216 @@
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from globals import PROFILER_SAMPLE_INTERVAL, PROFILER_DEFAULT_SECONDS, PROFILER_MAX_SECONDS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PROFILER_MODES = ("sampling", "cprofile")
+REPORT_FORMATS = ("report", "collapsed")
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class _StackSampler:
+    """Поток, снимающий стеки всех потоков процесса каждые interval секунд.
+
+    Выполняющиеся корутины (main_loop, шарды WebSocket) видны в стеке
+    потока цикла, расчеты признаков — в потоках пула анализа; простой виден
+    как ожидание в select или в очереди. Первый элемент стека — имя потока.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if stack:
+                    stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                    self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+class LoopProfiler:
+    """Профилирование работающего процесса по запросу, без перезапуска.
+
+    sampling — выборка стеков всех потоков (малые накладные расходы,
+    есть collapsed stacks для flame graph); cprofile — детерминированный
+    профиль всех вызовов в потоке цикла и в задачах пула анализа (через wrap).
+    Длительность — seconds или cycles циклов анализа (не дольше
+    PROFILER_MAX_SECONDS). Одновременно идет один сеанс.
+    """
+
+    def __init__(self, interval: float = PROFILER_SAMPLE_INTERVAL):
+        self.interval = interval
+        self._active = False
+        self._cycles_left = None
+        self._cycles_seen = 0
+        self._done = None
+        self._worker_profiles = None
+        self._lock = threading.Lock()
+        self.sessions = 0
+        self.last_session = None
+
+    @property
+    def is_active(self) -> bool:
+        return self._active
+
+    def wrap(self, func):
+        """Оборачивает задачу для потока-воркера: во время сеанса cprofile она профилируется отдельно."""
+        def profiled(*args, **kwargs):
+            profiles = self._worker_profiles
+            if profiles is None:
+                return func(*args, **kwargs)
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:  # Python 3.12+: профиль цикла уже охватывает все потоки
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.disable()
+                with self._lock:
+                    profiles.append(profiler)
+        return profiled
+
+    def on_cycle(self):
+        """Вызывается по завершении цикла анализа."""
+        if not self._active:
+            return
+        self._cycles_seen += 1
+        if self._cycles_left is not None:
+            self._cycles_left -= 1
+            if self._cycles_left <= 0:
+                self._done.set()
+
+    async def profile(self, mode: str = "sampling", seconds: float | None = None, cycles: int | None = None,
+                      fmt: str = "report", top: int = 40) -> str:
+        """Профилирует текущий процесс и возвращает отчет по функциям или collapsed stacks."""
+        if mode not in PROFILER_MODES:
+            raise ValueError(f"Неизвестный режим профилирования: {mode}")
+        if fmt not in REPORT_FORMATS:
+            raise ValueError(f"Неизвестный формат отчета: {fmt}")
+        if fmt == "collapsed" and mode != "sampling":
+            raise ValueError("collapsed stacks доступны только в режиме sampling")
+        if cycles is not None and cycles <= 0 or seconds is not None and seconds <= 0:
+            raise ValueError("seconds и cycles должны быть положительными")
+        if self._active:
+            raise RuntimeError("Профилирование уже выполняется")
+        if seconds is None and cycles is None:
+            seconds = PROFILER_DEFAULT_SECONDS
+        timeout = min(seconds or PROFILER_MAX_SECONDS, PROFILER_MAX_SECONDS)
+
+        profiler = sampler = None
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError as e:  # Уже включен другой профилировщик
+                raise RuntimeError(f"Не удалось включить cProfile: {e}")
+            self._worker_profiles = []
+        else:
+            sampler = _StackSampler(self.interval)
+            sampler.start()
+
+        self._active = True
+        self._cycles_left = cycles
+        self._cycles_seen = 0
+        self._done = asyncio.Event()
+        self.sessions += 1
+        logger.info(f"Профилирование {mode}: {f'{cycles} циклов' if cycles else f'{timeout} с'}")
+        started = time.perf_counter()
+        try:
+            if cycles is not None:
+                try:
+                    await asyncio.wait_for(self._done.wait(), timeout)
+                except asyncio.TimeoutError:
+                    logger.warning(f"Профилирование остановлено по таймауту {timeout} с")
+            else:
+                await asyncio.sleep(timeout)
+        finally:
+            worker_profiles, self._worker_profiles = self._worker_profiles, None
+            if profiler is not None:
+                profiler.disable()
+            if sampler is not None:
+                sampler.stop()
+            self._active = False
+        elapsed = time.perf_counter() - started
+
+        self.last_session = {"mode": mode, "seconds": elapsed, "cycles": self._cycles_seen,
+                             "samples": sampler.samples if sampler else None}
+        header = (f"# Профиль {mode}: {elapsed:.2f} с, циклов анализа: {self._cycles_seen}"
+                  + (f", выборок: {sampler.samples} (интервал {self.interval * 1000:.1f} мс)" if sampler else ""))
+        if profiler is not None:
+            header += f", задач пула анализа: {len(worker_profiles)}"
+            with self._lock:
+                return header + "\n" + self._cprofile_report([profiler, *worker_profiles], top)
+        if fmt == "collapsed":
+            return "\n".join(f"{stack} {count}" for stack, count in sampler.stacks.most_common()) + "\n"
+        return header + "\n" + self._sampling_report(sampler, top)
+
+    @staticmethod
+    def _cprofile_report(profilers: list, top: int) -> str:
+        output = io.StringIO()
+        stats = pstats.Stats(*profilers, stream=output)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+        return output.getvalue()
+
+    @staticmethod
+    def _sampling_report(sampler: _StackSampler, top: int) -> str:
+        """Доля выборок по функциям в каждом потоке: total — функция в стеке, self — на вершине стека."""
+        total = {}
+        own = {}
+        for stack, count in sampler.stacks.items():
+            thread, *frames = stack.split(";")
+            own.setdefault(thread, Counter())[frames[-1]] += count
+            thread_total = total.setdefault(thread, Counter())
+            for frame in set(frames):
+                thread_total[frame] += count
+        samples = max(sampler.samples, 1)
+        lines = []
+        # Поток event loop первым, остальные по имени
+        for thread in sorted(total, key=lambda name: (name != "MainThread", name)):
+            lines.append(f"\n## {thread}")
+            lines.append(f"{'total%':>7} {'self%':>7} {'samples':>8}  function")
+            for frame, count in total[thread].most_common(top):
+                lines.append(f"{count / samples:>7.1%} {own[thread][frame] / samples:>7.1%} {count:>8}  {frame}")
+        return "\n".join(lines) + "\n"
+
+    def get_stats(self) -> dict:
+        return {
+            "active": self._active,
+            "sessions": self.sessions,
+            "last_session": self.last_session
+        }
+
+# Глобальный профилировщик цикла анализа
+loop_profiler = LoopProfiler()
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+from globals import PAIRS, TIME_FRAMES, UPDATE_INTERVAL
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class AnalysisScheduler:
+    """Событийный планировщик анализа: ключ анализируется только после новой закрытой свечи."""
+
+    def __init__(self):
+        self._dirty = {}  # dict сохраняет порядок поступления ключей
+        self._held = {}   # Ключи на ресинхронизации -> были ли события за время удержания
+        self._provisional = {}  # Ключи с обновленной незакрытой свечой
+        self._event = asyncio.Event()
+        self.started_at = time.time()
+        self.cycles = 0
+        self.events = 0
+        self.coalesced_events = 0
+        self.analyses_run = 0
+        self.provisional_runs = 0
+
+    def mark_dirty(self, key: str):
+        """Помечает ключ pair_timeframe как требующий анализа."""
+        self.events += 1
+        if key in self._held:
+            self._held[key] = True
+            return
+        if key in self._dirty:
+            self.coalesced_events += 1
+            return
+        self._dirty[key] = None
+        self._event.set()
+
+    def mark_provisional(self, key: str):
+        """Помечает ключ для предварительной оценки по незакрытой свече."""
+        if key in self._held:
+            return
+        self._provisional[key] = None
+        self._event.set()
+
+    def take_provisional(self) -> list:
+        """Забирает ключи для предварительной оценки, кроме тех, что ждут полного анализа."""
+        keys = [key for key in self._provisional if key not in self._dirty and key not in self._held]
+        self._provisional.clear()
+        self.provisional_runs += len(keys)
+        return keys
+
+    def hold(self, key: str):
+        """Исключает ключ из анализа до release (например, пока догружается пропуск свечей)."""
+        if key not in self._held:
+            self._held[key] = key in self._dirty
+            self._dirty.pop(key, None)
+
+    def release(self, key: str, dirty: bool = True):
+        """Возвращает ключ в работу; отложенные за время удержания события ставят его в очередь."""
+        if key in self._held and (self._held.pop(key) or dirty):
+            self._dirty[key] = None
+            self._event.set()
+
+    def is_ready(self, key: str) -> bool:
+        """False, пока ключ удержан."""
+        return key not in self._held
+
+    def pending(self) -> int:
+        """Количество ключей, ожидающих анализа."""
+        return len(self._dirty)
+
+    async def wait_for_keys(self, timeout: float | None = None) -> list:
+        """Ждет помеченных ключей и забирает их все разом.
+
+        Пробуждается и от предварительных ключей — их забирает take_provisional.
+        """
+        if not self._dirty and not self._provisional:
+            self._event.clear()
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        keys = list(self._dirty)
+        self._dirty.clear()
+        self._event.clear()
+        if keys:
+            self.cycles += 1
+            self.analyses_run += len(keys)
+        return keys
+
+    def reset_stats(self):
+        """Сбрасывает статистику (при перезапуске анализа), не трогая очередь."""
+        self.started_at = time.time()
+        self.cycles = self.events = self.coalesced_events = self.analyses_run = self.provisional_runs = 0
+
+    def get_stats(self) -> dict:
+        """Статистика планировщика и объем работы, сэкономленный относительно опроса."""
+        elapsed = time.time() - self.started_at
+        polling_equivalent = int(elapsed // UPDATE_INTERVAL) * len(PAIRS) * len(TIME_FRAMES)
+        avoided = max(0, polling_equivalent - self.analyses_run)
+        return {
+            "cycles": self.cycles,
+            "events": self.events,
+            "coalesced_events": self.coalesced_events,
+            "analyses_run": self.analyses_run,
+            "pending_keys": self.pending(),
+            "held_keys": len(self._held),
+            "provisional_runs": self.provisional_runs,
+            "polling_equivalent": polling_equivalent,
+            "analyses_avoided": avoided,
+            "avoided_ratio": avoided / polling_equivalent if polling_equivalent else 0.0
+        }
+
+# Глобальный планировщик
+analysis_scheduler = AnalysisScheduler()
@@ -1,11 +1,20 @@
 import pandas as pd
 import numpy as np
 import logging
+import time
 from datetime import datetime, timezone
-from indicators import calculate_all_indicators
+from streaming_indicators import get_latest_indicators, peek_indicators
 from model import ai_model, MODEL_FEATURES
-from database import save_binary_signal, get_daily_statistics
-from globals import MIN_ACCURACY_THRESHOLD, EXPIRY_TIMES, RISK_MANAGEMENT
+from signal_candidates import (
+    passes_filters, filter_latest, extract_features, prepare_candidates, score_candidates_timed
+)
+from database import save_binary_signal, confirm_provisional_signal, cancel_provisional_signal, get_daily_statistics
+from analysis_executor import analysis_executor
+from scheduler import analysis_scheduler
+from intra_candle import intra_candle_tracker
+from telegram_dispatcher import telegram_dispatcher
+from metrics import stage_seconds, model_inference_seconds, model_rows_total, signals_total
+from globals import MIN_ACCURACY_THRESHOLD, EXPIRY_TIMES, RISK_MANAGEMENT, INDICATOR_MODE
 import asyncio
 
 logging.basicConfig(level=logging.INFO)
@@ -16,6 +25,7 @@ class BinaryOptionsSignalAnalyzer:
     
     def __init__(self):
         self.last_signal_time = {}
+        self.provisional_signals = {}  # key -> (время открытия свечи, направление) предварительного сигнала
         self.daily_signal_count = 0
         self.update_daily_stats()
     
@@ -26,42 +36,8 @@ class BinaryOptionsSignalAnalyzer:
     
     def quantum_binary_signal(self, data: pd.DataFrame) -> dict | None:
         """Улучшенная стратегия Quantum Precision для бинарных опционов."""
-        if data.empty or len(data) < 5:
-            return None
-        
-        latest = data.iloc[-1]
-        
-        # Проверка лимитов
-        if self.daily_signal_count >= RISK_MANAGEMENT['max_daily_signals']:
-            logger.info("Достигнут дневной лимит сигналов")
-            return None
-        
-        # **Уровень 1: Усиленный импульсный фильтр для бинарных опционов**
-        volume_condition = (latest['volume'] > latest['sma_volume'] * 2.8) if not pd.isna(latest['sma_volume']) else False
-        momentum_condition = abs(latest['pct_change']) > 0.003 if not pd.isna(latest['pct_change']) else False
-        
-        if not (volume_condition and momentum_condition):
-            logger.debug("Импульсный фильтр не пройден")
-            return None
-        
-        # **Уровень 2: Конвергенция индикаторов**
-        macd_bullish = latest['macd_hist'] > 0 if not pd.isna(latest['macd_hist']) else False
-        vwap_bullish = latest['vwap_gradient'] > 0.001 if not pd.isna(latest['vwap_gradient']) else False
-        rsi_normal = 30 < latest['rsi'] < 70 if not pd.isna(latest['rsi']) else False
-        
-        trend_score = sum([macd_bullish, vwap_bullish, rsi_normal])
-        if trend_score < 2:
-            logger.debug("Конвергенция индикаторов недостаточна")
-            return None
-        
-        # **Уровень 3: Подтверждение разворота/продолжения**
-        supertrend_signal = latest['supertrend_signal'] != 0 if not pd.isna(latest['supertrend_signal']) else False
-        bb_not_squeezed = not latest['bb_squeeze'] if not pd.isna(latest['bb_squeeze']) else True
-        stoch_signal = latest['stoch_crossover'] != 0 if not pd.isna(latest['stoch_crossover']) else False
-        
-        confirmation_score = sum([supertrend_signal, bb_not_squeezed, stoch_signal])
-        if confirmation_score < 2:
-            logger.debug("Подтверждение недостаточно")
+        latest = self.prefilter(data)
+        if latest is None:
             return None
         
         # **Уровень 4: ИИ-предсказание**
@@ -72,6 +48,23 @@ class BinaryOptionsSignalAnalyzer:
         proba = ai_model.predict_proba(features.reshape(1, -1))
         probability_up = proba[0][1]
         
+        return self.build_signal(latest, probability_up)
+    
+    def prefilter(self, data: pd.DataFrame) -> pd.Series | None:
+        """Уровни 1–3 стратегии. Возвращает последнюю строку, если она прошла фильтры."""
+        # Проверка лимитов
+        if self.daily_signal_count >= RISK_MANAGEMENT['max_daily_signals']:
+            logger.info("Достигнут дневной лимит сигналов")
+            return None
+        
+        return filter_latest(data)
+    
+    def passes_filters(self, latest) -> bool:
+        """Уровни 1–3 для одной строки признаков (Series или словарь строки движка)."""
+        return passes_filters(latest)
+    
+    def build_signal(self, latest, probability_up: float) -> dict | None:
+        """Уровень 4: проверка ИИ-вероятности и формирование сигнала."""
         if probability_up < MIN_ACCURACY_THRESHOLD:
             logger.debug(f"ИИ-вероятность недостаточна: {probability_up:.3f}")
             return None
@@ -107,18 +100,7 @@ class BinaryOptionsSignalAnalyzer:
     
     def extract_features(self, latest_data) -> np.ndarray | None:
         """Извлекает признаки для модели."""
-        try:
-            features = []
-            for feature_name in MODEL_FEATURES:
-                if feature_name in latest_data:
-                    value = latest_data[feature_name]
-                    features.append(value if not pd.isna(value) else 0)
-                else:
-                    features.append(0)
-            return np.array(features)
-        except Exception as e:
-            logger.error(f"Ошибка извлечения признаков: {e}")
-            return None
+        return extract_features(latest_data)
     
     def determine_signal_direction(self, latest_data, probability_up: float) -> str:
         """Определяет направление сигнала."""
@@ -201,68 +183,311 @@ class BinaryOptionsSignalAnalyzer:
                 return "15m"
         return "5m"  # По умолчанию
 
+    def evaluate_frame(self, data: pd.DataFrame) -> pd.DataFrame:
+        """Векторизованный quantum_binary_signal для каждой строки истории индикаторов.
+
+        Строка i оценивается так же, как quantum_binary_signal(data.iloc[:i + 1]):
+        маски уровней 1–3, вероятность модели (один батч-вызов по прошедшим
+        строкам), направление, точность и экспирация. Дневной лимит и кулдаун
+        зависят от истории отправок и здесь не учитываются.
+        """
+        n = len(data)
+
+        def column(name: str) -> np.ndarray:
+            return data[name].to_numpy(dtype=np.float64)
+
+        volume, sma_volume, pct_change = column('volume'), column('sma_volume'), column('pct_change')
+        macd_hist, vwap_gradient, rsi = column('macd_hist'), column('vwap_gradient'), column('rsi')
+        supertrend_signal, bb_squeeze = column('supertrend_signal'), column('bb_squeeze')
+        stoch_crossover, vwap_distance = column('stoch_crossover'), column('vwap_distance')
+        volume_ratio, atr_normalized = column('volume_ratio'), column('atr_normalized')
+
+        # Сравнения с NaN дают False — как ветки pd.isna в скалярном пути
+        with np.errstate(invalid='ignore'):
+            # Уровень 1: импульс
+            impulse = (volume > sma_volume * 2.8) & (np.abs(pct_change) > 0.003)
+
+            # Уровень 2: конвергенция индикаторов
+            trend_score = ((macd_hist > 0).astype(int) + (vwap_gradient > 0.001)
+                           + ((rsi > 30) & (rsi < 70)))
+            convergence = trend_score >= 2
+
+            # Уровень 3: подтверждение (NaN в bb_squeeze — «нет сжатия»)
+            bb_not_squeezed = np.isnan(bb_squeeze) | (bb_squeeze == 0)
+            confirmation_score = (((supertrend_signal != 0) & ~np.isnan(supertrend_signal)).astype(int)
+                                  + bb_not_squeezed
+                                  + ((stoch_crossover != 0) & ~np.isnan(stoch_crossover)))
+            confirmation = confirmation_score >= 2
+
+        passed = impulse & convergence & confirmation & (np.arange(n) >= 4)
+
+        # Уровень 4: признаки прошедших строк одной матрицей
+        probability = np.full(n, np.nan)
+        if passed.any():
+            features = (data.loc[passed].reindex(columns=MODEL_FEATURES)
+                        .to_numpy(dtype=np.float64, na_value=np.nan))
+            features = np.nan_to_num(features, nan=0.0)
+            probability[passed] = ai_model.predict_proba(features)[:, 1]
+
+        with np.errstate(invalid='ignore'):
+            signal = passed & (probability >= MIN_ACCURACY_THRESHOLD)
+
+            # Направление: голоса индикаторов, как в determine_signal_direction
+            bullish = ((macd_hist > 0).astype(int) + (supertrend_signal == 1) + (rsi < 35)
+                       + (stoch_crossover == 1) + (vwap_distance > 0))
+            bearish = ((macd_hist <= 0).astype(int) + (supertrend_signal == -1) + (rsi > 65)
+                       + (stoch_crossover == -1) + (vwap_distance <= 0))
+            signal_type = np.select(
+                [(bullish > bearish) & (probability > 0.5), (bearish > bullish) & (probability < 0.5)],
+                ["CALL", "PUT"],
+                np.where(probability > 0.5, "CALL", "PUT")
+            )
+
+            # Точность, как в calculate_accuracy
+            accuracy = (0.85 + np.minimum(0.04, (probability - MIN_ACCURACY_THRESHOLD) * 0.1)
+                        + np.where(volume_ratio > 2.0, 0.01, 0.0)
+                        + np.where(np.abs(macd_hist) > 0.001, 0.005, 0.0)
+                        + np.where(np.abs(supertrend_signal) == 1, 0.005, 0.0))
+            accuracy = np.minimum(0.92, accuracy)
+
+            # Экспирация, как в determine_expiry_time
+            expiry_time = np.select(
+                [np.isnan(atr_normalized), atr_normalized > 0.02, atr_normalized > 0.01],
+                ["5m", "1m", "5m"], "15m"
+            )
+
+        return pd.DataFrame({
+            'impulse': impulse,
+            'convergence': convergence,
+            'confirmation': confirmation,
+            'passed': passed,
+            'probability': probability,
+            'signal': signal,
+            'signal_type': np.where(signal, signal_type, None),
+            'accuracy': np.where(signal, accuracy, np.nan),
+            'expiry_time': np.where(signal, expiry_time, None)
+        }, index=data.index)
+
 # Создаем экземпляр анализатора
 signal_analyzer = BinaryOptionsSignalAnalyzer()
 
-async def analyze_pair_and_timeframe(pair: str, timeframe: str):
-    """Анализирует пару и таймфрейм для бинарных опционов."""
-    try:
+def _can_signal(key: str, current_time: float) -> bool:
+    """Ключ готов к анализу и прошел минимальное время с последнего сигнала."""
+    if not analysis_scheduler.is_ready(key):
+        return False  # Идет догрузка пропущенных свечей
+    if key in signal_analyzer.last_signal_time:
+        time_diff = current_time - signal_analyzer.last_signal_time[key]
+        if time_diff < RISK_MANAGEMENT['min_time_between_signals']:
+            return False
+    return True
+
+def _collect_analysis_input(pair: str, timeframe: str, current_time: float):
+    """Проверяет кулдаун и достает данные ключа. Возвращает элемент для prepare_candidates."""
+    if not _can_signal(f"{pair}_{timeframe}", current_time):
+        return None
+    
+    if INDICATOR_MODE == "streaming":
+        # Индикаторы уже обновлены инкрементально при закрытии свечи
+        start = time.perf_counter()
+        data_df = get_latest_indicators(pair, timeframe)
+        stage_seconds.labels("get_latest_data", pair, timeframe).observe(time.perf_counter() - start)
+        if data_df.empty:
+            logger.debug(f"Недостаточно данных для {pair}-{timeframe}")
+            return None
+    else:
         # Получаем данные
         from websocket import get_latest_data
+        start = time.perf_counter()
         data_df = get_latest_data(pair, timeframe)
+        stage_seconds.labels("get_latest_data", pair, timeframe).observe(time.perf_counter() - start)
         
         if data_df.empty or len(data_df) < 30:
             logger.debug(f"Недостаточно данных для {pair}-{timeframe}")
-            return
-        
-        # Рассчитываем индикаторы
-        data_with_indicators = calculate_all_indicators(data_df)
-        
-        if data_with_indicators.empty:
-            logger.debug(f"Не удалось рассчитать индикаторы для {pair}-{timeframe}")
-            return
-        
-        # Проверяем минимальное время между сигналами
-        key = f"{pair}_{timeframe}"
-        current_time = datetime.now().timestamp()
-        
-        if key in signal_analyzer.last_signal_time:
-            time_diff = current_time - signal_analyzer.last_signal_time[key]
-            if time_diff < RISK_MANAGEMENT['min_time_between_signals']:
-                return
-        
-        # Анализируем сигнал
-        signal_result = signal_analyzer.quantum_binary_signal(data_with_indicators)
-        
-        if signal_result:
-            # Обновляем время последнего сигнала
-            signal_analyzer.last_signal_time[key] = current_time
-            signal_analyzer.daily_signal_count += 1
-            
-            # Отправляем в Telegram
-            await send_binary_signal_to_telegram(pair, timeframe, signal_result)
-            
-            # Сохраняем в БД
-            save_binary_signal(
-                pair=pair,
-                timeframe=timeframe,
-                signal_type=signal_result['signal_type'],
-                entry_time=int(signal_result['entry_time']),
-                expiry_time=signal_result['expiry_time'],
-                probability=signal_result['probability'],
-                accuracy=signal_result['accuracy'],
-                entry_price=signal_result['entry_price']
-            )
-            
-            logger.info(f"Сигнал отправлен: {pair}-{timeframe} {signal_result['signal_type']}")
+            return None
+    
+    return (pair, timeframe, data_df, INDICATOR_MODE == "streaming")
+
+async def analyze_keys(keys: list):
+    """Анализирует набор ключей pair_timeframe за один цикл.
     
+    Индикаторы и фильтры считаются порциями в исполнителе, затем признаки
+    всех прошедших ключей оцениваются моделью одним батч-вызовом.
+    Telegram и БД остаются в event loop.
+    """
+    # Проверяем лимиты до запуска расчетов: в режиме "process" счетчик
+    # в воркерах не обновляется, актуален только этот экземпляр.
+    # После лимита анализируются только свечи с предварительным сигналом — для подтверждения
+    limit_reached = signal_analyzer.daily_signal_count >= RISK_MANAGEMENT['max_daily_signals']
+    
+    current_time = datetime.now().timestamp()
+    items = []
+    for key in keys:
+        if limit_reached and key not in signal_analyzer.provisional_signals:
+            continue
+        pair, timeframe = key.split("_", 1)
+        try:
+            item = _collect_analysis_input(pair, timeframe, current_time)
+        except Exception as e:
+            logger.error(f"Ошибка анализа {pair}-{timeframe}: {e}")
+            continue
+        if item is not None:
+            items.append(item)
+    try:
+        await _analyze_items(items, current_time)
+    finally:
+        # Свеча закрыта, а предварительный сигнал по ней не подтвержден — отменяем
+        for key in keys:
+            pending = signal_analyzer.provisional_signals.get(key)
+            if pending is None:
+                continue
+            record = intra_candle_tracker.get(key)
+            if record is not None and record.timestamp == pending[0]:
+                continue  # Сигнал уже по следующей, еще открытой свече
+            del signal_analyzer.provisional_signals[key]
+            await _cancel_provisional(key, *pending)
+
+async def analyze_provisional(keys: list):
+    """Предварительная оценка ключей по незакрытой свече.
+    
+    Строка признаков для тика считается из сохраненного состояния движка
+    без его изменения (peek), затем проходит те же уровни 1–4. На одну
+    свечу ключа отправляется не больше одного предварительного сигнала.
+    """
+    if INDICATOR_MODE != "streaming":
+        return
+    if _limit_with_provisional() >= RISK_MANAGEMENT['max_daily_signals']:
+        return
+    
+    current_time = datetime.now().timestamp()
+    items = []
+    for key in keys:
+        record = intra_candle_tracker.get(key)
+        if record is None or signal_analyzer.provisional_signals.get(key, (None,))[0] == record.timestamp:
+            continue
+        if not _can_signal(key, current_time):
+            continue
+        data_df = peek_indicators(record.symbol, record.interval, *record[2:])
+        if not data_df.empty:
+            items.append((record.symbol, record.interval, data_df, True))
+    await _analyze_items(items, current_time, provisional=True)
+
+def _limit_with_provisional() -> int:
+    """Сигналы дня вместе с ожидающими подтверждения: подтверждение не должно превысить лимит."""
+    return signal_analyzer.daily_signal_count + len(signal_analyzer.provisional_signals)
+
+async def _analyze_items(items: list, current_time: float, provisional: bool = False):
+    """Уровни 1–3 порциями в исполнителе, уровень 4 — одним батч-вызовом модели, затем публикация."""
+    if not items:
+        return
+    
+    # Уровни 1–3: порции по числу воркеров исполнителя
+    chunk_count = 1 if analysis_executor.mode == "inline" else min(analysis_executor.workers, len(items))
+    chunks = [items[i::chunk_count] for i in range(chunk_count)]
+    results = await asyncio.gather(
+        *(analysis_executor.run(prepare_candidates, chunk) for chunk in chunks),
+        return_exceptions=True
+    )
+    candidates = []
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Ошибка подготовки признаков: {result}")
+            continue
+        chunk_candidates, timings = result
+        candidates.extend(chunk_candidates)
+        # Замеры воркеров наблюдаем здесь: реестр метрик живет в процессе event loop
+        for pair, timeframe, seconds in timings:
+            stage_seconds.labels("indicators", pair, timeframe).observe(seconds)
+    if not candidates:
+        return
+    
+    # Уровень 4: одна матрица признаков на весь цикл
+    features = np.vstack([candidate[3] for candidate in candidates])
+    start = time.perf_counter()
+    probabilities, path, seconds = await analysis_executor.run(score_candidates_timed, features)
+    model_inference_seconds.observe(time.perf_counter() - start)
+    if path is not None:
+        ai_model.record_latency(path, seconds)
+    for pair, timeframe, _, _ in candidates:
+        model_rows_total.labels(pair, timeframe).inc()
+    
+    for (pair, timeframe, latest, _), probability_up in zip(candidates, probabilities):
+        try:
+            signal_result = signal_analyzer.build_signal(latest, float(probability_up))
+            if not signal_result:
+                continue
+            key = f"{pair}_{timeframe}"
+            entry = (int(signal_result['entry_time']), signal_result['signal_type'])
+            pending = signal_analyzer.provisional_signals.get(key)
+            if not provisional and pending is not None:
+                if pending != entry:
+                    # Противоположный сигнал той же свечи не отправляем: предварительный будет отменен
+                    continue
+                # Закрытая свеча подтвердила предварительный сигнал: повторно не отправляем,
+                # в лимит и кулдаун он засчитывается только сейчас
+                del signal_analyzer.provisional_signals[key]
+                _register_signal(pair, timeframe, current_time)
+                confirm_provisional_signal(pair, timeframe, entry[0], float(signal_result['entry_price']))
+                logger.info(f"Предварительный сигнал подтвержден: {pair}-{timeframe} {entry[1]}")
+                continue
+            if (_limit_with_provisional() if provisional
+                    else signal_analyzer.daily_signal_count) >= RISK_MANAGEMENT['max_daily_signals']:
+                logger.info("Достигнут дневной лимит сигналов")
+                break
+            if provisional:
+                signal_result['provisional'] = True
+                signal_analyzer.provisional_signals[key] = entry
+            await _publish_signal(pair, timeframe, signal_result, current_time)
+        except Exception as e:
+            logger.error(f"Ошибка анализа {pair}-{timeframe}: {e}")
+
+def _register_signal(pair: str, timeframe: str, current_time: float):
+    """Засчитывает сигнал в кулдаун ключа и дневной лимит."""
+    signal_analyzer.last_signal_time[f"{pair}_{timeframe}"] = current_time
+    signal_analyzer.daily_signal_count += 1
+    signals_total.labels(pair, timeframe).inc()
+
+async def _publish_signal(pair: str, timeframe: str, signal_result: dict, current_time: float):
+    """Регистрирует сигнал, сохраняет его в БД и ставит в очередь рассылки Telegram.
+    
+    Предварительный сигнал засчитывается в лимит и кулдаун только при подтверждении.
+    """
+    if not signal_result.get('provisional'):
+        _register_signal(pair, timeframe, current_time)
+    
+    # Сохраняем в БД
+    save_binary_signal(
+        pair=pair,
+        timeframe=timeframe,
+        signal_type=signal_result['signal_type'],
+        entry_time=int(signal_result['entry_time']),
+        expiry_time=signal_result['expiry_time'],
+        probability=signal_result['probability'],
+        accuracy=signal_result['accuracy'],
+        entry_price=signal_result['entry_price'],
+        provisional=signal_result.get('provisional', False)
+    )
+    
+    # Только постановка в очередь: доставкой занимается диспетчер рассылки
+    await send_binary_signal_to_telegram(pair, timeframe, signal_result)
+    
+    logger.info(f"Сигнал отправлен: {pair}-{timeframe} {signal_result['signal_type']}")
+
+async def _cancel_provisional(key: str, entry_time: int, signal_type: str):
+    """Отменяет неподтвержденный предварительный сигнал в БД и сообщает об этом подписчикам."""
+    pair, timeframe = key.split("_", 1)
+    cancel_provisional_signal(pair, timeframe, entry_time)
+    await send_signal_cancelled_to_telegram(pair, timeframe, entry_time, signal_type)
+    logger.info(f"Предварительный сигнал отменен: {pair}-{timeframe} {signal_type}")
+
+async def analyze_pair_and_timeframe(pair: str, timeframe: str):
+    """Анализирует пару и таймфрейм для бинарных опционов."""
+    try:
+        await analyze_keys([f"{pair}_{timeframe}"])
     except Exception as e:
         logger.error(f"Ошибка анализа {pair}-{timeframe}: {e}")
 
 async def send_binary_signal_to_telegram(pair: str, timeframe: str, signal: dict):
-    """Отправляет сигнал бинарного опциона в Telegram."""
-    from telegram import send_telegram_message
-    
+    """Ставит сигнал бинарного опциона в очередь рассылки Telegram."""
     # Форматируем пару для отображения
     display_pair = pair.replace('USDT', '/USD')
     
@@ -272,8 +497,11 @@ async def send_binary_signal_to_telegram(pair: str, timeframe: str, signal: dict
     # Форматируем время
     entry_time = datetime.fromtimestamp(signal['entry_time'] / 1000, tz=timezone.utc)
     
+    # Сигнал по незакрытой свече помечаем отдельно
+    provisional_note = "\n⚠️ Предварительный: свеча еще не закрыта" if signal.get('provisional') else ""
+    
     message = f"""
-🎯 **BINARY OPTIONS SIGNAL**
+🎯 **BINARY OPTIONS SIGNAL**{provisional_note}
 Стратегия: QuantumBinaryPrecisionV3
 
 💱 **Пара:** {display_pair}
@@ -298,5 +526,23 @@ async def send_binary_signal_to_telegram(pair: str, timeframe: str, signal: dict
 📊 Сигналов сегодня: {signal_analyzer.daily_signal_count}
     """
     
-    await send_telegram_message(message)
+    # Сигналы одного цикла диспетчер может объединить в одно сообщение
+    telegram_dispatcher.enqueue(message, coalesce=True)
   
+
+async def send_signal_cancelled_to_telegram(pair: str, timeframe: str, entry_time: int, signal_type: str):
+    """Ставит в очередь сообщение об отмене предварительного сигнала."""
+    display_pair = pair.replace('USDT', '/USD')
+    entry = datetime.fromtimestamp(entry_time / 1000, tz=timezone.utc)
+    
+    message = f"""
+❌ **СИГНАЛ ОТМЕНЕН**
+Закрытая свеча не подтвердила предварительный сигнал
+
+💱 **Пара:** {display_pair}
+⏱️ **Таймфрейм:** {timeframe}
+📊 **Направление:** {signal_type}
+🕐 **Время входа:** {entry.strftime('%H:%M:%S')} UTC
+    """
+    
+    telegram_dispatcher.enqueue(message, coalesce=True)
@@ -0,0 +1,112 @@
+import logging
+import time
+import numpy as np
+import pandas as pd
+from indicators import calculate_all_indicators
+from model import ai_model, MODEL_FEATURES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Синхронная часть анализа для воркеров исполнителя: только индикаторы, фильтры
+# и модель. Без БД, Telegram и состояния анализатора — процесс-воркер импортирует
+# только этот модуль.
+
+def passes_filters(latest) -> bool:
+    """Уровни 1–3 для одной строки признаков (Series или словарь строки движка)."""
+    # **Уровень 1: Усиленный импульсный фильтр для бинарных опционов**
+    volume_condition = (latest['volume'] > latest['sma_volume'] * 2.8) if not pd.isna(latest['sma_volume']) else False
+    momentum_condition = abs(latest['pct_change']) > 0.003 if not pd.isna(latest['pct_change']) else False
+
+    if not (volume_condition and momentum_condition):
+        logger.debug("Импульсный фильтр не пройден")
+        return False
+
+    # **Уровень 2: Конвергенция индикаторов**
+    macd_bullish = latest['macd_hist'] > 0 if not pd.isna(latest['macd_hist']) else False
+    vwap_bullish = latest['vwap_gradient'] > 0.001 if not pd.isna(latest['vwap_gradient']) else False
+    rsi_normal = 30 < latest['rsi'] < 70 if not pd.isna(latest['rsi']) else False
+
+    trend_score = sum([macd_bullish, vwap_bullish, rsi_normal])
+    if trend_score < 2:
+        logger.debug("Конвергенция индикаторов недостаточна")
+        return False
+
+    # **Уровень 3: Подтверждение разворота/продолжения**
+    supertrend_signal = latest['supertrend_signal'] != 0 if not pd.isna(latest['supertrend_signal']) else False
+    bb_not_squeezed = not latest['bb_squeeze'] if not pd.isna(latest['bb_squeeze']) else True
+    stoch_signal = latest['stoch_crossover'] != 0 if not pd.isna(latest['stoch_crossover']) else False
+
+    confirmation_score = sum([supertrend_signal, bb_not_squeezed, stoch_signal])
+    if confirmation_score < 2:
+        logger.debug("Подтверждение недостаточно")
+        return False
+
+    return True
+
+def filter_latest(data: pd.DataFrame) -> pd.Series | None:
+    """Последняя строка признаков, если данных достаточно и она прошла уровни 1–3."""
+    if data.empty or len(data) < 5:
+        return None
+    latest = data.iloc[-1]
+    return latest if passes_filters(latest) else None
+
+def extract_features(latest_data) -> np.ndarray | None:
+    """Извлекает признаки для модели."""
+    try:
+        features = []
+        for feature_name in MODEL_FEATURES:
+            if feature_name in latest_data:
+                value = latest_data[feature_name]
+                features.append(value if not pd.isna(value) else 0)
+            else:
+                features.append(0)
+        return np.array(features)
+    except Exception as e:
+        logger.error(f"Ошибка извлечения признаков: {e}")
+        return None
+
+def prepare_candidates(items: list) -> tuple:
+    """Индикаторы и уровни 1–3 для набора ключей. Выполняется в исполнителе.
+
+    items — список (pair, timeframe, data, has_indicators). Возвращает
+    (candidates, timings): (pair, timeframe, latest, features) для прошедших
+    фильтры ключей и (pair, timeframe, секунды) расчета индикаторов. Метрики
+    наблюдает event loop — в режиме "process" реестр воркера недоступен.
+    Дневной лимит проверяется до вызова, в event loop.
+    """
+    candidates = []
+    timings = []
+    for pair, timeframe, data, has_indicators in items:
+        try:
+            if has_indicators:
+                data_with_indicators = data
+            else:
+                # Рассчитываем индикаторы
+                start = time.perf_counter()
+                data_with_indicators = calculate_all_indicators(data)
+                timings.append((pair, timeframe, time.perf_counter() - start))
+
+            if data_with_indicators.empty:
+                logger.debug(f"Не удалось рассчитать индикаторы для {pair}-{timeframe}")
+                continue
+
+            latest = filter_latest(data_with_indicators)
+            if latest is None:
+                continue
+
+            features = extract_features(latest)
+            if features is not None:
+                candidates.append((pair, timeframe, latest, features))
+        except Exception as e:
+            logger.error(f"Ошибка анализа {pair}-{timeframe}: {e}")
+    return candidates, timings
+
+def score_candidates(features: np.ndarray) -> np.ndarray:
+    """Один батч-вызов модели для матрицы признаков N×16."""
+    return ai_model.predict_proba(features)[:, 1]
+
+def score_candidates_timed(features: np.ndarray) -> tuple:
+    """score_candidates для исполнителя: (вероятности, путь модели, секунды) без записи статистики."""
+    probabilities, path, seconds = ai_model.predict_proba_timed(features)
+    return probabilities[:, 1], path, seconds
@@ -0,0 +1,171 @@
+import asyncio
+import heapq
+import logging
+import time
+from globals import (
+    TIME_FRAMES, TIMEFRAME_MS, BINARY_OPTION_PAYOUT,
+    SIGNAL_RESOLVER_INTERVAL, SIGNAL_RESOLVE_DELAY, SIGNAL_RESOLVE_TIMEOUT
+)
+from database import load_pending_signals, load_exit_prices, save_signal_results
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Цена экспирации берется по самому мелкому сохраняемому таймфрейму
+RESOLVE_TIMEFRAME = min(TIME_FRAMES, key=TIMEFRAME_MS.get)
+
+def expiry_target_ms(timeframe: str, entry_time: int, expiry_time: str) -> int:
+    """Момент экспирации: закрытие свечи сигнала (entry_time — ее открытие) плюс экспирация."""
+    return entry_time + TIMEFRAME_MS[timeframe] + TIMEFRAME_MS[expiry_time]
+
+def signal_outcome(signal_type: str, entry_price: float, exit_price: float,
+                   payout: float = BINARY_OPTION_PAYOUT) -> tuple:
+    """(result, profit_loss) в долях ставки: CALL выигрывает при росте цены, PUT — при падении."""
+    won = exit_price > entry_price if signal_type == "CALL" else exit_price < entry_price
+    return ("WIN", payout) if won else ("LOSS", -1.0)
+
+class SignalResolver:
+    """Фоновое определение итогов сигналов по сохраненным свечам.
+
+    Неразрешенные сигналы хранятся в куче по моменту экспирации; новые
+    подгружаются по диапазону id, без сканирования таблицы. Все сигналы,
+    срок которых прошел, разрешаются пакетом: один запрос цен закрытия
+    и одна транзакция UPDATE result/profit_loss (статистику обновляют триггеры).
+    Сигнал без свечи экспирации ждет до SIGNAL_RESOLVE_TIMEOUT и помечается VOID.
+    """
+
+    def __init__(self, timeframe: str = RESOLVE_TIMEFRAME, payout: float = BINARY_OPTION_PAYOUT,
+                 delay: float = SIGNAL_RESOLVE_DELAY, timeout: float = SIGNAL_RESOLVE_TIMEOUT,
+                 interval: float = SIGNAL_RESOLVER_INTERVAL):
+        self.timeframe = timeframe
+        self.payout = payout
+        self.delay_ms = int(delay * 1000)
+        self.timeout_ms = int(timeout * 1000)
+        self.interval = interval
+        # (срок проверки мс, id, pair, signal_type, entry_price, момент экспирации мс)
+        self._heap = []
+        self.last_id = None  # None — неразрешенные сигналы еще не загружались
+        self.resolved = 0
+        self.wins = 0
+        self.losses = 0
+        self.voided = 0
+        self.retries = 0
+        self.batches = 0
+        self.last_batch_ms = 0.0
+        self.max_batch_ms = 0.0
+
+    def track(self, rows: list):
+        """Добавляет сигналы (строки load_pending_signals) в кучу экспираций."""
+        for signal_id, pair, timeframe, signal_type, entry_time, expiry_time, entry_price in rows:
+            self.last_id = max(self.last_id or 0, signal_id)
+            if timeframe not in TIMEFRAME_MS or expiry_time not in TIMEFRAME_MS:
+                logger.warning(f"Сигнал {signal_id}: неизвестный таймфрейм или экспирация")
+                continue
+            target = expiry_target_ms(timeframe, int(entry_time), expiry_time)
+            heapq.heappush(self._heap, (target + self.delay_ms, signal_id, pair, signal_type,
+                                        entry_price, target))
+
+    def pop_due(self, now_ms: int) -> list:
+        """Извлекает все сигналы, срок проверки которых наступил."""
+        due = []
+        while self._heap and self._heap[0][0] <= now_ms:
+            due.append(heapq.heappop(self._heap))
+        return due
+
+    def resolve(self, due: list, now_ms: int) -> tuple:
+        """Пакетное разрешение (выполняется в потоке): возвращает (итоги для БД, сигналы для повтора)."""
+        interval = TIMEFRAME_MS[self.timeframe]
+        requests, updates, retry = [], [], []
+        for item in due:
+            _, signal_id, pair, _, _, target = item
+            if target % interval:
+                # Момент экспирации не совпадает с закрытием свечи таймфрейма цены
+                updates.append(("VOID", 0.0, "VOID", signal_id))
+            else:
+                requests.append((signal_id, pair, target - interval))
+        prices = load_exit_prices(requests, self.timeframe) if requests else {}
+        for item in due:
+            _, signal_id, _, signal_type, entry_price, target = item
+            if target % interval:
+                continue
+            exit_price = None
+            if signal_id in prices:
+                # Цена входа из БД: подтверждение предварительного сигнала заменяет ее ценой закрытия
+                exit_price, entry_price, result = prices[signal_id]
+                if result is not None:
+                    continue  # Сигнал отменен или уже разрешен
+            if exit_price is not None and entry_price is not None:
+                result, profit_loss = signal_outcome(signal_type, entry_price, exit_price, self.payout)
+                updates.append((result, profit_loss, "RESOLVED", signal_id))
+            elif now_ms - target >= self.timeout_ms:
+                updates.append(("VOID", 0.0, "VOID", signal_id))
+            else:
+                retry.append(item)
+        save_signal_results(updates)
+        return updates, retry
+
+    async def tick(self, now_ms: int | None = None):
+        """Подгружает новые сигналы и разрешает истекшие."""
+        rows = await asyncio.to_thread(load_pending_signals, self.last_id)
+        if self.last_id is None:
+            self.last_id = 0
+            logger.info(f"Неразрешенных сигналов при запуске: {len(rows)}")
+        self.track(rows)
+
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        due = self.pop_due(now_ms)
+        if not due:
+            return
+        start = time.perf_counter()
+        updates, retry = await asyncio.to_thread(self.resolve, due, now_ms)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.batches += 1
+        self.last_batch_ms = elapsed_ms
+        self.max_batch_ms = max(self.max_batch_ms, elapsed_ms)
+
+        for result, _, _, _ in updates:
+            self.resolved += 1
+            self.wins += result == "WIN"
+            self.losses += result == "LOSS"
+            self.voided += result == "VOID"
+        # Свеча экспирации еще не записана — повторная проверка через delay
+        for item in retry:
+            self.retries += 1
+            heapq.heappush(self._heap, (now_ms + self.delay_ms, *item[1:]))
+        if updates:
+            logger.info(f"Разрешено сигналов: {len(updates)} за {elapsed_ms:.1f} мс, ожидают свечу: {len(retry)}")
+
+    def _sleep_time(self) -> float:
+        """До ближайшей экспирации, но не дольше interval (чтобы подхватывать новые сигналы)."""
+        if not self._heap:
+            return self.interval
+        return min(self.interval, max(0.0, self._heap[0][0] / 1000 - time.time()))
+
+    async def run(self):
+        """Фоновая задача разрешения сигналов."""
+        logger.info("Разрешение итогов сигналов запущено")
+        while True:
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка разрешения сигналов: {e}")
+            await asyncio.sleep(self._sleep_time())
+
+    def get_stats(self) -> dict:
+        return {
+            "pending": len(self._heap),
+            "next_expiry_ms": self._heap[0][5] if self._heap else None,
+            "resolved": self.resolved,
+            "wins": self.wins,
+            "losses": self.losses,
+            "voided": self.voided,
+            "retries": self.retries,
+            "batches": self.batches,
+            "last_batch_ms": self.last_batch_ms,
+            "max_batch_ms": self.max_batch_ms
+        }
+
+# Глобальный разрешатель итогов сигналов
+signal_resolver = SignalResolver()
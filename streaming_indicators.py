@@ -0,0 +1,441 @@
+import math
+import logging
+from collections import deque
+import numpy as np
+import pandas as pd
+from globals import *
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+NAN = float('nan')
+
+# Порядок колонок совпадает с результатом calculate_all_indicators
+FEATURE_COLUMNS = [
+    'open', 'high', 'low', 'close', 'volume',
+    'vwap', 'macd', 'macd_signal', 'macd_hist', 'rsi', 'supertrend',
+    'bb_upper', 'bb_middle', 'bb_lower', 'bb_width', 'bb_position',
+    'stoch_k', 'stoch_d', 'stoch_diff', 'atr', 'williams_r',
+    'sma_volume', 'volume_ratio', 'pct_change', 'vwap_gradient',
+    'vwap_distance', 'price_momentum', 'supertrend_signal', 'bb_squeeze',
+    'stoch_crossover', 'atr_normalized'
+]
+
+# Хранилище движков для каждой пары/таймфрейма
+indicator_engines = {}
+
+def _div(a: float, b: float) -> float:
+    """Деление с семантикой numpy (inf/nan вместо исключения)."""
+    try:
+        return a / b
+    except ZeroDivisionError:
+        if a != a or a == 0:
+            return NAN
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+class _RunningSum:
+    """Скользящая сумма в порядке операций TA-Lib (INT_SMA)."""
+
+    __slots__ = ('period', 'previous', 'total')
+
+    def __init__(self, period: int):
+        self.period = period
+        self.previous = deque(maxlen=period - 1)
+        self.total = 0.0
+
+    def compute(self, value: float) -> tuple:
+        """Возвращает (среднее, новая сумма) без изменения состояния."""
+        total = self.total + value
+        if len(self.previous) < self.period - 1:
+            return NAN, total
+        mean = total / self.period
+        trailing = self.previous[0] if self.previous else value
+        return mean, total - trailing
+
+    def commit(self, value: float, total: float):
+        self.previous.append(value)
+        self.total = total
+
+class _WilderATR:
+    """ATR с seed-значением SMA и сглаживанием Уайлдера, как в TA-Lib."""
+
+    __slots__ = ('period', 'count', 'total', 'value')
+
+    def __init__(self, period: int):
+        self.period = period
+        self.count = 0
+        self.total = 0.0
+        self.value = NAN
+
+    def compute(self, true_range: float) -> tuple:
+        """Возвращает (ATR, сумма для seed) для очередного true range."""
+        count = self.count + 1
+        if count < self.period:
+            return NAN, self.total + true_range
+        if count == self.period:
+            total = self.total + true_range
+            return total / self.period, total
+        return (self.value * (self.period - 1) + true_range) / self.period, self.total
+
+    def commit(self, value: float, total: float):
+        self.count += 1
+        self.total = total
+        self.value = value
+
+class StreamingIndicatorEngine:
+    """Инкрементальный расчет индикаторов для одной пары/таймфрейма.
+
+    Каждая закрытая свеча обновляет все индикаторы за O(1) относительно
+    длины истории. Значения совпадают с calculate_all_indicators, примененным
+    ко всей истории, поданной в движок (включая seed-значения TA-Lib);
+    VWAP считается по окну VWAP_PERIOD и совпадает с пересчетом любого окна
+    длиннее VWAP_PERIOD.
+    """
+
+    def __init__(self, max_rows: int = STREAMING_FEATURE_ROWS):
+        self.count = 0
+        self.last_timestamp = None
+        self.rows = deque(maxlen=max_rows)
+
+        self._prev_close = NAN
+        self._prev_closes = deque(maxlen=3)
+
+        # VWAP: (цена × объем, объем) последних VWAP_PERIOD - 1 свечей
+        self._vwap_window = deque(maxlen=VWAP_PERIOD - 1)
+        self._vwap = NAN
+
+        # MACD
+        self._macd_fast_sum = 0.0
+        self._macd_slow_sum = 0.0
+        self._macd_signal_sum = 0.0
+        self._ema_fast = NAN
+        self._ema_slow = NAN
+        self._macd_signal = NAN
+
+        # RSI
+        self._rsi_gain = 0.0
+        self._rsi_loss = 0.0
+
+        # ATR / Supertrend
+        self._atr = _WilderATR(ATR_PERIOD)
+        self._supertrend_atr = _WilderATR(SUPERTREND_PERIOD)
+        self._final_upper = NAN
+        self._final_lower = NAN
+        self._supertrend = NAN
+
+        # Bollinger Bands
+        self._bb_sum = _RunningSum(BOLLINGER_PERIOD)
+        self._bb_sum_sq = _RunningSum(BOLLINGER_PERIOD)
+        self._bb_widths = deque(maxlen=19)
+
+        # Stochastic / Williams %R
+        self._highs = deque(maxlen=max(STOCH_K_PERIOD, 14) - 1)
+        self._lows = deque(maxlen=max(STOCH_K_PERIOD, 14) - 1)
+        self._slow_k = _RunningSum(STOCH_SMOOTH_K_PERIOD)
+        self._slow_d = _RunningSum(STOCH_D_PERIOD)
+        self._fastk_count = 0
+        self._prev_stoch_k = NAN
+        self._prev_stoch_d = NAN
+
+        # Объем
+        self._volume_sum = _RunningSum(20)
+
+    def update(self, candle: dict) -> dict | None:
+        """Добавляет закрытую свечу. Возвращает строку признаков, если она полная."""
+        return self.update_values(int(candle['timestamp']), float(candle['open']), float(candle['high']),
+                                  float(candle['low']), float(candle['close']), float(candle['volume']))
+
+    def update_values(self, timestamp: int, o: float, h: float, l: float,
+                      c: float, v: float) -> dict | None:
+        """То же, что update, но без промежуточного словаря свечи."""
+        if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+            logger.debug(f"Пропуск устаревшей свечи {timestamp}")
+            return None
+        row, state = self._compute(o, h, l, c, v)
+        self._commit(state)
+        self.last_timestamp = timestamp
+        if row is not None:
+            self.rows.append((timestamp, row))
+        return row
+
+    def peek_values(self, timestamp: int, o: float, h: float, l: float,
+                    c: float, v: float) -> dict | None:
+        """Строка признаков для незакрытой свечи без изменения состояния движка (O(1))."""
+        if self.last_timestamp is not None and timestamp <= self.last_timestamp:
+            return None
+        row, _ = self._compute(o, h, l, c, v)
+        return row
+
+    def peek_frame(self, timestamp: int, o: float, h: float, l: float,
+                   c: float, v: float) -> pd.DataFrame:
+        """Последние полные строки плюс предварительная строка незакрытой свечи."""
+        row = self.peek_values(timestamp, o, h, l, c, v)
+        if row is None:
+            return pd.DataFrame()
+        rows = list(self.rows) + [(timestamp, row)]
+        index = pd.to_datetime([ts for ts, _ in rows], unit='ms')
+        index.name = 'timestamp'
+        return pd.DataFrame([r for _, r in rows], index=index, columns=FEATURE_COLUMNS)
+
+    def latest_frame(self) -> pd.DataFrame:
+        """Возвращает последние полные строки признаков в формате batch-расчета."""
+        if not self.rows:
+            return pd.DataFrame()
+        index = pd.to_datetime([ts for ts, _ in self.rows], unit='ms')
+        index.name = 'timestamp'
+        return pd.DataFrame([row for _, row in self.rows], index=index, columns=FEATURE_COLUMNS)
+
+    def _compute(self, o: float, h: float, l: float, c: float, v: float) -> tuple:
+        """Рассчитывает строку признаков и новое состояние, не изменяя движок."""
+        i = self.count
+        prev_close = self._prev_close
+
+        # VWAP (скользящее окно, с forward fill); суммы окна пересчитываются, чтобы не копить ошибку
+        price_volume = ((h + l + c) / 3) * v
+        window_pv = sum(pv for pv, _ in self._vwap_window) + price_volume
+        window_volume = sum(volume for _, volume in self._vwap_window) + v
+        vwap = _div(window_pv, window_volume)
+        if vwap != vwap:
+            vwap = self._vwap
+
+        # MACD: seed-значения EMA — SMA, как в TA-Lib
+        fast_sum, slow_sum, signal_sum = self._macd_fast_sum, self._macd_slow_sum, self._macd_signal_sum
+        ema_fast, ema_slow, macd_signal = self._ema_fast, self._ema_slow, self._macd_signal
+        macd = macd_signal_out = macd_hist = NAN
+        slow_start = MACD_SLOW_PERIOD - 1
+        signal_start = slow_start + MACD_SIGNAL_PERIOD - 1
+        if i <= slow_start:
+            slow_sum += c
+            if i >= MACD_SLOW_PERIOD - MACD_FAST_PERIOD:
+                fast_sum += c
+            if i == slow_start:
+                ema_slow = slow_sum / MACD_SLOW_PERIOD
+                ema_fast = fast_sum / MACD_FAST_PERIOD
+        else:
+            ema_fast = (c - ema_fast) * (2.0 / (MACD_FAST_PERIOD + 1)) + ema_fast
+            ema_slow = (c - ema_slow) * (2.0 / (MACD_SLOW_PERIOD + 1)) + ema_slow
+        if i >= slow_start:
+            macd_line = ema_fast - ema_slow
+            if i <= signal_start:
+                signal_sum += macd_line
+                if i == signal_start:
+                    macd_signal = signal_sum / MACD_SIGNAL_PERIOD
+            else:
+                macd_signal = (macd_line - macd_signal) * (2.0 / (MACD_SIGNAL_PERIOD + 1)) + macd_signal
+            if i >= signal_start:
+                macd = macd_line
+                macd_signal_out = macd_signal
+                macd_hist = macd_line - macd_signal
+
+        # RSI (Уайлдер)
+        rsi_gain, rsi_loss = self._rsi_gain, self._rsi_loss
+        rsi = NAN
+        if i >= 1:
+            change = c - prev_close
+            if i > RSI_PERIOD:
+                rsi_loss *= (RSI_PERIOD - 1)
+                rsi_gain *= (RSI_PERIOD - 1)
+            if change < 0:
+                rsi_loss -= change
+            else:
+                rsi_gain += change
+            if i >= RSI_PERIOD:
+                rsi_loss /= RSI_PERIOD
+                rsi_gain /= RSI_PERIOD
+                total = rsi_gain + rsi_loss
+                rsi = 100.0 * (rsi_gain / total) if not (-1e-8 < total < 1e-8) else 0.0
+
+        # True Range / ATR
+        atr = atr_total = st_atr = st_atr_total = NAN
+        if i >= 1:
+            true_range = max(h - l, abs(prev_close - h), abs(prev_close - l))
+            atr, atr_total = self._atr.compute(true_range)
+            st_atr, st_atr_total = self._supertrend_atr.compute(true_range)
+
+        # Supertrend
+        hl2 = (h + l) / 2
+        basic_upper = hl2 + (SUPERTREND_MULTIPLIER * st_atr)
+        basic_lower = hl2 - (SUPERTREND_MULTIPLIER * st_atr)
+        if i == 0:
+            final_upper, final_lower = basic_upper, basic_lower
+            supertrend = final_upper if c <= final_upper else final_lower
+        else:
+            prev_upper, prev_lower, prev_supertrend = self._final_upper, self._final_lower, self._supertrend
+            final_upper = max(basic_upper, prev_upper) if prev_close > prev_upper else basic_upper
+            final_lower = min(basic_lower, prev_lower) if prev_close < prev_lower else basic_lower
+            if prev_supertrend == prev_upper and c <= final_upper:
+                supertrend = final_upper
+            elif prev_supertrend == prev_upper and c > final_upper:
+                supertrend = final_lower
+            elif prev_supertrend == prev_lower and c >= final_lower:
+                supertrend = final_lower
+            else:
+                supertrend = final_upper
+
+        # Bollinger Bands (SMA + популяционное стандартное отклонение)
+        bb_middle, bb_total = self._bb_sum.compute(c)
+        mean_sq, bb_total_sq = self._bb_sum_sq.compute(c * c)
+        bb_upper = bb_lower = NAN
+        if bb_middle == bb_middle:
+            variance = mean_sq - bb_middle * bb_middle
+            deviation = math.sqrt(variance) if not variance < 1e-8 else 0.0
+            bb_upper = bb_middle + deviation * BOLLINGER_NUM_STD_DEV
+            bb_lower = bb_middle - deviation * BOLLINGER_NUM_STD_DEV
+        bb_width = _div(bb_upper - bb_lower, bb_middle)
+        bb_position = _div(c - bb_lower, bb_upper - bb_lower)
+        bb_window = list(self._bb_widths) + [bb_width]
+        bb_squeeze = False
+        if len(bb_window) == 20 and all(w == w for w in bb_window):
+            bb_squeeze = bb_width < (sum(bb_window) / 20) * 0.8
+
+        # Stochastic
+        stoch_k = stoch_d = NAN
+        slow_k = slow_k_total = slow_d = slow_d_total = NAN
+        if i >= STOCH_K_PERIOD - 1:
+            highest = max(max(list(self._highs)[-(STOCH_K_PERIOD - 1):], default=h), h)
+            lowest = min(min(list(self._lows)[-(STOCH_K_PERIOD - 1):], default=l), l)
+            diff = (highest - lowest) / 100.0
+            fast_k = (c - lowest) / diff if diff != 0.0 else 0.0
+            slow_k, slow_k_total = self._slow_k.compute(fast_k)
+            if slow_k == slow_k:
+                slow_d, slow_d_total = self._slow_d.compute(slow_k)
+                if slow_d == slow_d:
+                    stoch_k, stoch_d = slow_k, slow_d
+        else:
+            fast_k = NAN
+
+        # Williams %R
+        williams_r = NAN
+        if i >= 13:
+            highest = max(max(list(self._highs)[-13:], default=h), h)
+            lowest = min(min(list(self._lows)[-13:], default=l), l)
+            diff = (highest - lowest) / (-100.0)
+            williams_r = (highest - c) / diff if diff != 0.0 else 0.0
+
+        # Объем
+        sma_volume, volume_total = self._volume_sum.compute(v)
+
+        # Производные
+        pct_change = _div(c, prev_close) - 1 if i >= 1 else NAN
+        momentum_base = self._prev_closes[0] if len(self._prev_closes) == 3 else NAN
+        price_momentum = _div(c, momentum_base) - 1 if i >= 3 else NAN
+        vwap_gradient = vwap - self._vwap if i >= 1 else NAN
+
+        supertrend_signal = 1 if c > supertrend else (-1 if c < supertrend else 0)
+        stoch_crossover = 0
+        if stoch_k > stoch_d and self._prev_stoch_k <= self._prev_stoch_d:
+            stoch_crossover = 1
+        if stoch_k < stoch_d and self._prev_stoch_k >= self._prev_stoch_d:
+            stoch_crossover = -1
+
+        row = {
+            'open': o, 'high': h, 'low': l, 'close': c, 'volume': v,
+            'vwap': vwap,
+            'macd': macd, 'macd_signal': macd_signal_out, 'macd_hist': macd_hist,
+            'rsi': rsi,
+            'supertrend': supertrend,
+            'bb_upper': bb_upper, 'bb_middle': bb_middle, 'bb_lower': bb_lower,
+            'bb_width': bb_width, 'bb_position': bb_position,
+            'stoch_k': stoch_k, 'stoch_d': stoch_d, 'stoch_diff': stoch_k - stoch_d,
+            'atr': atr,
+            'williams_r': williams_r,
+            'sma_volume': sma_volume, 'volume_ratio': _div(v, sma_volume),
+            'pct_change': pct_change,
+            'vwap_gradient': vwap_gradient,
+            'vwap_distance': _div(c - vwap, vwap),
+            'price_momentum': price_momentum,
+            'supertrend_signal': supertrend_signal,
+            'bb_squeeze': bb_squeeze,
+            'stoch_crossover': stoch_crossover,
+            'atr_normalized': _div(atr, c),
+        }
+        complete = all(value == value for value in row.values())
+
+        state = {
+            'close': c, 'high': h, 'low': l,
+            'vwap_entry': (price_volume, v), 'vwap': vwap,
+            'macd': (fast_sum, slow_sum, signal_sum, ema_fast, ema_slow, macd_signal),
+            'rsi': (rsi_gain, rsi_loss),
+            'atr': (atr, atr_total, st_atr, st_atr_total, true_range if i >= 1 else None),
+            'supertrend': (final_upper, final_lower, supertrend),
+            'bb': (c, bb_total, bb_total_sq, bb_width),
+            'stoch': (fast_k, slow_k, slow_k_total, slow_d, slow_d_total, stoch_k, stoch_d),
+            'volume': (v, volume_total),
+        }
+        return (row if complete else None), state
+
+    def _commit(self, state: dict):
+        """Применяет состояние, рассчитанное в _compute."""
+        c = state['close']
+        self.count += 1
+        self._prev_closes.append(c)
+        self._prev_close = c
+        self._highs.append(state['high'])
+        self._lows.append(state['low'])
+
+        self._vwap_window.append(state['vwap_entry'])
+        self._vwap = state['vwap']
+
+        (self._macd_fast_sum, self._macd_slow_sum, self._macd_signal_sum,
+         self._ema_fast, self._ema_slow, self._macd_signal) = state['macd']
+
+        self._rsi_gain, self._rsi_loss = state['rsi']
+
+        atr, atr_total, st_atr, st_atr_total, true_range = state['atr']
+        if true_range is not None:
+            self._atr.commit(atr, atr_total)
+            self._supertrend_atr.commit(st_atr, st_atr_total)
+
+        self._final_upper, self._final_lower, self._supertrend = state['supertrend']
+
+        close, bb_total, bb_total_sq, bb_width = state['bb']
+        self._bb_sum.commit(close, bb_total)
+        self._bb_sum_sq.commit(close * close, bb_total_sq)
+        self._bb_widths.append(bb_width)
+
+        fast_k, slow_k, slow_k_total, slow_d, slow_d_total, stoch_k, stoch_d = state['stoch']
+        if fast_k == fast_k:
+            self._slow_k.commit(fast_k, slow_k_total)
+            if slow_k == slow_k:
+                self._slow_d.commit(slow_k, slow_d_total)
+        self._prev_stoch_k, self._prev_stoch_d = stoch_k, stoch_d
+
+        volume, volume_total = state['volume']
+        self._volume_sum.commit(volume, volume_total)
+
+def get_indicator_engine(key: str) -> StreamingIndicatorEngine:
+    """Возвращает движок индикаторов ключа, создавая его при первом обращении."""
+    engine = indicator_engines.get(key)
+    if engine is None:
+        engine = indicator_engines[key] = StreamingIndicatorEngine()
+    return engine
+
+def update_indicator_engine(key: str, candle: dict) -> dict | None:
+    """Обновляет движок индикаторов для ключа новой закрытой свечой."""
+    return get_indicator_engine(key).update(candle)
+
+def warm_up_indicator_engine(key: str, candles: list):
+    """Прогревает движок индикаторов историческими свечами."""
+    for candle in candles:
+        update_indicator_engine(key, candle)
+
+def warm_up_indicator_engine_arrays(key: str, timestamps: np.ndarray, ohlcv: np.ndarray):
+    """Прогревает движок из массивов: timestamps в мс и матрица (n, 5) open/high/low/close/volume."""
+    engine = get_indicator_engine(key)
+    for timestamp, (o, h, l, c, v) in zip(timestamps.tolist(), ohlcv.tolist()):
+        engine.update_values(timestamp, o, h, l, c, v)
+
+def peek_indicators(pair: str, timeframe: str, timestamp: int, o: float, h: float,
+                    l: float, c: float, v: float) -> pd.DataFrame:
+    """Признаки с предварительной строкой для незакрытой свечи (состояние движка не меняется)."""
+    engine = indicator_engines.get(f"{pair}_{timeframe}")
+    if engine is None:
+        return pd.DataFrame()
+    return engine.peek_frame(timestamp, o, h, l, c, v)
+
+def get_latest_indicators(pair: str, timeframe: str) -> pd.DataFrame:
+    """Возвращает последние строки признаков для пары/таймфрейма."""
+    engine = indicator_engines.get(f"{pair}_{timeframe}")
+    if engine is None:
+        return pd.DataFrame()
+    return engine.latest_frame()
@@ -3,8 +3,9 @@ from telegram import Update, Bot
 from telegram.ext import Application, CommandHandler, ContextTypes
 import asyncio
 import logging
-from globals import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, BOT_ACTIVE
-from database import init_db, get_daily_statistics
+from globals import TELEGRAM_BOT_TOKEN, BOT_ACTIVE
+from database import init_db, get_daily_statistics_async
+from telegram_dispatcher import telegram_dispatcher
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -13,34 +14,25 @@ logger = logging.getLogger(__name__)
 bot = Bot(token=TELEGRAM_BOT_TOKEN)
 application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
 
-# Глобальная переменная для хранения chat_id
-current_chat_id = TELEGRAM_CHAT_ID
+async def deliver_message(chat_id: str, message: str):
+    """Отправляет сообщение в один чат (вызывается диспетчером рассылки)."""
+    await bot.send_message(
+        chat_id=chat_id, 
+        text=message, 
+        parse_mode='Markdown'
+    )
 
-async def send_telegram_message(message: str):
-    """Отправляет сообщение в Telegram."""
-    global current_chat_id
-    
-    if not current_chat_id:
-        logger.error("Chat ID не установлен")
-        return
-        
-    try:
-        await bot.send_message(
-            chat_id=current_chat_id, 
-            text=message, 
-            parse_mode='Markdown'
-        )
-        logger.debug("Сообщение отправлено в Telegram")
-    except Exception as e:
-        logger.error(f"Ошибка отправки сообщения: {e}")
+telegram_dispatcher.sender = deliver_message
+
+async def send_telegram_message(message: str, coalesce: bool = False):
+    """Ставит сообщение в очередь рассылки всем подписчикам (без ожидания отправки)."""
+    telegram_dispatcher.enqueue(message, coalesce=coalesce)
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start."""
-    global current_chat_id
-    
     user_id = update.effective_chat.id
     username = update.effective_user.username or update.effective_user.first_name
-    current_chat_id = str(user_id)
+    await telegram_dispatcher.subscribe(str(user_id), username)
     
     logger.info(f"Пользователь {username} (ID: {user_id}) запустил бота")
     
@@ -56,6 +48,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • `/run_analysis` - Начать анализ рынка
 • `/stop_analysis` - Остановить анализ
 • `/stats` - Статистика за день
+• `/unsubscribe` - Отписаться от сигналов
 • `/help` - Помощь
 
 **Особенности:**
@@ -126,7 +119,7 @@ async def stop_analysis_command(update: Update, context: ContextTypes.DEFAULT_TY
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает статистику за день."""
     try:
-        total_signals, wins = get_daily_statistics()
+        total_signals, wins = await get_daily_statistics_async()
         win_rate = (wins / total_signals * 100) if total_signals > 0 else 0
         
         stats_message = f"""
@@ -147,6 +140,12 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         await update.message.reply_text(f"Ошибка получения статистики: {e}")
 
+async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отключает рассылку сигналов для чата."""
+    await telegram_dispatcher.unsubscribe(str(update.effective_chat.id))
+    await update.message.reply_text("🔕 Рассылка сигналов отключена. Для подписки используйте `/start`",
+                                    parse_mode='Markdown')
+
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает справку."""
     help_message = """
@@ -157,6 +156,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 • `/run_analysis` - Начать анализ рынка
 • `/stop_analysis` - Остановить анализ
 • `/stats` - Статистика за день
+• `/unsubscribe` - Отписаться от сигналов
 • `/help` - Эта справка
 
 **Как пользоваться:**
@@ -183,6 +183,7 @@ def setup_telegram_handlers():
     application.add_handler(CommandHandler("run_analysis", run_analysis_command))
     application.add_handler(CommandHandler("stop_analysis", stop_analysis_command))
     application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("unsubscribe", unsubscribe_command))
     application.add_handler(CommandHandler("help", help_command))
 
 async def start_telegram_bot():
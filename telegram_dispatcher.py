@@ -0,0 +1,319 @@
+import asyncio
+import logging
+import time
+from globals import (
+    TELEGRAM_CHAT_ID, TELEGRAM_QUEUE_SIZE, TELEGRAM_SEND_CONCURRENCY, TELEGRAM_GLOBAL_RATE,
+    TELEGRAM_CHAT_INTERVAL, TELEGRAM_MAX_RETRIES, TELEGRAM_RETRY_DELAY,
+    TELEGRAM_COALESCE_SIGNALS, TELEGRAM_COALESCE_WINDOW, TELEGRAM_MAX_MESSAGE_LENGTH
+)
+from database import save_subscriber, deactivate_subscriber, load_subscribers
+from metrics import telegram_send_seconds, telegram_messages_total
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+COALESCE_SEPARATOR = "\n➖➖➖➖➖➖➖➖\n"
+
+# Ошибки Bot API, после которых чат больше не получает рассылку (бот заблокирован, чат удален)
+UNSUBSCRIBE_ERRORS = ("Forbidden",)
+# Группа стала супергруппой: рассылка продолжается в чат e.new_chat_id
+MIGRATE_ERROR = "ChatMigrated"
+
+class _RateLimiter:
+    """Равномерный темп: не больше rate разрешений в секунду."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+
+    async def acquire(self):
+        now = time.monotonic()
+        slot = max(now, self._next)
+        self._next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+def _split_lines(text: str, max_length: int) -> list:
+    """Режет текст по границам строк, чтобы не разорвать разметку Markdown.
+
+    Строка длиннее max_length (в сигналах не встречается) режется по символам.
+    """
+    chunks = []
+    current = None
+    for line in text.split("\n"):
+        while len(line) > max_length:
+            if current is not None:
+                chunks.append(current)
+                current = None
+            chunks.append(line[:max_length])
+            line = line[max_length:]
+        candidate = line if current is None else f"{current}\n{line}"
+        if len(candidate) > max_length:
+            chunks.append(current)
+            candidate = line
+        current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+def split_message(parts: list, max_length: int = TELEGRAM_MAX_MESSAGE_LENGTH,
+                  separator: str = COALESCE_SEPARATOR) -> list:
+    """Объединяет части в сообщения не длиннее max_length.
+
+    Сообщения делятся только между частями; часть длиннее лимита режется по строкам.
+    """
+    messages = []
+    current = ""
+    for part in parts:
+        if len(part) > max_length:
+            if current:
+                messages.append(current)
+            *chunks, part = _split_lines(part, max_length)
+            messages.extend(chunks)
+            current = ""
+        candidate = f"{current}{separator}{part}" if current else part
+        if len(candidate) > max_length:
+            messages.append(current)
+            candidate = part
+        current = candidate
+    if current:
+        messages.append(current)
+    return messages
+
+class TelegramDispatcher:
+    """Исходящая рассылка Telegram отдельной задачей.
+
+    Анализ только ставит сообщения в очередь (enqueue не ждет сети).
+    Диспетчер размножает их по подписчикам из таблицы telegram_subscribers,
+    у каждого чата своя очередь с паузой TELEGRAM_CHAT_INTERVAL, общий темп
+    ограничен TELEGRAM_GLOBAL_RATE, параллельность — TELEGRAM_SEND_CONCURRENCY.
+    Ошибки повторяются с экспоненциальной задержкой (или Retry-After от API).
+    Сигналы, пришедшие в пределах окна объединения, уходят одним сообщением.
+    """
+
+    def __init__(self, sender=None, queue_size: int = TELEGRAM_QUEUE_SIZE,
+                 concurrency: int = TELEGRAM_SEND_CONCURRENCY, global_rate: float = TELEGRAM_GLOBAL_RATE,
+                 chat_interval: float = TELEGRAM_CHAT_INTERVAL, max_retries: int = TELEGRAM_MAX_RETRIES,
+                 retry_delay: float = TELEGRAM_RETRY_DELAY, coalesce: bool = TELEGRAM_COALESCE_SIGNALS,
+                 coalesce_window: float = TELEGRAM_COALESCE_WINDOW):
+        # sender(chat_id, text) — корутина отправки (задается модулем telegram)
+        self.sender = sender
+        self.queue_size = queue_size
+        self.concurrency = concurrency
+        self.chat_interval = chat_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.coalesce = coalesce
+        self.coalesce_window = coalesce_window
+        self._limiter = _RateLimiter(global_rate)
+        self._queue = None
+        self._semaphore = None
+        self._task = None
+        self._subscribers = set()
+        self._chat_queues = {}  # chat_id -> asyncio.Queue
+        self._chat_tasks = {}   # chat_id -> задача доставки
+        self.enqueued = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.retries = 0
+        self.failed = 0
+        self.max_send_ms = 0.0
+        self._total_send_ms = 0.0
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """Загружает подписчиков и запускает задачу рассылки."""
+        if self.is_running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._subscribers = set(await asyncio.to_thread(load_subscribers))
+        if TELEGRAM_CHAT_ID:
+            self._subscribers.add(str(TELEGRAM_CHAT_ID))
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Рассылка Telegram запущена, подписчиков: {len(self._subscribers)}")
+
+    async def stop(self, timeout: float = 10.0):
+        """Дожидается доставки очереди (не дольше timeout) и останавливает задачи."""
+        if not self.is_running:
+            return
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Очередь Telegram не доставлена полностью до остановки")
+        tasks = [self._task, *self._chat_tasks.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._chat_tasks.clear()
+        self._chat_queues.clear()
+        logger.info("Рассылка Telegram остановлена")
+
+    async def _drain(self):
+        await self._queue.join()
+        for chat_queue in list(self._chat_queues.values()):
+            await chat_queue.join()
+
+    def enqueue(self, text: str, coalesce: bool = False) -> bool:
+        """Ставит сообщение всем подписчикам в очередь, не дожидаясь отправки."""
+        if not self.is_running:
+            logger.debug("Рассылка Telegram не запущена, сообщение пропущено")
+            return False
+        try:
+            self._queue.put_nowait((text, coalesce and self.coalesce))
+            self.enqueued += 1
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.error("Очередь Telegram переполнена, сообщение отброшено")
+            return False
+
+    async def subscribe(self, chat_id: str, username: str | None = None):
+        """Добавляет чат в рассылку и сохраняет его в БД."""
+        self._subscribers.add(str(chat_id))
+        await asyncio.to_thread(save_subscriber, str(chat_id), username)
+
+    async def unsubscribe(self, chat_id: str):
+        """Исключает чат из рассылки; недоставленные ему сообщения отбрасываются."""
+        chat_id = str(chat_id)
+        self._subscribers.discard(chat_id)
+        task = self._chat_tasks.pop(chat_id, None)
+        chat_queue = self._chat_queues.pop(chat_id, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+        # Помечаем отброшенное выполненным, чтобы stop() не ждал его
+        while chat_queue is not None and not chat_queue.empty():
+            chat_queue.get_nowait()
+            chat_queue.task_done()
+        await asyncio.to_thread(deactivate_subscriber, chat_id)
+
+    async def _run(self):
+        while True:
+            text, coalesce = await self._queue.get()
+            if not coalesce:
+                self._fan_out([text])
+                self._queue.task_done()
+                continue
+            # Собираем сигналы окна объединения в одно сообщение
+            parts = [text]
+            following = None  # Обычное сообщение закрывает окно, порядок сохраняется
+            deadline = time.monotonic() + self.coalesce_window
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    text, coalesce = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if not coalesce:
+                    following = text
+                    break
+                parts.append(text)
+            self.coalesced += len(parts) - 1
+            self._fan_out(split_message(parts))
+            if following is not None:
+                self._fan_out([following])
+            for _ in range(len(parts) + (following is not None)):
+                self._queue.task_done()
+
+    async def migrate(self, chat_id: str, new_chat_id: str, text: str):
+        """Переносит подписку и недоставленные сообщения в новый чат; text отправляется туда повторно."""
+        chat_id, new_chat_id = str(chat_id), str(new_chat_id)
+        await self.subscribe(new_chat_id)
+        new_queue = self._get_chat_queue(new_chat_id)
+        new_queue.put_nowait(text)
+        chat_queue = self._chat_queues.get(chat_id)
+        while chat_queue is not None and not chat_queue.empty():
+            new_queue.put_nowait(chat_queue.get_nowait())
+            chat_queue.task_done()
+        await self.unsubscribe(chat_id)
+
+    def _get_chat_queue(self, chat_id: str) -> asyncio.Queue:
+        """Очередь чата; при первом обращении запускается задача доставки."""
+        chat_queue = self._chat_queues.get(chat_id)
+        if chat_queue is None:
+            chat_queue = self._chat_queues[chat_id] = asyncio.Queue()
+            self._chat_tasks[chat_id] = asyncio.create_task(self._chat_worker(chat_id, chat_queue))
+        return chat_queue
+
+    def _fan_out(self, messages: list):
+        """Раскладывает сообщения по очередям чатов подписчиков."""
+        for chat_id in self._subscribers:
+            chat_queue = self._get_chat_queue(chat_id)
+            for message in messages:
+                chat_queue.put_nowait(message)
+
+    async def _chat_worker(self, chat_id: str, chat_queue: asyncio.Queue):
+        """Доставка в один чат по порядку, не чаще chat_interval."""
+        while True:
+            text = await chat_queue.get()
+            try:
+                await self._deliver(chat_id, text)
+            finally:
+                chat_queue.task_done()
+            if self._chat_queues.get(chat_id) is not chat_queue:
+                return  # Чат отписан во время доставки
+            await asyncio.sleep(self.chat_interval)
+
+    async def _deliver(self, chat_id: str, text: str):
+        for attempt in range(self.max_retries + 1):
+            await self._limiter.acquire()
+            start = time.perf_counter()
+            try:
+                async with self._semaphore:
+                    await self.sender(chat_id, text)
+            except Exception as e:
+                if type(e).__name__ == MIGRATE_ERROR and getattr(e, 'new_chat_id', None):
+                    logger.warning(f"Чат {chat_id} перенесен в {e.new_chat_id}, переподписываем")
+                    telegram_messages_total.labels("migrated").inc()
+                    await self.migrate(chat_id, e.new_chat_id, text)
+                    return
+                if type(e).__name__ in UNSUBSCRIBE_ERRORS:
+                    logger.warning(f"Чат {chat_id} недоступен ({e}), отписываем")
+                    telegram_messages_total.labels("unsubscribed").inc()
+                    await self.unsubscribe(chat_id)
+                    return
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    telegram_messages_total.labels("failed").inc()
+                    logger.error(f"Не удалось отправить сообщение в чат {chat_id}: {e}")
+                    return
+                # Bot API сообщает паузу в retry_after (секунды или timedelta)
+                retry_after = getattr(e, 'retry_after', None)
+                if hasattr(retry_after, 'total_seconds'):
+                    retry_after = retry_after.total_seconds()
+                delay = float(retry_after) if retry_after else self.retry_delay * 2 ** attempt
+                self.retries += 1
+                telegram_messages_total.labels("retry").inc()
+                logger.warning(f"Ошибка отправки в чат {chat_id}: {e}, повтор через {delay:.1f} с")
+                await asyncio.sleep(delay)
+                continue
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.sent += 1
+            self._total_send_ms += elapsed_ms
+            telegram_send_seconds.observe(elapsed_ms / 1000)
+            telegram_messages_total.labels("sent").inc()
+            self.max_send_ms = max(self.max_send_ms, elapsed_ms)
+            return
+
+    def get_stats(self) -> dict:
+        return {
+            "running": self.is_running,
+            "subscribers": len(self._subscribers),
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "chat_queue_depth": sum(q.qsize() for q in self._chat_queues.values()),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "sent": self.sent,
+            "retries": self.retries,
+            "failed": self.failed,
+            "avg_send_ms": self._total_send_ms / self.sent if self.sent else 0.0,
+            "max_send_ms": self.max_send_ms
+        }
+
+# Глобальный диспетчер исходящих сообщений
+telegram_dispatcher = TelegramDispatcher()
@@ -0,0 +1,197 @@
+import math
+import logging
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba — необязательное ускорение
+    njit = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Константа LightGBM kZeroThreshold (1e-35f): такие значения предиктор считает нулем
+ZERO_THRESHOLD = float(np.float32(1e-35))
+# LightGBM ограничивает значения признаков диапазоном ±1e300 (Common::AvoidInf)
+MAX_VALUE = 1e300
+
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+_MISSING_TYPES = {"None": MISSING_NONE, "Zero": MISSING_ZERO, "NaN": MISSING_NAN}
+
+def _evaluate_kernel(X, roots, split_feature, threshold, left, right, default_left, missing_type, value, out):
+    """Проход по деревьям для каждой строки (правила NumericalDecision из LightGBM)."""
+    for r in range(X.shape[0]):
+        total = 0.0
+        for t in range(roots.shape[0]):
+            node = roots[t]
+            while split_feature[node] >= 0:
+                x = X[r, split_feature[node]]
+                missing = missing_type[node]
+                if math.isnan(x):
+                    if missing != MISSING_NAN:
+                        x = 0.0
+                elif -ZERO_THRESHOLD <= x <= ZERO_THRESHOLD:
+                    x = 0.0
+                elif x > MAX_VALUE:
+                    x = MAX_VALUE
+                elif x < -MAX_VALUE:
+                    x = -MAX_VALUE
+                if ((missing == MISSING_ZERO and -ZERO_THRESHOLD <= x <= ZERO_THRESHOLD)
+                        or (missing == MISSING_NAN and math.isnan(x))):
+                    node = left[node] if default_left[node] else right[node]
+                elif x <= threshold[node]:
+                    node = left[node]
+                else:
+                    node = right[node]
+            total += value[node]
+        out[r] = total
+    return out
+
+if njit is not None:
+    _evaluate_kernel_jit = njit(cache=True, nogil=True)(_evaluate_kernel)
+else:
+    _evaluate_kernel_jit = None
+
+class CompiledTreeEnsemble:
+    """Бинарный LightGBM-бустер, развернутый в плоские NumPy-массивы узлов.
+
+    Все деревья хранятся в общих массивах (признак, порог, потомки, правила
+    пропусков, значение листа); лист помечается split_feature = -1.
+    Поддерживаются только числовые сплиты и бинарная логистическая цель.
+    """
+
+    def __init__(self, booster):
+        dump = booster.dump_model()
+        if dump.get("num_class", 1) != 1 or dump.get("num_tree_per_iteration", 1) != 1:
+            raise ValueError("Поддерживаются только бинарные модели")
+        objective = dump.get("objective", "")
+        if not objective.startswith(("binary", "cross_entropy", "xentropy")):
+            raise ValueError(f"Неподдерживаемая цель: {objective}")
+        self.sigmoid = 1.0
+        for token in objective.split():
+            if token.startswith("sigmoid:"):
+                self.sigmoid = float(token.split(":", 1)[1])
+        self.num_features = dump["max_feature_idx"] + 1
+
+        split_feature, threshold, left, right = [], [], [], []
+        default_left, missing_type, value = [], [], []
+        roots = []
+        self.max_depth = 0
+
+        def add_node(node: dict, depth: int) -> int:
+            index = len(split_feature)
+            split_feature.append(-1)
+            threshold.append(0.0)
+            left.append(-1)
+            right.append(-1)
+            default_left.append(False)
+            missing_type.append(MISSING_NONE)
+            value.append(0.0)
+            if "leaf_value" in node:
+                value[index] = node["leaf_value"]
+                self.max_depth = max(self.max_depth, depth)
+                return index
+            if node.get("decision_type", "<=") != "<=":
+                raise ValueError("Категориальные сплиты не поддерживаются")
+            split_feature[index] = node["split_feature"]
+            threshold[index] = float(node["threshold"])
+            default_left[index] = bool(node["default_left"])
+            missing_type[index] = _MISSING_TYPES[node.get("missing_type", "None")]
+            left[index] = add_node(node["left_child"], depth + 1)
+            right[index] = add_node(node["right_child"], depth + 1)
+            return index
+
+        for tree in dump["tree_info"]:
+            if tree.get("is_linear"):
+                raise ValueError("Линейные деревья не поддерживаются")
+            roots.append(add_node(tree["tree_structure"], 0))
+
+        self.roots = np.array(roots, dtype=np.int32)
+        self.split_feature = np.array(split_feature, dtype=np.int32)
+        self.threshold = np.array(threshold, dtype=np.float64)
+        self.left = np.array(left, dtype=np.int32)
+        self.right = np.array(right, dtype=np.int32)
+        self.default_left = np.array(default_left, dtype=np.bool_)
+        self.missing_type = np.array(missing_type, dtype=np.int8)
+        self.value = np.array(value, dtype=np.float64)
+
+    @property
+    def num_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.split_feature)
+
+    def predict_raw(self, X: np.ndarray) -> np.ndarray:
+        """Сырые оценки (сумма листьев) для матрицы признаков."""
+        X = np.ascontiguousarray(np.atleast_2d(X), dtype=np.float64)
+        if _evaluate_kernel_jit is not None:
+            return _evaluate_kernel_jit(X, self.roots, self.split_feature, self.threshold, self.left,
+                                        self.right, self.default_left, self.missing_type, self.value,
+                                        np.empty(X.shape[0]))
+        return self._predict_raw_numpy(X)
+
+    def _predict_raw_numpy(self, X: np.ndarray) -> np.ndarray:
+        """Векторизованный проход по всем деревьям сразу (без numba)."""
+        node = np.tile(self.roots, (X.shape[0], 1))
+        rows = np.arange(X.shape[0])[:, None]
+        for _ in range(self.max_depth):
+            feature = self.split_feature[node]
+            internal = feature >= 0
+            if not internal.any():
+                break
+            x = X[rows, np.maximum(feature, 0)]
+            missing = self.missing_type[node]
+            is_nan = np.isnan(x)
+            x = np.where((is_nan & (missing != MISSING_NAN)) | (np.abs(x) <= ZERO_THRESHOLD), 0.0,
+                         np.clip(x, -MAX_VALUE, MAX_VALUE))
+            use_default = (((missing == MISSING_ZERO) & (x == 0.0))
+                           | ((missing == MISSING_NAN) & is_nan))
+            go_left = np.where(use_default, self.default_left[node], x <= self.threshold[node])
+            node = np.where(internal, np.where(go_left, self.left[node], self.right[node]), node)
+        return self.value[node].sum(axis=1)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Вероятности классов [P(0), P(1)], как у LGBMClassifier.predict_proba."""
+        probability = 1.0 / (1.0 + np.exp(-self.sigmoid * self.predict_raw(X)))
+        return np.column_stack([1 - probability, probability])
+
+def get_booster(model):
+    """Достает lightgbm.Booster из загруженной модели (Booster или LGBMClassifier)."""
+    if hasattr(model, "dump_model"):
+        return model
+    booster = getattr(model, "booster_", None)
+    if booster is not None and hasattr(booster, "dump_model"):
+        return booster
+    return None
+
+def make_validation_rows(ensemble: CompiledTreeEnsemble, rows: int = 512, seed: int = 0) -> np.ndarray:
+    """Строки для проверки: значения вокруг порогов сплитов, нули и пропуски."""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(0, 1, (rows, ensemble.num_features))
+    internal = ensemble.split_feature >= 0
+    for feature in range(ensemble.num_features):
+        thresholds = ensemble.threshold[internal & (ensemble.split_feature == feature)]
+        if len(thresholds):
+            picked = rng.choice(thresholds, rows)
+            X[:, feature] = picked + rng.choice([-1e-6, 0.0, 1e-6], rows) * np.maximum(1.0, np.abs(picked))
+    X[rng.random(X.shape) < 0.05] = 0.0
+    X[rng.random(X.shape) < 0.05] = np.nan
+    return X
+
+def compile_booster(model, rows: int = 512, tolerance: float = 1e-9) -> CompiledTreeEnsemble:
+    """Компилирует бустер и проверяет совпадение с booster.predict. Бросает ValueError при расхождении."""
+    booster = get_booster(model)
+    if booster is None:
+        raise ValueError(f"Модель {type(model).__name__} не является LightGBM-бустером")
+    ensemble = CompiledTreeEnsemble(booster)
+    X = make_validation_rows(ensemble, rows)
+    expected = booster.predict(X)
+    actual = ensemble.predict_proba(X)[:, 1]
+    max_error = float(np.max(np.abs(expected - actual)))
+    if not max_error <= tolerance:
+        raise ValueError(f"Расхождение с booster.predict: {max_error:.3e}")
+    logger.info(f"Бустер скомпилирован: {ensemble.num_trees} деревьев, {ensemble.num_nodes} узлов, "
+                f"макс. расхождение {max_error:.1e}")
+    return ensemble
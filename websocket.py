@@ -1,96 +1,407 @@
 import asyncio
 import websockets
-import json
 import logging
-from collections import deque
-from globals import BINANCE_WS_BASE_URL, PAIRS, TIME_FRAMES, CANDLE_COUNT
-from database import save_historical_data, load_historical_data
+import time
+import pandas as pd
+import numpy as np
+from globals import (
+    BINANCE_WS_BASE_URL, PAIRS, TIME_FRAMES, TIMEFRAME_MS, CANDLE_COUNT, INDICATOR_WARMUP_CANDLES,
+    GAP_RESYNC_BATCH_WINDOW, WS_SHARD_COUNT, WS_MAX_STREAMS_PER_CONNECTION, WS_RECONNECT_DELAY,
+    WS_MAX_RECONNECT_DELAY, CANDLE_AGGREGATION, INTRA_CANDLE_EVALUATION, INDICATOR_MODE
+)
+from database import save_historical_rows, load_historical_data_bulk
+from streaming_indicators import get_indicator_engine, warm_up_indicator_engine_arrays
+from candle_buffer import CandleRingBuffer
+from scheduler import analysis_scheduler
+from backfill import kline_backfiller
+from kline_decoder import KlineRecord, kline_decoder, stream_key
+from candle_aggregator import BASE_TIMEFRAME, candle_aggregator
+from intra_candle import intra_candle_tracker
+from metrics import ws_messages_total, ws_closed_candles_total, stage_seconds
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Хранилище данных для каждой пары/таймфрейма
-live_data_queues = {}
+# Кольцевые буферы свечей для каждой пары/таймфрейма
+live_data_buffers = {}
 
-async def connect_binance_websocket():
+# Локальная сборка старших таймфреймов возможна, только если 1m есть в конфигурации
+aggregation_enabled = CANDLE_AGGREGATION and BASE_TIMEFRAME in TIME_FRAMES
+if CANDLE_AGGREGATION and not aggregation_enabled:
+    logger.error(f"CANDLE_AGGREGATION требует {BASE_TIMEFRAME} в TIME_FRAMES, используются биржевые свечи")
+
+# Предварительная оценка по тикам опирается на состояние потокового движка индикаторов
+intra_candle_enabled = INTRA_CANDLE_EVALUATION and INDICATOR_MODE == "streaming"
+
+class GapResync:
+    """Обнаружение пропусков свечей по шагу таймфрейма и их пакетная догрузка.
+
+    Ключ с пропуском удерживается в планировщике, а пришедшие живые свечи
+    откладываются, пока пропуск не догружен из REST API. Все пропуски,
+    найденные за окно GAP_RESYNC_BATCH_WINDOW, догружаются одним пакетом.
+    С enabled=False пропуски только учитываются, свечи применяются сразу
+    (источник без REST API, например воспроизведение записи).
+    """
+
+    def __init__(self, batch_window: float = GAP_RESYNC_BATCH_WINDOW, enabled: bool = True):
+        self.batch_window = batch_window
+        self.enabled = enabled
+        self._ranges = {}    # key -> (pair, timeframe, start_ms, end_ms), ждут догрузки
+        self._deferred = {}  # key -> живые свечи, пришедшие во время ресинхронизации
+        self._task = None
+        self.gaps_detected = 0
+        self.candles_missing = 0
+        self.candles_filled = 0
+        self.unresolved_gaps = 0
+        self.resyncs = 0
+        self.resync_seconds = 0.0
+        self.last_resync_seconds = 0.0
+        self.gaps_by_key = {}
+
+    def is_resyncing(self, key: str) -> bool:
+        return key in self._deferred
+
+    def defer(self, key: str, record: KlineRecord):
+        """Откладывает живую свечу ключа до окончания ресинхронизации."""
+        self._deferred[key].append(record)
+
+    def check(self, key: str, timestamp: int) -> bool:
+        """Проверяет, что свеча следует сразу за последней в буфере; иначе ставит пропуск в догрузку."""
+        buffer = live_data_buffers[key]
+        last = buffer.last_timestamp
+        pair, timeframe = key.split("_", 1)
+        interval = TIMEFRAME_MS[timeframe]
+        if last is None or timestamp <= last + interval:
+            return False
+        if not self.enabled:
+            self._count_gap(key, timeframe, last + interval, timestamp - 1)
+            return False
+        self.request(key, pair, timeframe, last + interval, timestamp - 1)
+        return True
+
+    def check_all(self, keys: list | None = None, now_ms: int | None = None):
+        """После переподключения ищет ключи, у которых за время простоя закрылись свечи."""
+        if not self.enabled:
+            return
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        for key in live_data_buffers if keys is None else keys:
+            buffer = live_data_buffers.get(key)
+            if buffer is None:
+                continue
+            last = buffer.last_timestamp
+            if last is None or key in self._deferred:
+                continue
+            pair, timeframe = key.split("_", 1)
+            interval = TIMEFRAME_MS[timeframe]
+            current_open = now_ms - now_ms % interval
+            if last + interval < current_open:
+                self.request(key, pair, timeframe, last + interval, current_open - 1)
+
+    def request(self, key: str, pair: str, timeframe: str, start_ms: int, end_ms: int):
+        """Ставит диапазон [start_ms, end_ms] ключа в пакетную догрузку."""
+        self._count_gap(key, timeframe, start_ms, end_ms)
+        self._deferred.setdefault(key, [])
+        self._ranges[key] = (pair, timeframe, start_ms, end_ms)
+        analysis_scheduler.hold(key)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def _count_gap(self, key: str, timeframe: str, start_ms: int, end_ms: int):
+        missing = (end_ms - start_ms) // TIMEFRAME_MS[timeframe] + 1
+        self.gaps_detected += 1
+        self.candles_missing += missing
+        self.gaps_by_key[key] = self.gaps_by_key.get(key, 0) + 1
+        logger.warning(f"Пропуск {missing} свечей для {key}" + (", догрузка" if self.enabled else ""))
+
+    async def _run(self):
+        while self._ranges:
+            # Собираем пропуски, найденные почти одновременно (например, после переподключения)
+            await asyncio.sleep(self.batch_window)
+            ranges, self._ranges = self._ranges, {}
+            start = time.perf_counter()
+            try:
+                loaded = await kline_backfiller.backfill(list(ranges.values()))
+            except Exception as e:
+                logger.error(f"Ошибка догрузки пропусков: {e}")
+                loaded = {}
+            for key in ranges:
+                # Ошибка одного ключа не должна оставить его (и остальные) удержанными навсегда
+                try:
+                    rows = loaded.get(key)
+                    if rows:
+                        values = np.array([row[2:] for row in rows], dtype=np.float64)
+                        self._apply(key, values[:, 0].astype(np.int64) * 1000, values[:, 1:])
+                        self.candles_filled += len(rows)
+                    else:
+                        self.unresolved_gaps += 1
+                        logger.error(f"Пропуск для {key} не догружен, индикаторы продолжат с разрывом")
+                    for record in self._deferred.pop(key, []):
+                        _apply_record(key, record)
+                except Exception as e:
+                    self.unresolved_gaps += 1
+                    logger.error(f"Ошибка применения догрузки для {key}: {e}")
+                finally:
+                    dropped = self._deferred.pop(key, None)
+                    if dropped:
+                        logger.error(f"Отброшено отложенных свечей {key}: {len(dropped)}")
+                    analysis_scheduler.release(key)
+            elapsed = time.perf_counter() - start
+            self.resyncs += 1
+            self.last_resync_seconds = elapsed
+            self.resync_seconds += elapsed
+            logger.info(f"Ресинхронизация {len(ranges)} ключей за {elapsed:.2f} с")
+
+    def _apply(self, key: str, timestamps: np.ndarray, ohlcv: np.ndarray):
+        buffer = live_data_buffers[key]
+        rows = list(zip(timestamps.tolist(), ohlcv.tolist()))
+        for timestamp, (o, h, l, c, v) in rows:
+            buffer.append(timestamp, o, h, l, c, v)
+        warm_up_indicator_engine_arrays(key, timestamps, ohlcv)
+        symbol, timeframe = key.split("_", 1)
+        if aggregation_enabled and timeframe == BASE_TIMEFRAME:
+            for timestamp, values in rows:
+                _aggregate(key, KlineRecord(symbol, timeframe, timestamp, *values))
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "gaps_detected": self.gaps_detected,
+            "candles_missing": self.candles_missing,
+            "candles_filled": self.candles_filled,
+            "unresolved_gaps": self.unresolved_gaps,
+            "resyncing_keys": len(self._deferred),
+            "resyncs": self.resyncs,
+            "resync_seconds_total": self.resync_seconds,
+            "last_resync_seconds": self.last_resync_seconds,
+            "gaps_by_key": dict(self.gaps_by_key)
+        }
+
+# Глобальный обработчик пропусков
+gap_resync = GapResync()
+
+def _apply_record(key: str, record: KlineRecord):
+    """Добавляет закрытую свечу в буфер и движок индикаторов."""
+    values = record[2:]  # timestamp, open, high, low, close, volume
+    live_data_buffers[key].append(*values)
+    start = time.perf_counter()
+    get_indicator_engine(key).update_values(*values)
+    stage_seconds.labels("indicator_update", record.symbol, record.interval).observe(time.perf_counter() - start)
+    if aggregation_enabled and record.interval == BASE_TIMEFRAME:
+        _aggregate(key, record)
+
+def _aggregate(key: str, record: KlineRecord):
+    """Передает минутную свечу агрегатору и публикует закрывшиеся свечи старших таймфреймов."""
+    if candle_aggregator.is_tracking(record.symbol):
+        closed = candle_aggregator.add(record)
+    else:
+        # Первая минута после старта: текущие корзины восстанавливаем из минутного буфера
+        view = live_data_buffers[key].view()
+        history = [KlineRecord(record.symbol, record.interval, timestamp, *values)
+                   for timestamp, *values in zip(view.timestamp.tolist(), view.open.tolist(),
+                                                 view.high.tolist(), view.low.tolist(),
+                                                 view.close.tolist(), view.volume.tolist())
+                   if timestamp < record.timestamp]
+        closed = candle_aggregator.seed(history + [record])
+    for candle in closed:
+        on_closed_candle(candle)
+
+def on_closed_candle(record: KlineRecord):
+    """Обрабатывает закрытую свечу: буфер, индикаторы, планировщик и запись в БД."""
+    key = f"{record.symbol}_{record.interval}"
+    if key not in live_data_buffers:
+        return
+    save_historical_rows([(record.symbol, record.interval, record.timestamp // 1000, *record[3:])])
+    if intra_candle_enabled:
+        intra_candle_tracker.on_closed(key, record.timestamp)
+    # Во время ресинхронизации и при новом пропуске свеча ждет догрузки истории
+    if gap_resync.is_resyncing(key) or gap_resync.check(key, record.timestamp):
+        gap_resync.defer(key, record)
+        return
+    _apply_record(key, record)
+    analysis_scheduler.mark_dirty(key)
+    logger.debug(f"Новая свеча {key}: {record.close}")
+
+class WebSocketShard:
+    """Одно соединение combined stream с частью потоков kline.
+
+    Шарды переподключаются независимо (экспоненциальная задержка), поэтому
+    обрыв одного соединения не останавливает остальные; все пишут в общие
+    буферы свечей.
+    """
+
+    RATE_WINDOW = 10.0  # Окно расчета скорости сообщений, секунд
+
+    def __init__(self, index: int, streams: list, base_url: str = BINANCE_WS_BASE_URL):
+        self.index = index
+        self.streams = streams
+        self.keys = [stream_key(stream) for stream in streams]
+        self.uri = f"{base_url}/stream?streams={'/'.join(streams)}"
+        self.connected = False
+        self.connects = 0
+        self.disconnects = 0
+        self.errors = 0
+        self.messages = 0
+        self.closed_candles = 0
+        self.last_message_at = None
+        self.message_rate = 0.0
+        self._rate_started = time.monotonic()
+        self._rate_count = 0
+        # Счетчики сообщений по имени потока: метки вычисляются один раз
+        self._message_counters = {}
+
+    async def run(self):
+        """Читает поток до отмены задачи, переподключаясь при обрывах."""
+        delay = WS_RECONNECT_DELAY
+        while True:
+            try:
+                async with websockets.connect(self.uri) as ws:
+                    self.connected = True
+                    self.connects += 1
+                    delay = WS_RECONNECT_DELAY
+                    logger.info(f"Шард {self.index}: соединение установлено ({len(self.streams)} потоков)")
+                    # Свечи, закрывшиеся пока соединения не было, догружаем сразу
+                    gap_resync.check_all(self.keys)
+
+                    while True:
+                        self._on_message(await ws.recv())
+
+            except websockets.exceptions.ConnectionClosed:
+                logger.warning(f"Шард {self.index}: соединение закрыто. Переподключение через {delay} сек...")
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Шард {self.index}: ошибка WebSocket: {e}. Переподключение через {delay} сек...")
+            finally:
+                if self.connected:
+                    self.disconnects += 1
+                self.connected = False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WS_MAX_RECONNECT_DELAY)
+
+    def _on_message(self, message):
+        self.messages += 1
+        self._rate_count += 1
+        now = time.monotonic()
+        self.last_message_at = now
+        if now - self._rate_started >= self.RATE_WINDOW:
+            self.message_rate = self._rate_count / (now - self._rate_started)
+            self._rate_started = now
+            self._rate_count = 0
+        stream = kline_decoder.stream_name(message) if isinstance(message, str) else None
+        counter = self._message_counters.get(stream)
+        if counter is None:
+            pair, _, timeframe = stream_key(stream).partition("_") if stream else ("unknown", "", "unknown")
+            counter = self._message_counters[stream] = ws_messages_total.labels(pair, timeframe)
+        counter.inc()
+        if intra_candle_enabled and kline_decoder.is_unclosed(message):
+            intra_candle_tracker.on_tick(message)
+            return
+        start = time.perf_counter()
+        record = kline_decoder.decode(message)
+        if record is not None:  # Только закрытые свечи
+            stage_seconds.labels("decode", record.symbol, record.interval).observe(time.perf_counter() - start)
+            ws_closed_candles_total.labels(record.symbol, record.interval).inc()
+            self.closed_candles += 1
+            on_closed_candle(record)
+
+    def get_stats(self) -> dict:
+        idle = time.monotonic() - self.last_message_at if self.last_message_at is not None else None
+        return {
+            "shard": self.index,
+            "streams": len(self.streams),
+            "connected": self.connected,
+            "connects": self.connects,
+            "reconnects": max(0, self.connects - 1),
+            "disconnects": self.disconnects,
+            "errors": self.errors,
+            "messages": self.messages,
+            "closed_candles": self.closed_candles,
+            "messages_per_sec": self.message_rate,
+            "seconds_since_message": idle
+        }
+
+def build_shards(pairs: list = PAIRS, timeframes: list = TIME_FRAMES, shard_count: int = WS_SHARD_COUNT,
+                 max_streams: int = WS_MAX_STREAMS_PER_CONNECTION,
+                 base_url: str = BINANCE_WS_BASE_URL) -> list:
+    """Делит потоки kline на соединения; все таймфреймы пары попадают в один шард."""
+    streams_by_pair = [[f"{pair.lower()}@kline_{tf}" for tf in timeframes] for pair in pairs]
+    if not pairs or not timeframes:
+        return []
+    # Пара не делится между шардами, поэтому лимит считаем в парах, а не в потоках
+    pairs_per_shard = max(1, max_streams // len(timeframes))
+    if len(timeframes) > max_streams:
+        logger.warning(f"Таймфреймов пары ({len(timeframes)}) больше лимита соединения ({max_streams})")
+    shard_count = max(shard_count, -(-len(pairs) // pairs_per_shard))
+    shard_count = min(shard_count, len(pairs))
+    shards = []
+    for index in range(shard_count):
+        groups = streams_by_pair[index * len(pairs) // shard_count:(index + 1) * len(pairs) // shard_count]
+        shards.append(WebSocketShard(index, [stream for group in groups for stream in group], base_url))
+    return shards
+
+# Активные шарды (для статистики)
+websocket_shards = []
+
+async def connect_binance_websocket(pairs: list = PAIRS, timeframes: list = TIME_FRAMES,
+                                    base_url: str = BINANCE_WS_BASE_URL):
     """Подключение к Binance WebSocket для получения данных в реальном времени."""
-    streams = []
-    for pair in PAIRS:
-        for tf in TIME_FRAMES:
-            stream_name = f"{pair.lower()}@kline_{tf}"
-            streams.append(stream_name)
+    for pair in pairs:
+        for tf in timeframes:
+            # Буферы заполняются из БД в initialize_websocket_data_queues
             key = f"{pair}_{tf}"
-            if key not in live_data_queues:
-                live_data_queues[key] = deque(maxlen=CANDLE_COUNT)
-                # Загружаем начальные данные из БД
-                initial_data = load_historical_data(pair, tf, CANDLE_COUNT)
-                for item in initial_data:
-                    live_data_queues[key].append(item)
-                if initial_data:
-                    logger.info(f"Загружено {len(initial_data)} свечей для {key}")
-
-    uri = f"{BINANCE_WS_BASE_URL}/stream?streams={'/'.join(streams)}"
-    logger.info(f"Подключение к Binance WebSocket: {len(streams)} потоков")
-
-    while True:
-        try:
-            async with websockets.connect(uri) as ws:
-                logger.info("WebSocket соединение установлено")
-                
-                while True:
-                    message = await ws.recv()
-                    data = json.loads(message)
-
-                    if 'data' in data and 'k' in data['data']:
-                        kline = data['data']['k']
-                        if kline['x']:  # Закрытая свеча
-                            symbol = kline['s']
-                            interval = kline['i']
-                            key = f"{symbol}_{interval}"
-
-                            candle_data = {
-                                "timestamp": kline['t'],
-                                "open": float(kline['o']),
-                                "high": float(kline['h']),
-                                "low": float(kline['l']),
-                                "close": float(kline['c']),
-                                "volume": float(kline['v'])
-                            }
-
-                            if key in live_data_queues:
-                                live_data_queues[key].append(candle_data)
-                                save_historical_data(symbol, interval, [candle_data])
-                                logger.debug(f"Новая свеча {key}: {candle_data['close']}")
-
-        except websockets.exceptions.ConnectionClosed:
-            logger.warning("WebSocket соединение закрыто. Переподключение через 5 сек...")
-            await asyncio.sleep(5)
-        except Exception as e:
-            logger.error(f"Ошибка WebSocket: {e}. Переподключение через 5 сек...")
-            await asyncio.sleep(5)
+            if key not in live_data_buffers:
+                live_data_buffers[key] = CandleRingBuffer(CANDLE_COUNT)
+
+    # В режиме агрегации подписываемся только на минутные свечи
+    shards = build_shards(pairs, [BASE_TIMEFRAME] if aggregation_enabled else timeframes, base_url=base_url)
+    websocket_shards[:] = shards
+    logger.info(f"Подключение к Binance WebSocket: {sum(len(s.streams) for s in shards)} потоков, "
+                f"{len(shards)} соединений")
+    tasks = [asyncio.create_task(shard.run()) for shard in shards]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def get_websocket_stats() -> dict:
+    """Сводная и пошардовая статистика соединений."""
+    shards = [shard.get_stats() for shard in websocket_shards]
+    return {
+        "shards": len(shards),
+        "connected_shards": sum(1 for shard in shards if shard["connected"]),
+        "messages": sum(shard["messages"] for shard in shards),
+        "messages_per_sec": sum(shard["messages_per_sec"] for shard in shards),
+        "per_shard": shards
+    }
 
 def get_latest_data(pair: str, timeframe: str):
     """Получает последние данные для анализа."""
-    key = f"{pair}_{timeframe}"
-    if key in live_data_queues and live_data_queues[key]:
-        import pandas as pd
-        df = pd.DataFrame(list(live_data_queues[key]))
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        df.set_index('timestamp', inplace=True)
-        for col in ['open', 'high', 'low', 'close', 'volume']:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        return df.sort_index()
+    buffer = live_data_buffers.get(f"{pair}_{timeframe}")
+    if buffer is not None and len(buffer):
+        return buffer.to_frame()
     return pd.DataFrame()
 
 async def initialize_websocket_data_queues():
-    """Инициализирует очереди данных при старте."""
-    for pair in PAIRS:
-        for tf in TIME_FRAMES:
-            key = f"{pair}_{tf}"
-            if key not in live_data_queues:
-                live_data_queues[key] = deque(maxlen=CANDLE_COUNT)
-            initial_data = load_historical_data(pair, tf, CANDLE_COUNT)
-            for item in initial_data:
-                live_data_queues[key].append(item)
-            if initial_data:
-                logger.info(f"Инициализировано {len(initial_data)} свечей для {key}")
+    """Инициализирует буферы и движки индикаторов одной пакетной загрузкой из БД."""
+    start = time.perf_counter()
+    pending = [key for key in (f"{pair}_{tf}" for pair in PAIRS for tf in TIME_FRAMES)
+               if not len(live_data_buffers.get(key, ()))]
+    if not pending:
+        return
+    
+    history = load_historical_data_bulk(PAIRS, TIME_FRAMES, max(CANDLE_COUNT, INDICATOR_WARMUP_CANDLES))
+    loaded_keys = loaded_candles = 0
+    for key in pending:
+        if key not in live_data_buffers:
+            live_data_buffers[key] = CandleRingBuffer(CANDLE_COUNT)
+        if key not in history:
+            continue
+        timestamps, ohlcv = history[key]
+        live_data_buffers[key].load(timestamps, ohlcv)
+        warm_up_indicator_engine_arrays(key, timestamps, ohlcv)
+        loaded_keys += 1
+        loaded_candles += len(timestamps)
+    
+    logger.info(f"Теплый старт: {loaded_candles} свечей для {loaded_keys}/{len(pending)} ключей "
+                f"за {time.perf_counter() - start:.3f} с")